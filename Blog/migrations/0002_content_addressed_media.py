@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:07
+
+import products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=products.storage.get_media_storage, upload_to='blog_images/'),
+        ),
+    ]
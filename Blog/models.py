@@ -2,13 +2,14 @@
 from django.db import models
 from django.conf import settings
 from users.models import User
+from products.storage import get_media_storage
 
 class BlogPost(models.Model):
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     content = models.TextField()
-    image = models.ImageField(upload_to="blog_images/", blank=True, null=True)
+    image = models.ImageField(upload_to="blog_images/", blank=True, null=True, storage=get_media_storage)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name="liked_posts", blank=True)
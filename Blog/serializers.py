@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import BlogPost, Comment
+from products.fieldsets import SparseFieldsetMixin
 
 class RecursiveCommentSerializer(serializers.ModelSerializer):
     replies = serializers.SerializerMethodField()
@@ -27,7 +28,10 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ["user", "created_at", "replies"]
 
 
-class BlogPostSerializer(serializers.ModelSerializer):
+class BlogPostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Supports ?fields= and ?expand= (see products.fieldsets)
+    """
     comments = RecursiveCommentSerializer(many=True, read_only=True)
     likes_count = serializers.IntegerField(source="likes.count", read_only=True)
 
@@ -38,3 +42,7 @@ class BlogPostSerializer(serializers.ModelSerializer):
             "created_at", "updated_at", "likes_count", "reads", "comments"
         ]
         read_only_fields = ["slug", "created_at", "updated_at", "likes_count", "reads"]
+        field_requirements = {
+            "likes_count": {"prefetch": ["likes"]},
+            "comments": {"prefetch": ["comments"]},
+        }
@@ -0,0 +1,28 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from products import storage
+from .models import BlogPost, Comment
+
+
+@receiver(pre_save, sender=BlogPost)
+def release_replaced_image(sender, instance, **kwargs):
+    storage.release_replaced_file(sender, instance, "image", kwargs.get("update_fields"))
+
+
+@receiver(post_delete, sender=BlogPost)
+def release_image(sender, instance, **kwargs):
+    storage.release_file(instance, "image")
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def touch_post_on_comment(sender, instance, **kwargs):
+    # comments are part of the post's representation, so its ETag must change
+    BlogPost.objects.filter(pk=instance.post_id).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=BlogPost.likes.through)
+def touch_post_on_like(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith("post_"):
+        post_ids = (pk_set or []) if reverse else [instance.pk]
+        BlogPost.objects.filter(pk__in=post_ids).update(updated_at=timezone.now())
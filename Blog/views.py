@@ -5,17 +5,43 @@ from .permissions import IsOwnerOrReadOnly
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
 from django.utils.text import slugify
+from django.views.decorators.http import condition
+from products.pagination import KeysetPagination
+from products.fieldsets import SparseFieldsetViewMixin
+from products import conditional
+
+
+def post_last_modified(request, slug=None, **kwargs):
+    return conditional.updated_at(request, BlogPost.objects, slug=slug)
+
+
+def post_etag(request, slug=None, **kwargs):
+    modified = post_last_modified(request, slug)
+    return conditional.make_etag("post", slug, modified.isoformat()) if modified else None
+
+
+def post_list_etag(request, *args, **kwargs):
+    # deletions change the count, everything else bumps a post's updated_at
+    posts = BlogPost.objects.aggregate(count=Count("id"), latest=Max("updated_at"))
+    return conditional.make_etag("posts", posts["count"], posts["latest"], request.get_full_path())
+
 
 # Create your views here.
-class BlogPostViewSet(viewsets.ModelViewSet):
+@method_decorator(condition(etag_func=post_list_etag), name="list")
+@method_decorator(condition(etag_func=post_etag, last_modified_func=post_last_modified), name="retrieve")
+class BlogPostViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     view for BlogPost
     """
     queryset = BlogPost.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = BlogPostSerializer
+    pagination_class = KeysetPagination
     lookup_field = "slug"
+    always_loaded_fields = ["created_at", "slug"]
 
     def perform_create(self, serializer):
         slug = slugify(serializer.validated_data["title"])
@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import DailySalesRollup, RollupWatermark
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ("id", "day", "product", "category", "orders", "units", "revenue", "discount")
+    list_filter = ("day",)
+    search_fields = ("product__name", "category__name")
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "processed_until", "updated_at")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from analytics.rollups import CHUNK_DAYS, backfill
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the daily sales rollups from order history, one transaction per chunk of days. "
+            "Without --start/--end every day since the first sale is rebuilt.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD), default today")
+        parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS,
+                            help="Number of days rebuilt per transaction")
+
+    def parse(self, value, option):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{option} must be a date (YYYY-MM-DD)")
+        return day
+
+    def handle(self, *args, **options):
+        start = self.parse(options["start"], "--start")
+        end = self.parse(options["end"], "--end")
+        if start and end and start > end:
+            raise CommandError("--start must not be after --end")
+
+        def progress(day, written):
+            self.stdout.write(f"Rebuilt up to {day} ({written} rows)")
+
+        written = backfill(start, end, chunk_days=options["chunk_days"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows"))
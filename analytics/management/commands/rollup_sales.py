@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from analytics.rollups import CHUNK_DAYS, roll_up
+
+
+class Command(BaseCommand):
+    help = "Update the daily sales rollups with the orders changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS,
+                            help="Number of days rebuilt per batch of queries")
+
+    def handle(self, *args, **options):
+        days = roll_up(chunk_days=options["chunk_days"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the sales rollups of {days} days"))
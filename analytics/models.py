@@ -0,0 +1,51 @@
+from django.db import models
+from products.models import Category, Product
+
+# Create your models here.
+
+class DailySalesRollup(models.Model):
+    """
+    Sales of one day, pre-aggregated from sold orders by analytics.rollups.
+
+    Rows exist at four levels, a null product or category meaning "all":
+    (day, product, category), (day, product, -), (day, -, category) and
+    (day, -, -). ``orders`` counts distinct orders at every level, so the
+    totals of a day or a category are exact without summing products.
+
+    Attributes:
+        revenue: Sum of price_at_purchase * quantity.
+        discount: What the units would have cost more at their product's
+            original price.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name="sales_rollups")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name="sales_rollups")
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "category", "day"], name="rollup_product_category_day"),
+            models.Index(fields=["category", "day"], name="rollup_category_day"),
+            models.Index(fields=["day"], name="rollup_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id} - {self.category_id} - {self.revenue}"
+
+
+class RollupWatermark(models.Model):
+    """
+    How far a rollup job has read: orders updated up to ``processed_until``
+    are included in its table.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.processed_until}"
@@ -0,0 +1,51 @@
+"""
+Sales reports read from DailySalesRollup (see analytics.rollups).
+
+Every report filters one rollup level, so it scans one row per day (or
+per product/category and day) of the range whatever the order volume.
+"""
+from django.db.models import Sum
+from .models import DailySalesRollup
+
+GROUPINGS = ("day", "product", "category")
+MEASURES = ("orders", "units", "revenue", "discount")
+
+
+def _sums():
+    return {measure: Sum(measure) for measure in MEASURES}
+
+
+def _level(start, end, product=None, category=None):
+    rows = DailySalesRollup.objects.filter(day__gte=start, day__lte=end)
+    rows = rows.filter(product=product) if product else rows.filter(product__isnull=True)
+    return rows.filter(category=category) if category else rows.filter(category__isnull=True)
+
+
+def _totals(rows):
+    totals = rows.aggregate(**_sums())
+    return {measure: totals[measure] or 0 for measure in MEASURES}
+
+
+def sales_report(start, end, group_by="day", product=None, category=None, limit=50):
+    """
+    Totals of sold orders between ``start`` and ``end`` (dates, inclusive)
+    and their breakdown by day, product or category, optionally restricted
+    to one product and/or category. Products and categories are listed by
+    revenue, best first, at most ``limit`` of them.
+    """
+    totals = _totals(_level(start, end, product, category))
+    if group_by == "day":
+        rows = _level(start, end, product, category).values("day").annotate(**_sums()).order_by("day")
+    elif group_by == "product":
+        rows = DailySalesRollup.objects.filter(day__gte=start, day__lte=end, product__isnull=False)
+        rows = rows.filter(product=product) if product else rows
+        rows = rows.filter(category=category) if category else rows.filter(category__isnull=True)
+        rows = (rows.values("product", "product__name").annotate(**_sums())
+                .order_by("-revenue", "product")[:limit])
+    else:
+        rows = DailySalesRollup.objects.filter(day__gte=start, day__lte=end, category__isnull=False)
+        rows = rows.filter(product=product) if product else rows.filter(product__isnull=True)
+        rows = rows.filter(category=category) if category else rows
+        rows = (rows.values("category", "category__name").annotate(**_sums())
+                .order_by("-revenue", "category")[:limit])
+    return {"totals": totals, "results": list(rows)}
@@ -0,0 +1,156 @@
+"""
+Daily sales rollups.
+
+DailySalesRollup holds, per day an order was paid on, the orders, units,
+revenue and discount of sold orders (see orders.models.SOLD_STATUSES) per
+product, per category, per product and category, and in total. Reports
+read those rows instead of scanning orders.
+
+A day is always rebuilt as a whole: its rows are deleted and recomputed
+from the order items paid that day with three grouped queries (per
+product, per category, per day). Rebuilding is idempotent, so a day can
+be rebuilt as often as needed.
+
+roll_up() rebuilds only the days touched by orders updated since its
+watermark. It stops ROLLUP_LAG_SECONDS short of now so rows saved by
+transactions still in flight are picked up by the next run. backfill()
+rebuilds full history in chunks of days, one transaction per chunk.
+
+Orders are assigned to a category by the product's current categories,
+and the discount compares with the product's current original price.
+Deleted orders only disappear from the rollups when their day is
+rebuilt (backfill_sales_rollups --start/--end).
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Min, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from orders.models import Order, OrderItem, SOLD_STATUSES
+from products.models import Product
+from .models import DailySalesRollup, RollupWatermark
+
+WATERMARK = "daily_sales"
+CHUNK_DAYS = 31
+BATCH_SIZE = 1000
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def get_lag():
+    return timedelta(seconds=getattr(settings, "ROLLUP_LAG_SECONDS", 120))
+
+
+def _sold_items(days):
+    return (OrderItem.objects
+            .filter(order__status__in=SOLD_STATUSES, order__paid_at__date__in=days)
+            .annotate(day=TruncDate("order__paid_at")))
+
+
+def _measures():
+    return {
+        "orders": Count("order", distinct=True),
+        "units": Sum("quantity"),
+        "revenue": Sum(F("price_at_purchase") * F("quantity"), output_field=MONEY),
+        "discount": Sum(Greatest(F("product__original_price") - F("price_at_purchase"), Value(Decimal(0)))
+                        * F("quantity"), output_field=MONEY),
+    }
+
+
+def _rollup(row, **keys):
+    return DailySalesRollup(day=row["day"], orders=row["orders"], units=row["units"],
+                            revenue=row["revenue"] or 0, discount=row["discount"] or 0, **keys)
+
+
+def rebuild_days(days):
+    """
+    Recompute the rollups of ``days`` (dates); returns the number of rows written
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    items = _sold_items(days)
+    by_product = list(items.values("day", "product_id").annotate(**_measures()))
+    by_category = list(items.filter(product__category__isnull=False)
+                       .values("day", "product__category").annotate(**_measures()))
+    by_day = list(items.values("day").annotate(**_measures()))
+
+    through = Product.category.through
+    categories = {}
+    for product_id, category_id in through.objects.filter(
+            product_id__in={row["product_id"] for row in by_product}).values_list("product_id", "category_id"):
+        categories.setdefault(product_id, []).append(category_id)
+
+    rows = [_rollup(row) for row in by_day]
+    rows += [_rollup(row, category_id=row["product__category"]) for row in by_category]
+    for row in by_product:
+        rows.append(_rollup(row, product_id=row["product_id"]))
+        rows += [_rollup(row, product_id=row["product_id"], category_id=category_id)
+                 for category_id in categories.get(row["product_id"], [])]
+
+    with transaction.atomic():
+        DailySalesRollup.objects.filter(day__in=days).delete()
+        DailySalesRollup.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def _chunks(days, size):
+    for start in range(0, len(days), size):
+        yield days[start:start + size]
+
+
+def _locked_watermark():
+    RollupWatermark.objects.get_or_create(name=WATERMARK)
+    # one rollup at a time, a concurrent run waits here
+    return RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+
+
+def roll_up(chunk_days=CHUNK_DAYS):
+    """
+    Rebuild the days of orders changed since the last run; returns the
+    number of days rebuilt
+    """
+    until = timezone.now() - get_lag()
+    with transaction.atomic():
+        watermark = _locked_watermark()
+        changed = Order.objects.filter(paid_at__isnull=False, updated_at__lte=until)
+        if watermark.processed_until is not None:
+            changed = changed.filter(updated_at__gt=watermark.processed_until)
+        days = sorted(changed.annotate(day=TruncDate("paid_at"))
+                      .values_list("day", flat=True).distinct())
+        for chunk in _chunks(days, chunk_days):
+            rebuild_days(chunk)
+        watermark.processed_until = until
+        watermark.save()
+    return len(days)
+
+
+def backfill(start=None, end=None, chunk_days=CHUNK_DAYS, progress=None):
+    """
+    Rebuild every day from ``start`` to ``end`` (dates, default the first
+    sale to today), ``chunk_days`` per transaction. A full backfill also
+    moves the watermark so roll_up() carries on from it.
+    """
+    started = timezone.now() - get_lag()
+    full = start is None and end is None
+    if start is None:
+        first = Order.objects.filter(status__in=SOLD_STATUSES).aggregate(first=Min("paid_at"))["first"]
+        start = timezone.localdate(first) if first else timezone.localdate()
+    end = end or timezone.localdate()
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+    written = 0
+    for chunk in _chunks(days, chunk_days):
+        written += rebuild_days(chunk)
+        if progress is not None:
+            progress(chunk[-1], written)
+
+    if full:
+        with transaction.atomic():
+            watermark = _locked_watermark()
+            if watermark.processed_until is None or watermark.processed_until < started:
+                watermark.processed_until = started
+                watermark.save()
+    return written
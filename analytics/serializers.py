@@ -0,0 +1,19 @@
+from rest_framework import serializers
+from .reports import GROUPINGS
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the sales report
+    """
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=GROUPINGS, default="day")
+    product = serializers.IntegerField(min_value=1, required=False)
+    category = serializers.IntegerField(min_value=1, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
+    def validate(self, attrs):
+        if attrs.get("start") and attrs.get("end") and attrs["start"] > attrs["end"]:
+            raise serializers.ValidationError("start must not be after end")
+        return attrs
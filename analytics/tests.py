@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from orders.checkout import place_order
+from orders.models import Order
+from products.models import Category, Product
+from users.models import User
+from . import rollups
+from .models import DailySalesRollup
+
+# Create your tests here.
+
+@override_settings(ROLLUP_LAG_SECONDS=0)
+class SalesRollupTests(TestCase):
+    """
+    Rollups match the orders they summarize and follow order changes
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", email="admin@example.com",
+                                             password="secret-pass-123", is_staff=True)
+        cls.shopper = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                               password="secret-pass-123")
+        cls.coats = Category.objects.create(name="Coats")
+        cls.sale = Category.objects.create(name="Sale")
+        cls.coat = Product.objects.create(name="Coat", manufacturer="Noir", original_price=200,
+                                          discount=50, stock=100)
+        cls.coat.category.add(cls.coats, cls.sale)
+        cls.hat = Product.objects.create(name="Hat", manufacturer="Noir", original_price=30, stock=100)
+        cls.hat.category.add(cls.coats)
+        cls.day = timezone.localdate() - timedelta(days=3)
+
+    def pay(self, quantities, day=None):
+        order = place_order(self.shopper, quantities)
+        order.status = "paid"
+        order.paid_at = timezone.make_aware(datetime.combine(day or self.day, datetime.min.time()))
+        order.save()
+        return order
+
+    def rollup(self, product=None, category=None):
+        return DailySalesRollup.objects.get(day=self.day, product=product, category=category)
+
+    def test_backfill_builds_every_level(self):
+        self.pay({self.coat.pk: 2, self.hat.pk: 1})
+        self.pay({self.hat.pk: 3})
+        place_order(self.shopper, {self.coat.pk: 5})  # unpaid, not a sale
+        rollups.backfill()
+
+        total = self.rollup()
+        self.assertEqual((total.orders, total.units, total.revenue), (2, 6, Decimal("320.00")))
+        self.assertEqual(total.discount, Decimal("200.00"))
+        coats = self.rollup(category=self.coats)
+        self.assertEqual((coats.orders, coats.units), (2, 6))
+        sale = self.rollup(category=self.sale)
+        self.assertEqual((sale.orders, sale.units, sale.revenue), (1, 2, Decimal("200.00")))
+        self.assertEqual(self.rollup(product=self.coat, category=self.sale).units, 2)
+
+    def test_roll_up_only_rebuilds_changed_orders(self):
+        order = self.pay({self.coat.pk: 1})
+        rollups.backfill()
+        self.assertEqual(rollups.roll_up(), 0)
+
+        order.status = "cancelled"
+        order.save()
+        self.assertEqual(rollups.roll_up(), 1)
+        self.assertFalse(DailySalesRollup.objects.filter(day=self.day).exists())
+
+    def test_report_reads_the_rollups(self):
+        self.pay({self.coat.pk: 2, self.hat.pk: 1})
+        self.pay({self.hat.pk: 1}, day=self.day - timedelta(days=1))
+        rollups.backfill()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        # aggregate of totals, rows of the level
+        with self.assertNumQueries(2):
+            by_day = client.get(reverse("analytics-sales"), {"start": self.day - timedelta(days=7)})
+        by_product = client.get(reverse("analytics-sales"), {"group_by": "product", "category": self.coats.pk})
+
+        self.assertEqual(by_day.data["totals"]["orders"], 2)
+        self.assertEqual([row["units"] for row in by_day.data["results"]], [1, 3])
+        self.assertEqual([row["product"] for row in by_product.data["results"]], [self.coat.pk, self.hat.pk])
+        self.assertEqual(by_product.data["totals"]["units"], 4)
+
+    def test_report_is_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(self.shopper)
+        self.assertEqual(client.get(reverse("analytics-sales")).status_code, 403)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework import permissions, views
+from rest_framework.response import Response
+from .reports import sales_report
+from .serializers import SalesQuerySerializer
+
+# Create your views here.
+class SalesReportView(views.APIView):
+    """
+    Sales totals from the daily rollups, admin only.
+    GET /api/analytics/sales/?start=2025-01-01&end=2025-01-31 (default: the last 30 days)
+    ?group_by=day|product|category, ?product=<id> and ?category=<id> narrow it down
+    Rollups are refreshed by the rollup_sales command, so the latest
+    minutes of sales may be missing.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        end = params.get("end") or timezone.localdate()
+        start = params.get("start") or end - timedelta(days=29)
+        report = sales_report(start, end, params["group_by"], params.get("product"),
+                              params.get("category"), params["limit"])
+        return Response({"start": start, "end": end, "group_by": params["group_by"], **report})
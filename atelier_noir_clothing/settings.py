@@ -92,7 +92,8 @@ INSTALLED_APPS = [
     'products',
     'users',
     'Blog',
-    'Contact'
+    'Contact',
+    'analytics',
 ]
 
 AUTH_USER_MODEL = 'users.User'
@@ -155,9 +156,84 @@ CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "cache_table",
-    }
+    },
+    # Versioned catalog cache (products/cache.py). Its version keys must be
+    # shared by every worker and management command, so it defaults to a
+    # database table (created by createcachetable); point CATALOG_CACHE_URL at
+    # redis://host:6379/1 in production. Versions are remembered in-process for
+    # CATALOG_CACHE_VERSION_TTL seconds and hot values are kept in a local LRU,
+    # so most requests never reach the table. locmemcache:// is only correct
+    # for a single process, e.g. runserver.
+    "catalog": env.cache_url("CATALOG_CACHE_URL",
+                             default="dbcache://catalog_cache?max_entries=100000&cull_frequency=10"),
+    # Responses stored for Idempotency-Key replays (orders/idempotency.py). It
+    # must be shared by every worker and must not lose entries before
+    # IDEMPOTENCY_KEY_TTL, so it gets its own table, sized far above a day of
+    # orders (expired rows are culled first); use redis://host:6379/2 in production.
+    "idempotency": env.cache_url(
+        "IDEMPOTENCY_CACHE_URL",
+        default="dbcache://idempotency_cache?max_entries=1000000&cull_frequency=10"),
+    # Product view counters (products/trending.py). They need atomic incr/decr,
+    # which the database and file caches don't have. Local memory keeps the
+    # counts per process, each flushing its own; use redis://host:6379/3 in
+    # production so flush_trending_views sees every worker's views.
+    "trending": env.cache_url("TRENDING_CACHE_URL", default="locmemcache://trending"),
 }
 
+CATALOG_CACHE_ALIAS = "catalog"
+IDEMPOTENCY_CACHE_ALIAS = "idempotency"
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=60 * 60 * 24)
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", default=60 * 60 * 24 * 7)
+# per-process LRU kept in front of the catalog alias
+CATALOG_CACHE_LOCAL_MAX_ENTRIES = env.int("CATALOG_CACHE_LOCAL_MAX_ENTRIES", default=512)
+CATALOG_CACHE_LOCAL_TIMEOUT = env.int("CATALOG_CACHE_LOCAL_TIMEOUT", default=5)
+# how long a process trusts the catalog generation and product versions it read
+CATALOG_CACHE_VERSION_TTL = env.int("CATALOG_CACHE_VERSION_TTL", default=2)
+# how long one worker may hold the regeneration lock for a key
+CATALOG_CACHE_LOCK_TIMEOUT = 10
+# higher values refresh hot keys earlier before they expire
+CATALOG_CACHE_EARLY_REFRESH_BETA = 1.0
+
+# build_related_products skips the rebuild while the table is younger than this
+RELATED_PRODUCTS_REFRESH_SECONDS = env.int("RELATED_PRODUCTS_REFRESH_SECONDS", default=6 * 60 * 60)
+RELATED_PRODUCTS_PER_PRODUCT = 8
+
+# search suggestions (products/suggest.py) check the shared index version at
+# most this often; other processes' writes show up this late
+SUGGEST_VERSION_CHECK_SECONDS = env.int("SUGGEST_VERSION_CHECK_SECONDS", default=5)
+
+# trending scores (products/trending.py) halve after this many hours without activity
+TRENDING_HALF_LIFE_HOURS = env.int("TRENDING_HALF_LIFE_HOURS", default=72)
+# product views are counted in this cache and added to the scores by a
+# background thread once this many products have pending views or this many
+# seconds have passed, or by the flush_trending_views command
+TRENDING_CACHE_ALIAS = "trending"
+TRENDING_VIEW_FLUSH_THRESHOLD = env.int("TRENDING_VIEW_FLUSH_THRESHOLD", default=100)
+TRENDING_VIEW_FLUSH_SECONDS = env.int("TRENDING_VIEW_FLUSH_SECONDS", default=60)
+
+# product feeds (products/feeds.py); links and image urls are made absolute
+# with PRODUCT_FEED_SITE_URL, or the request's host when it is empty
+PRODUCT_FEED_SITE_URL = env("PRODUCT_FEED_SITE_URL", default="")
+PRODUCT_FEED_PRODUCT_URL = env("PRODUCT_FEED_PRODUCT_URL", default="/api/products/{id}/")
+PRODUCT_FEED_CURRENCY = "NGN"
+
+# threads encoding slow image variants (AVIF) after an upload, 0 encodes in the request
+PRODUCT_IMAGE_WORKERS = env.int("PRODUCT_IMAGE_WORKERS", default=2)
+
+# product imports (products/imports.py): uploads larger than
+# IMPORT_INLINE_MAX_BYTES are imported by IMPORT_WORKERS threads (0 imports
+# in the request), running jobs idle for IMPORT_STALE_SECONDS can be resumed
+IMPORT_WORKERS = env.int("IMPORT_WORKERS", default=1)
+IMPORT_INLINE_MAX_BYTES = env.int("IMPORT_INLINE_MAX_BYTES", default=5 * 1024 * 1024)
+IMPORT_STALE_SECONDS = 10 * 60
+
+# how long checkout holds stock for an unpaid order (orders/inventory.py)
+STOCK_RESERVATION_MINUTES = env.int("STOCK_RESERVATION_MINUTES", default=15)
+
+# rollup_sales leaves out orders saved in the last ROLLUP_LAG_SECONDS, so
+# transactions still running when it reads are picked up by the next run
+ROLLUP_LAG_SECONDS = env.int("ROLLUP_LAG_SECONDS", default=120)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
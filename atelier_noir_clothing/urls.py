@@ -52,6 +52,7 @@ urlpatterns = [
     path('api/payments/', include("payments.urls")),
     path('api/contact/', include("Contact.urls")),
     path('api/blog/', include("Blog.urls")),
+    path('api/analytics/', include("analytics.urls")),
 ]
 
 if settings.DEBUG:
@@ -1,5 +1,6 @@
 from rest_framework.serializers import ModelSerializer
 from .models import Cart, CartItem
+from products.fieldsets import SparseFieldsetMixin
 
 class CartItemSerializer(ModelSerializer):
     """Serialize indiviual items in Cart"""
@@ -14,8 +15,8 @@ class CartItemSerializer(ModelSerializer):
             return super().create(validated_data)
 
 
-class CartSerializer(ModelSerializer):
-    """Serialize Cart"""
+class CartSerializer(SparseFieldsetMixin, ModelSerializer):
+    """Serialize Cart, supports ?fields= and ?expand= (see products.fieldsets)"""
     items = CartItemSerializer(many=True, read_only=True)
 
     class Meta:
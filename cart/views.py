@@ -2,9 +2,10 @@ from django.shortcuts import render
 from .serializer import CartSerializer, CartItemSerializer
 from .models import Cart, CartItem
 from rest_framework import viewsets, permissions
+from products.fieldsets import SparseFieldsetViewMixin
 
 # Create your views here.
-class CartViewset(viewsets.ModelViewSet):
+class CartViewset(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """Manage cart"""
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
@@ -1,13 +1,20 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, StockReservation
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "placed_by", "total_amount", "status", "created_at", "updated_at", "shipping_address")
+    list_display = ("id", "placed_by", "total_amount", "status", "oversold", "created_at", "updated_at",
+                    "shipping_address")
     search_fields = ("place_by__username", "id")
-    list_filter = ("status", "created_at")
+    list_filter = ("status", "oversold", "created_at")
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ("id", "order", "product", "quantity", "price_at_purchase")
     search_fields = ("order__id", "product__name")
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "product", "quantity", "status", "expires_at")
+    search_fields = ("order__id", "product__name")
+    list_filter = ("status",)
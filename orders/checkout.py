@@ -0,0 +1,81 @@
+"""
+Turning a cart (or a list of product quantities) into an order.
+
+Everything happens in one transaction with a fixed number of queries
+whatever the number of lines:
+
+* the products are locked with SELECT ... FOR UPDATE, in primary key
+  order so concurrent checkouts can't deadlock on each other;
+* each line's price is snapshotted from the locked row's effective_price
+  and the total is summed in the same pass;
+* the order is inserted with its total and the items with one bulk_create;
+* the units are taken out of stock and held for the order with one
+  guarded UPDATE (see orders.inventory);
+* the cart is emptied with one DELETE.
+
+bulk_create doesn't send post_save, so Order.recalculate_total and the
+per-item sales refresh don't run; neither is needed, the total is already
+right and a pending order hasn't sold anything yet.
+"""
+from django.db import transaction
+from cart.models import CartItem
+from products.models import Product
+from .models import Order, OrderItem
+from . import inventory
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def place_order(user, quantities, shipping_address=None):
+    """
+    Create an order for ``user`` from a product id -> quantity mapping
+    """
+    if not quantities:
+        raise CheckoutError("No items to order.")
+    if any(quantity < 1 for quantity in quantities.values()):
+        raise CheckoutError("Quantities must be at least 1.")
+
+    with transaction.atomic():
+        products = (Product.objects.select_for_update()
+                    .filter(pk__in=quantities).order_by("pk")
+                    .only("id", "name", "stock", "effective_price"))
+        products = {product.pk: product for product in products}
+        missing = sorted(set(quantities) - set(products))
+        if missing:
+            raise CheckoutError(f"Products no longer available: {missing}")
+
+        lines, total = [], 0
+        for product_id, quantity in sorted(quantities.items()):
+            product = products[product_id]
+            if product.stock < quantity:
+                raise CheckoutError(f"Only {product.stock} of {product.name} left in stock.")
+            lines.append(OrderItem(product=product, quantity=quantity,
+                                   price_at_purchase=product.effective_price))
+            total += product.effective_price * quantity
+
+        order = Order.objects.create(placed_by=user, shipping_address=shipping_address,
+                                     total_amount=total)
+        for line in lines:
+            line.order = order
+        OrderItem.objects.bulk_create(lines)
+        try:
+            inventory.reserve(order, quantities)
+        except inventory.InsufficientStock as error:
+            raise CheckoutError(str(error))
+    return order
+
+
+def checkout_cart(user, shipping_address=None):
+    """
+    Order everything in ``user``'s cart and empty it
+    """
+    with transaction.atomic():
+        items = CartItem.objects.filter(cart__user=user)
+        quantities = dict(items.values_list("product_id", "quantity"))
+        if not quantities:
+            raise CheckoutError("Your cart is empty.")
+        order = place_order(user, quantities, shipping_address)
+        items.delete()
+    return order
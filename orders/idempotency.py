@@ -0,0 +1,112 @@
+"""
+Idempotency-Key support for POST endpoints that must not run twice.
+
+    POST /api/orders/checkout/
+    Idempotency-Key: 9b2f6c1e-...
+
+The first request with a key claims it (cache.add, so only one of several
+concurrent retries wins) and its response is stored under the key with a
+fingerprint of the request body. Repeating the request with the same key
+returns the stored response, marked with an "Idempotent-Replayed: true"
+header, without running the view again: no new order, no second gateway
+call. Keys are per user and per endpoint.
+
+* A retry while the first request is still running gets 409.
+* Reusing a key with a different body gets 422.
+* Server errors and exceptions aren't stored, the key is freed so the
+  client can retry.
+
+Requests without the header are handled as before. Entries live in the
+IDEMPOTENCY_CACHE_ALIAS cache for IDEMPOTENCY_KEY_TTL seconds.
+"""
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# how long a request may hold its key before a retry can take over
+PROCESSING_TIMEOUT = 60
+
+
+def get_cache():
+    return caches[getattr(settings, "IDEMPOTENCY_CACHE_ALIAS", "default")]
+
+
+def get_ttl():
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", 60 * 60 * 24)
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def cache_key(scope, request, key):
+    user = request.user.pk if request.user.is_authenticated else "anonymous"
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{scope}:{user}:{digest}"
+
+
+def _find_request(args):
+    # the request follows ``self`` on view methods and comes first on function views
+    return next(arg for arg in args if isinstance(arg, Request))
+
+
+def idempotent(scope):
+    """
+    Decorate a DRF view (function or viewset method) so that requests
+    carrying an Idempotency-Key run at most once
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = _find_request(args)
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            cache = get_cache()
+            name = cache_key(scope, request, key)
+            request_fingerprint = fingerprint(request)
+            if not cache.add(name, {"fingerprint": request_fingerprint}, PROCESSING_TIMEOUT):
+                return replay(cache.get(name), request_fingerprint)
+
+            stored = False
+            try:
+                response = view(*args, **kwargs)
+                if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS \
+                        or not hasattr(response, "data"):
+                    return response
+                cache.set(name, {"fingerprint": request_fingerprint, "status": response.status_code,
+                                 "data": response.data}, get_ttl())
+                stored = True
+                return response
+            finally:
+                if not stored:
+                    # free the key so the client can retry
+                    cache.delete(name)
+        return wrapper
+    return decorator
+
+
+def replay(entry, request_fingerprint):
+    if entry is None:
+        # the first request failed or expired between add() and get()
+        return Response({"error": "Please retry the request"}, status=status.HTTP_409_CONFLICT)
+    if entry["fingerprint"] != request_fingerprint:
+        return Response({"error": f"This {HEADER} was already used for a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if "status" not in entry:
+        return Response({"error": f"A request with this {HEADER} is still being processed"},
+                        status=status.HTTP_409_CONFLICT)
+    return Response(entry["data"], status=entry["status"], headers={REPLAYED_HEADER: "true"})
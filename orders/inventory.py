@@ -0,0 +1,160 @@
+"""
+Stock reservations.
+
+Checkout takes the ordered units out of Product.stock straight away and
+records them as held StockReservations that expire after
+STOCK_RESERVATION_MINUTES:
+
+* paying the order commits them, the units stay sold;
+* cancelling the order or a failed payment releases them;
+* the release_expired_reservations command (see sweep_expired) releases
+  holds nobody paid for in time.
+
+Stock only ever moves through one guarded UPDATE per call, whatever the
+number of products:
+
+    UPDATE product SET stock = stock - CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+    WHERE id IN (1, 7) AND stock >= CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+
+The database re-checks the WHERE clause on the row it locks, so
+concurrent checkouts of the same product can't oversell it: if fewer
+rows than products were updated one of them ran out and the caller's
+transaction is rolled back. Releasing runs the same statement the other
+way, against reservations whose status is switched in the same
+transaction so stock is never put back twice.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from products.models import Product
+from .models import StockReservation
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, "STOCK_RESERVATION_MINUTES", 15))
+
+
+def _per_product(quantities):
+    return Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+                output_field=IntegerField())
+
+
+def _adjust_stock(quantities, sign):
+    """
+    Add (sign=1) or remove (sign=-1) units of several products in one UPDATE;
+    returns the number of products changed
+    """
+    if not quantities:
+        return 0
+    products = Product.objects.filter(pk__in=quantities)
+    if sign < 0:
+        products = products.filter(stock__gte=_per_product(quantities))
+    delta = _per_product(quantities)
+    stock = F("stock") - delta if sign < 0 else F("stock") + delta
+    changed = products.update(stock=stock)
+    # stock isn't part of any cached representation, so hot products keep
+    # their cache entries and ETags; only products that sold out or came
+    # back are touched, for the availability of incremental feeds
+    flipped = Product.objects.filter(pk__in=quantities)
+    flipped = flipped.filter(stock=0) if sign < 0 else flipped.filter(stock=delta)
+    flipped.touch()
+    return changed
+
+
+def take_stock(quantities):
+    """
+    Remove the given product id -> quantity units from stock, all or nothing
+    """
+    with transaction.atomic():
+        if _adjust_stock(quantities, -1) != len(quantities):
+            # rolls back the products that did have enough
+            raise InsufficientStock("Some products are out of stock.")
+
+
+def reserve(order, quantities, duration=None):
+    """
+    Take the units of ``order`` out of stock and hold them for it
+    """
+    expires_at = timezone.now() + (duration or hold_duration())
+    with transaction.atomic():
+        take_stock(quantities)
+        return StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=pk, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in quantities.items()
+        ])
+
+
+def _release(reservations):
+    """
+    Put the held ``reservations`` (a queryset) back into stock; returns how many were released
+    """
+    with transaction.atomic():
+        held = list(reservations.filter(status="held").select_for_update()
+                    .values_list("pk", "product_id", "quantity"))
+        if not held:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in held]).update(status="released")
+        quantities = {}
+        for _, product_id, quantity in held:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        _adjust_stock(quantities, 1)
+    return len(held)
+
+
+def release(order):
+    """
+    Put everything held for ``order`` back into stock
+    """
+    return _release(StockReservation.objects.filter(order=order))
+
+
+def commit(order):
+    """
+    Keep the units of a paid ``order`` sold.
+
+    Holds that expired before the payment came through are taken out of
+    stock again when possible; returns the ids of the products that had
+    run out in the meantime.
+    """
+    with transaction.atomic():
+        StockReservation.objects.filter(order=order, status="held").update(status="committed")
+        committed = set(StockReservation.objects.filter(order=order, status="committed")
+                        .values_list("product_id", flat=True))
+        short = []
+        for pk, quantity in order.items.values_list("product_id", "quantity"):
+            if pk in committed:
+                continue
+            try:
+                take_stock({pk: quantity})
+            except InsufficientStock:
+                short.append(pk)
+                continue
+            StockReservation.objects.create(order=order, product_id=pk, quantity=quantity,
+                                            status="committed", expires_at=timezone.now())
+    return short
+
+
+def sweep_expired(batch_size=500, now=None):
+    """
+    Release expired holds, ``batch_size`` at a time, each batch in its own
+    transaction; returns the number released
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several sweepers (and checkouts releasing the
+            # same orders) run side by side
+            batch = list(StockReservation.objects.filter(status="held", expires_at__lte=now)
+                         .select_for_update(skip_locked=True)
+                         .order_by("expires_at").values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                return released
+            released += _release(StockReservation.objects.filter(pk__in=batch))
+
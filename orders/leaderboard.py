@@ -0,0 +1,95 @@
+"""
+Best-seller boards.
+
+* all-time boards read Product.total_sold, an indexed column that only
+  counts sold orders;
+* 7 and 30 day boards sum the ProductDailySales buckets of the window.
+
+Buckets are moved when an order enters or leaves a sold status, or an
+item of a sold order is added, changed or removed, never on read. Board
+results are cached in the catalog cache under a version that every sales
+change (buckets or total_sold) bumps, so a read is usually a single cache
+hit.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+from products import cache as catalog_cache
+from products.models import Product
+from .models import ProductDailySales
+
+WINDOWS = {"all": None, "7d": 7, "30d": 30}
+VERSION_KEY = "catalog:bestsellers:version"
+
+
+def record_order(order, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) an order's items from the daily
+    buckets of the day it was paid. Costs two queries whatever the order size.
+    """
+    quantities = {}
+    for product_id, quantity in order.items.values_list("product_id", "quantity"):
+        quantities[product_id] = quantities.get(product_id, 0) + sign * quantity
+    record_units(order, quantities)
+
+
+def record_units(order, quantities):
+    """
+    Add the product id -> units mapping (negative to remove) to the bucket
+    of the day ``order`` was paid
+    """
+    quantities = {pk: units for pk, units in quantities.items() if units}
+    if not quantities:
+        return
+    day = timezone.localdate(order.paid_at or timezone.now())
+    ProductDailySales.objects.bulk_create(
+        [ProductDailySales(product_id=pk, day=day) for pk in quantities],
+        ignore_conflicts=True,
+    )
+    ProductDailySales.objects.filter(day=day, product_id__in=quantities).update(
+        units=F("units") + Case(
+            *[When(product_id=pk, then=Value(units)) for pk, units in quantities.items()],
+            output_field=IntegerField(),
+        )
+    )
+    transaction.on_commit(bump_version)
+
+
+def bump_version():
+    cache = catalog_cache.get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _version():
+    return catalog_cache.get_cache().get(VERSION_KEY, 0)
+
+
+def _top_product_ids(window, category, limit):
+    days = WINDOWS[window]
+    if days is None:
+        products = Product.objects.all()
+        if category:
+            products = products.filter(category__id=category)
+        return list(products.order_by("-total_sold", "id").values_list("id", flat=True)[:limit])
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    buckets = ProductDailySales.objects.filter(day__gte=since)
+    if category:
+        buckets = buckets.filter(product__category__id=category)
+    board = (buckets.values("product").annotate(units=Sum("units"))
+             .filter(units__gt=0).order_by("-units", "product")[:limit])
+    return [row["product"] for row in board]
+
+
+def top_product_ids(window="all", category=None, limit=10):
+    """
+    Product ids of the best sellers for ``window`` ('all', '7d' or '30d'),
+    optionally restricted to one category, best first
+    """
+    # the date is part of the key because windowed boards slide every day
+    key = f"catalog:bestsellers:v{_version()}:{timezone.localdate()}:{window}:{category}:{limit}"
+    return catalog_cache.get_or_set(key, lambda: _top_product_ids(window, category, limit))
@@ -0,0 +1,85 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from orders import inventory
+from orders.models import Order, StockReservation
+from products.models import Product
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Reserve one product from many threads at once and check it is never oversold. "
+            "Creates a throwaway product, user and orders and deletes them afterwards; "
+            "meaningful numbers need PostgreSQL, SQLite serializes every write.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stock", type=int, default=100, help="Units of the product in stock")
+        parser.add_argument("--workers", type=int, default=50, help="Concurrent checkouts")
+        parser.add_argument("--attempts", type=int, default=10,
+                            help="Reservations each worker tries to make")
+        parser.add_argument("--quantity", type=int, default=1, help="Units per reservation")
+
+    def handle(self, *args, **options):
+        stock, workers = options["stock"], options["workers"]
+        attempts, quantity = options["attempts"], options["quantity"]
+        user = User.objects.create_user(username=f"stock-benchmark-{time.time_ns()}",
+                                        email=f"stock-benchmark-{time.time_ns()}@example.com")
+        product = Product.objects.create(name="Stock benchmark", manufacturer="benchmark",
+                                         original_price=1, stock=stock)
+        orders = Order.objects.bulk_create([Order(placed_by=user) for _ in range(workers)])
+        results = {"reserved": 0, "sold_out": 0, "retries": 0}
+        lock = threading.Lock()
+        start = threading.Barrier(workers)
+
+        def work(order):
+            counts = {"reserved": 0, "sold_out": 0, "retries": 0}
+            try:
+                start.wait()
+                for _ in range(attempts):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                inventory.reserve(order, {product.pk: quantity})
+                            counts["reserved"] += 1
+                        except inventory.InsufficientStock:
+                            counts["sold_out"] += 1
+                        except OperationalError:
+                            # SQLite: "database is locked"
+                            counts["retries"] += 1
+                            time.sleep(0.001)
+                            continue
+                        break
+            finally:
+                connections.close_all()
+                with lock:
+                    for key, value in counts.items():
+                        results[key] += value
+
+        threads = [threading.Thread(target=work, args=(order,)) for order in orders]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        product.refresh_from_db()
+        held = sum(StockReservation.objects.filter(product=product).values_list("quantity", flat=True))
+        total = workers * attempts
+        expected = min(total, stock // quantity)
+        try:
+            self.stdout.write(
+                f"{total} reservations from {workers} workers in {elapsed:.2f}s "
+                f"({total / elapsed:.0f}/s): {results['reserved']} reserved, "
+                f"{results['sold_out']} sold out, {results['retries']} retried"
+            )
+            if results["reserved"] != expected or product.stock != stock - held \
+                    or held != results["reserved"] * quantity:
+                raise CommandError(f"Stock is inconsistent: {results['reserved']} reserved "
+                                   f"(expected {expected}), {held} held, {product.stock} left")
+            self.stdout.write(self.style.SUCCESS(f"No overselling, {product.stock} units left"))
+        finally:
+            Order.objects.filter(pk__in=[order.pk for order in orders]).delete()
+            product.delete()
+            user.delete()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from orders.inventory import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Put the stock held for unpaid orders back once their reservation has expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Number of reservations released per transaction")
+
+    def handle(self, *args, **options):
+        released = sweep_expired(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+SOLD_STATUSES = ('paid', 'shipped', 'delivered')
+
+
+def backfill_sales(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ProductDailySales = apps.get_model('orders', 'ProductDailySales')
+    Product = apps.get_model('products', 'Product')
+
+    # best guess for orders paid before paid_at existed
+    Order.objects.filter(status__in=SOLD_STATUSES, paid_at__isnull=True).update(paid_at=F('updated_at'))
+
+    units = {}
+    sold_items = OrderItem.objects.filter(order__status__in=SOLD_STATUSES)
+    for product_id, paid_at, quantity in sold_items.values_list('product_id', 'order__paid_at', 'quantity').iterator():
+        key = (product_id, paid_at.date())
+        units[key] = units.get(key, 0) + quantity
+    ProductDailySales.objects.bulk_create(
+        [ProductDailySales(product_id=product_id, day=day, units=total) for (product_id, day), total in units.items()],
+        batch_size=1000,
+    )
+
+    # total_sold used to count every order line, only sold orders count now
+    sales = (OrderItem.objects.filter(product=OuterRef('pk'), order__status__in=SOLD_STATUSES)
+             .order_by().values('product'))
+    Product.objects.update(total_sold=Coalesce(Subquery(sales.annotate(total=Sum('quantity')).values('total')),
+                                               Value(0), output_field=IntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_total_amount'),
+        ('products', '0009_alsoboughtproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('units', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='unique_product_per_sales_day')],
+            },
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_stockreservation'),
+        ('users', '0002_rename_street_address_address_line1_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['placed_by', '-created_at', '-id'], name='order_history'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_recent'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='oversold',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.db.models import Sum, F, DecimalField
+from django.utils import timezone
 from users.models import User, Address
 from products.models import Product
 
@@ -13,6 +14,9 @@ ORDER_STATUS_CHOICES = (
         ("cancelled", "Cancelled")
     )
 
+# statuses in which an order's items count as sold
+SOLD_STATUSES = ("paid", "shipped", "delivered")
+
 class Order(models.Model):
     """
     Represents a customer order.
@@ -21,6 +25,8 @@ class Order(models.Model):
         user: The customer who placed the order.
         total_price: Final total price of the order.
         status: Order status (pending, paid, shipped, delivered).
+        paid_at: When the order first moved into a sold status.
+        oversold: Paid after some of its stock ran out, needs restocking or a refund.
     """
     placed_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -28,9 +34,34 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default="pending")
     shipping_address = models.ForeignKey(Address, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders")
     total_amount = models.DecimalField(max_digits=9, decimal_places=2, default=0.00)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    oversold = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            # a customer's order history, newest first
+            models.Index(fields=["placed_by", "-created_at", "-id"], name="order_history"),
+            # the staff listing of every order
+            models.Index(fields=["-created_at", "-id"], name="order_recent"),
+        ]
 
     def __str__(self):
         return f"{self.placed_by} - {self.id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so signals can tell when the status actually changes
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.status in SOLD_STATUSES and self.paid_at is None:
+            self.paid_at = timezone.now()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "paid_at"}
+        super().save(*args, **kwargs)
     
     # @property
     # def total_amount(self):
@@ -43,7 +74,8 @@ class Order(models.Model):
             total=Sum(F("price_at_purchase") * F("quantity"), output_field=DecimalField())
         )["total"] or 0
         self.total_amount = total
-        self.save(update_fields=["total_amount"])
+        # updated_at too, the sales rollups find changed orders by it
+        self.save(update_fields=["total_amount", "updated_at"])
 
 
 class OrderItem(models.Model):
@@ -70,3 +102,60 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.id} - {self.product} - {self.quantity}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so signals can move the sales of a changed line
+        instance._loaded_sale = (instance.__dict__.get("product_id"), instance.__dict__.get("quantity"))
+        return instance
+
+
+
+class ProductDailySales(models.Model):
+    """
+    Units of a product sold per day, counted when an order is paid.
+    Backs the windowed best-seller boards; see orders.leaderboard.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField(db_index=True)
+    units = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'],
+                                    name='unique_product_per_sales_day')
+        ]
+
+    def __str__(self):
+        return f"{self.product} - {self.day} - {self.units}"
+
+
+RESERVATION_STATUS_CHOICES = (
+    ("held", "Held"),
+    ("committed", "Committed"),
+    ("released", "Released"),
+)
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product taken out of stock for an order while it waits
+    for payment. Held reservations are committed when the order is paid
+    and released (put back into stock) when it is cancelled, its payment
+    fails or the hold expires; see orders.inventory.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=RESERVATION_STATUS_CHOICES, default="held")
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the sweeper's scan for expired holds
+            models.Index(fields=["status", "expires_at"], name="reservation_status_expiry"),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} - {self.product_id} - {self.quantity} ({self.status})"
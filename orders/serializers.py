@@ -1,5 +1,7 @@
 from .models import Order, OrderItem
+from users.models import Address
 from rest_framework import serializers
+from products.fieldsets import SparseFieldsetMixin
 
 class OrderItemSerializer(serializers.ModelSerializer):
     """
@@ -17,12 +19,23 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OwnAddressMixin:
+    """
+    Only lets users ship to one of their own addresses
+    """
+    def validate_shipping_address(self, address):
+        if address is not None and address.user_id != self.context["request"].user.id:
+            raise serializers.ValidationError("Not one of your addresses.")
+        return address
+
+
+class OrderSerializer(OwnAddressMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     """
     serializer converts complex python Order object
     into simple json that the frontend can consume
     Serialize orders and include their items.
     Items are read-only; creation handled by backend logic.
+    Supports ?fields= and ?expand= (see products.fieldsets)
     """
     items = OrderItemSerializer(many=True, read_only=True)
     total_amount = serializers.DecimalField(max_digits=9, decimal_places=2, read_only=True)
@@ -32,3 +45,19 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ["total_amount", "placed_by"]
         fields = ["id", "items", "total_amount", "shipping_address", "created_at", "updated_at"]
 
+
+
+class OrderLineSerializer(serializers.Serializer):
+    """
+    One product and quantity of a new order, see orders.checkout
+    """
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CheckoutSerializer(OwnAddressMixin, serializers.Serializer):
+    """
+    Options for checking out the user's cart
+    """
+    shipping_address = serializers.PrimaryKeyRelatedField(
+        queryset=Address.objects.all(), required=False, allow_null=True)
@@ -1,7 +1,68 @@
-from django.db.models.signals import post_save, post_delete
+import logging
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Order, OrderItem
+from products.stats import refresh_sales_stats
+from products import trending
+from .models import Order, OrderItem, SOLD_STATUSES
+from . import inventory, leaderboard
+
+logger = logging.getLogger(__name__)
 
 @receiver([post_save, post_delete], sender=OrderItem)
 def update_order_total(sender, instance, **kwargs):
-    instance.order.recalculate_total()
\ No newline at end of file
+    instance.order.recalculate_total()
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def update_product_sales(sender, instance, **kwargs):
+    refresh_sales_stats(instance.product_id)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_sales_of_changed_item(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, "_loaded_sale", None)
+    instance._loaded_sale = (instance.product_id, instance.quantity)
+    if instance.order.status not in SOLD_STATUSES:
+        # counted when the order is paid
+        return
+    quantities = {instance.product_id: instance.quantity}
+    if previous is not None:
+        product_id, quantity = previous
+        quantities[product_id] = quantities.get(product_id, 0) - quantity
+    leaderboard.record_units(instance.order, quantities)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_sales_of_deleted_item(sender, instance, **kwargs):
+    # also how a deleted sold order leaves the buckets, one item at a time
+    if instance.order.status in SOLD_STATUSES:
+        product_id, quantity = getattr(instance, "_loaded_sale", (instance.product_id, instance.quantity))
+        leaderboard.record_units(instance.order, {product_id: -quantity})
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_status_change(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if instance.status == "cancelled" and previous != "cancelled":
+        inventory.release(instance)
+    is_sold = instance.status in SOLD_STATUSES
+    if (previous in SOLD_STATUSES) == is_sold:
+        return
+    if is_sold:
+        short = inventory.commit(instance)
+        if short:
+            # paid for already, so the order stands; staff restock or refund it
+            logger.warning("Order %s was paid after products %s ran out", instance.pk, short)
+            Order.objects.filter(pk=instance.pk).update(oversold=True)
+            instance.oversold = True
+    leaderboard.record_order(instance, sign=1 if is_sold else -1)
+    for product_id, quantity in instance.items.values_list("product_id", "quantity"):
+        refresh_sales_stats(product_id)
+        if is_sold:
+            trending.record_sale(product_id, quantity, instance.paid_at)
+
+
+@receiver(pre_delete, sender=Order)
+def release_reserved_stock(sender, instance, **kwargs):
+    inventory.release(instance)
@@ -1,3 +1,387 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from cart.models import Cart, CartItem
+from products import cache as catalog_cache
+from products.models import Category, Product
+from users.models import Address, User
+from . import inventory
+from .checkout import place_order
+from .models import Order, OrderItem, ProductDailySales, StockReservation
 
 # Create your tests here.
+
+class CheckoutTests(TestCase):
+    """
+    Checking out a cart creates the whole order at a fixed query cost
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.products = [Product.objects.create(name=f"Coat {i}", manufacturer="Noir",
+                                               original_price=100 + i, discount=10, stock=5)
+                        for i in range(10)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart, _ = Cart.objects.get_or_create(user=self.user)
+
+    def fill_cart(self, products, quantity=2):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.cart, product=product, quantity=quantity,
+                     price_at_addition=product.discounted_price)
+            for product in products
+        ])
+
+    def checkout(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("order-checkout"), {}, format="json")
+        return response, len(queries)
+
+    def test_checkout_creates_order_and_empties_cart(self):
+        self.fill_cart(self.products[:3])
+        response, _ = self.checkout()
+
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data["id"])
+        expected = sum(Decimal(str(product.discounted_price)) * 2 for product in self.products[:3])
+        self.assertEqual(order.total_amount, expected)
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 3)
+
+    def test_query_count_is_independent_of_cart_size(self):
+        self.fill_cart(self.products[:2])
+        _, small = self.checkout()
+        self.fill_cart(self.products)
+        _, large = self.checkout()
+        self.assertEqual(small, large)
+
+    def test_insufficient_stock_keeps_cart(self):
+        self.fill_cart(self.products[:2], quantity=6)
+        response, _ = self.checkout()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 400)
+
+    def test_orders_only_ship_to_own_addresses(self):
+        other = User.objects.create_user(username="other", email="other@example.com", password="secret-pass-123")
+        address = {"address_line1": "1 Rue Noir", "city": "Paris", "state": "IDF", "country": "FR",
+                   "postal_code": "75001"}
+        own = Address.objects.create(user=self.user, **address)
+        foreign = Address.objects.create(user=other, **address)
+        items = [{"product": self.products[0].pk}]
+
+        response = self.client.post(reverse("order-list"), {"items": items, "shipping_address": foreign.pk},
+                                    format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.fill_cart(self.products[:1])
+        response = self.client.post(reverse("order-checkout"), {"shipping_address": foreign.pk}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(reverse("order-list"), {"items": items, "shipping_address": own.pk},
+                                    format="json")
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch(reverse("order-detail", args=[response.data["id"]]),
+                                     {"shipping_address": foreign.pk}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class StockReservationTests(TestCase):
+    """
+    Stock is held at checkout, kept when paid and given back otherwise
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.product = Product.objects.create(name="Scarf", manufacturer="Noir",
+                                             original_price=40, stock=3)
+
+    def stock(self):
+        return Product.objects.get(pk=self.product.pk).stock
+
+    def test_reservations_never_oversell(self):
+        place_order(self.user, {self.product.pk: 2})
+        with self.assertRaises(inventory.InsufficientStock):
+            inventory.take_stock({self.product.pk: 2})
+        self.assertEqual(self.stock(), 1)
+
+    def test_cancelling_releases_once(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        order.status = "cancelled"
+        order.save()
+        self.assertEqual(inventory.release(order), 0)
+        self.assertEqual(self.stock(), 3)
+
+    def test_paying_commits(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        order.status = "paid"
+        order.save()
+        self.assertEqual(inventory.sweep_expired(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(order.reservations.get().status, "committed")
+
+    def test_sweeper_releases_expired_holds(self):
+        kept = place_order(self.user, {self.product.pk: 1})
+        expired = place_order(self.user, {self.product.pk: 2})
+        StockReservation.objects.filter(order=expired).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(inventory.sweep_expired(batch_size=1), 1)
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(kept.reservations.get().status, "held")
+
+    def test_only_availability_changes_touch_the_product(self):
+        updated_at = Product.objects.get(pk=self.product.pk).updated_at
+        inventory.take_stock({self.product.pk: 2})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).updated_at, updated_at)
+        inventory.take_stock({self.product.pk: 1})
+        sold_out = Product.objects.get(pk=self.product.pk).updated_at
+        self.assertGreater(sold_out, updated_at)
+        inventory._adjust_stock({self.product.pk: 1}, 1)
+        self.assertGreater(Product.objects.get(pk=self.product.pk).updated_at, sold_out)
+
+    def test_paying_after_expiry_takes_stock_again(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        StockReservation.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(minutes=1))
+        inventory.sweep_expired()
+        order.status = "paid"
+        order.save()
+        self.assertEqual(self.stock(), 1)
+        self.assertFalse(Order.objects.get(pk=order.pk).oversold)
+
+    def test_paying_after_the_stock_ran_out_flags_the_order(self):
+        order = place_order(self.user, {self.product.pk: 2})
+        StockReservation.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(minutes=1))
+        inventory.sweep_expired()
+        place_order(self.user, {self.product.pk: 3})
+        order.status = "paid"
+        with self.assertLogs("orders.signals", "WARNING"):
+            order.save()
+        self.assertTrue(Order.objects.get(pk=order.pk).oversold)
+        self.assertEqual(self.stock(), 0)
+
+
+class OrderHistoryTests(TestCase):
+    """
+    Customers page through their own orders at a fixed query cost
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        other = User.objects.create_user(username="other", email="other@example.com",
+                                         password="secret-pass-123")
+        product = Product.objects.create(name="Belt", manufacturer="Noir", original_price=30, stock=100)
+        for _ in range(15):
+            place_order(cls.user, {product.pk: 1})
+        cls.foreign = place_order(other, {product.pk: 1})
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_only_hold_own_orders(self):
+        # page of orders, items prefetch
+        with self.assertNumQueries(2):
+            first = self.client.get(reverse("order-list"), {"limit": 10})
+        second = self.client.get(first.data["next"])
+
+        ids = [order["id"] for order in first.data["results"] + second.data["results"]]
+        self.assertEqual(len(ids), 15)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertNotIn(self.foreign.pk, ids)
+        self.assertIsNone(second.data["next"])
+
+    def test_other_users_orders_are_hidden(self):
+        response = self.client.get(reverse("order-detail", args=[self.foreign.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "catalog": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog"},
+    "trending": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "trending"},
+    "idempotency": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "idempotency"},
+})
+class IdempotencyKeyTests(TestCase):
+    """
+    Retried requests with the same Idempotency-Key run once
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.product = Product.objects.create(name="Bag", manufacturer="Noir", original_price=80, stock=10)
+
+    def setUp(self):
+        caches["idempotency"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_order(self, key, quantity=1):
+        return self.client.post(reverse("order-list"),
+                                {"items": [{"product": self.product.pk, "quantity": quantity}]},
+                                format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_the_first_response(self):
+        first = self.create_order("retry-1")
+        with self.assertNumQueries(0):
+            second = self.create_order("retry-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_reused_key_with_another_body_is_rejected(self):
+        self.create_order("retry-2")
+        response = self.create_order("retry-2", quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_payment_frees_the_key(self):
+        order = place_order(self.user, {self.product.pk: 1})
+        declined = mock.Mock(**{"json.return_value": {"status": False, "message": "Declined"}})
+        with mock.patch("payments.views.requests.post", return_value=declined) as gateway:
+            for _ in range(2):
+                response = self.client.post(reverse("initiate-payment"), {"order": order.pk}, format="json",
+                                            HTTP_IDEMPOTENCY_KEY="pay-1")
+                self.assertEqual(response.status_code, 502)
+        self.assertEqual(gateway.call_count, 2)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post(reverse("order-list"), {"items": [{"product": self.product.pk}]}, format="json")
+        self.client.post(reverse("order-list"), {"items": [{"product": self.product.pk}]}, format="json")
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class IdempotencyCacheSettingsTests(TestCase):
+    """
+    With the configured caches, stored replays outlive churn in other caches
+    """
+    def test_replays_survive_a_full_default_cache(self):
+        user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                        password="secret-pass-123")
+        product = Product.objects.create(name="Bag", manufacturer="Noir", original_price=80, stock=10)
+        caches["idempotency"].clear()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        def create_order():
+            return client.post(reverse("order-list"), {"items": [{"product": product.pk}]},
+                               format="json", HTTP_IDEMPOTENCY_KEY="settings-1")
+
+        self.assertEqual(create_order().status_code, 201)
+        default = caches["default"]
+        for i in range(400):
+            default.set(f"trending:views:{i}", i)
+        self.assertEqual(create_order()["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "catalog": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog"},
+    "trending": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "trending"},
+})
+class SalesStatsTests(TestCase):
+    """
+    Paying or deleting orders reaches cached lists and the sales buckets
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.shirt = Product.objects.create(name="Shirt", manufacturer="Noir", original_price=20, stock=10)
+        cls.tie = Product.objects.create(name="Tie", manufacturer="Noir", original_price=10, stock=10)
+
+    def setUp(self):
+        caches["catalog"].clear()
+        catalog_cache.clear_local()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pay(self, quantities):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.user, quantities)
+            order.status = "paid"
+            order.save()
+        return order
+
+    def best_sellers(self, **headers):
+        return self.client.get(reverse("product-list"), {"ordering": "-total_sold"}, **headers)
+
+    def test_paid_order_reorders_cached_lists(self):
+        self.pay({self.shirt.pk: 1})
+        first = self.best_sellers()
+        self.assertEqual([item["id"] for item in first.data["results"]], [self.shirt.pk, self.tie.pk])
+        self.pay({self.tie.pk: 2})
+
+        response = self.best_sellers(HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["results"]], [self.tie.pk, self.shirt.pk])
+
+    def board(self, **params):
+        response = self.client.get(reverse("best-sellers"), params)
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.data]
+
+    def test_best_seller_windows_and_categories(self):
+        self.pay({self.shirt.pk: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.user, {self.tie.pk: 5})
+            order.status = "paid"
+            order.paid_at = timezone.now() - timedelta(days=10)
+            order.save()
+        ties = Category.objects.create(name="Ties")
+        self.tie.category.add(ties)
+
+        self.assertEqual(self.board(), [self.tie.pk, self.shirt.pk])
+        self.assertEqual(self.board(window="7d"), [self.shirt.pk])
+        self.assertEqual(self.board(window="30d"), [self.tie.pk, self.shirt.pk])
+        self.assertEqual(self.board(category=ties.pk), [self.tie.pk])
+        self.assertEqual(self.board(window="7d", category=ties.pk), [])
+        self.assertEqual(self.client.get(reverse("best-sellers"), {"window": "1y"}).status_code, 400)
+
+    def test_item_changes_on_paid_orders_reach_the_boards(self):
+        self.pay({self.shirt.pk: 1})
+        order = self.pay({self.tie.pk: 2})
+        self.assertEqual(self.board(), [self.tie.pk, self.shirt.pk])
+        self.assertEqual(self.board(window="7d"), [self.tie.pk, self.shirt.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item = order.items.get()
+            item.quantity = 5
+            item.save()
+            OrderItem.objects.create(order=order, product=self.shirt, quantity=3, price_at_purchase=20)
+        self.assertEqual(ProductDailySales.objects.get(product=self.tie).units, 5)
+        self.assertEqual(ProductDailySales.objects.get(product=self.shirt).units, 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.board(), [self.shirt.pk, self.tie.pk])
+        self.assertEqual(self.board(window="7d"), [self.shirt.pk])
+
+    def test_deleting_a_paid_order_removes_its_sales(self):
+        order = self.pay({self.tie.pk: 2})
+        self.assertEqual(ProductDailySales.objects.get(product=self.tie).units, 2)
+        order.delete()
+        self.assertEqual(ProductDailySales.objects.get(product=self.tie).units, 0)
+        self.assertEqual(Product.objects.get(pk=self.tie.pk).total_sold, 0)
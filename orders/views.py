@@ -1,6 +1,14 @@
-from rest_framework import permissions, viewsets
-from .serializers import OrderSerializer, OrderItemSerializer
+from collections import Counter
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .serializers import OrderSerializer, OrderItemSerializer, OrderLineSerializer, CheckoutSerializer
+from .checkout import CheckoutError, checkout_cart, place_order
+from .idempotency import idempotent
 from .models import Order, OrderItem
+from products.pagination import KeysetPagination
+from products.fieldsets import SparseFieldsetViewMixin
 
 # Create your views here.
 class BaseViewSet(viewsets.ModelViewSet):
@@ -15,16 +23,62 @@ class OrderItemsViewset(BaseViewSet):
     queryset = OrderItem.objects.all()
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(order__placed_by=self.request.user)
 
-class OrderViewSet(BaseViewSet):
+
+class OrderPagination(KeysetPagination):
+    # order history is walked from the newest order down, never by page number
+    keyset_by_default = True
+
+
+class OrderViewSet(SparseFieldsetViewMixin, BaseViewSet):
     """
     view for Order class
+    Customers only see their own orders, staff see everyone's.
     """
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Order.objects.all()
+    pagination_class = OrderPagination
+    queryset = Order.objects.order_by("-created_at", "-id")
+    always_loaded_fields = ["created_at"]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(placed_by=self.request.user)
+
+    @idempotent("orders")
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        total = sum(item.product.discounted_price * item.quantity
-                    for item in self.request.data.get('items', []))
-        serializer.save(placed_by=self.request.user, total_amount=total)
+        lines = OrderLineSerializer(data=self.request.data.get('items', []), many=True)
+        lines.is_valid(raise_exception=True)
+        quantities = Counter()
+        for line in lines.validated_data:
+            quantities[line["product"]] += line["quantity"]
+        try:
+            serializer.instance = place_order(self.request.user, quantities,
+                                              serializer.validated_data.get("shipping_address"))
+        except CheckoutError as error:
+            raise ValidationError({"error": str(error)})
+
+    @action(detail=False, methods=["post"])
+    @idempotent("checkout")
+    def checkout(self, request):
+        """
+        Order everything in the user's cart in one transaction and empty the cart
+        """
+        options = CheckoutSerializer(data=request.data, context={"request": request})
+        options.is_valid(raise_exception=True)
+        try:
+            order = checkout_cart(request.user, options.validated_data.get("shipping_address"))
+        except CheckoutError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(OrderSerializer(order, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
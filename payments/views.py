@@ -10,6 +10,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import Payment
 from orders.models import Order
+from orders import inventory
+from orders.idempotency import idempotent
 from .serializers import PaymentSerializer
 from django_ratelimit.decorators import ratelimit
 from .utils import generate_order_number, create_plain_text_email
@@ -18,6 +20,7 @@ from .utils import generate_order_number, create_plain_text_email
 @ratelimit(key="user_or_ip", rate="5/m", block=True)
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent("payments")
 def initiate_payment(request):
     """
     Start a payment with Chapa and return a checkout URL.
@@ -28,6 +31,7 @@ def initiate_payment(request):
     2. gateway (or default to paystack) [paystack or chapa]
     3. phone_number (or default to authenticated user phone_number).
     Same applies to first name and last name
+    Send an Idempotency-Key header to make retries safe (see orders.idempotency)
     """
     order_id = request.data.get("order")
     
@@ -154,8 +158,7 @@ def initiate_payment(request):
             "checkout_url": response_data['data']['authorization_url'],
             "payment": PaymentSerializer(payment).data
         })
-    else:
-        return False, "Failed to initiate payment, please try again later."
+    return Response({"error": "Failed to initiate payment, please try again later."}, status=502)
 
 
 @api_view(["GET"])
@@ -214,7 +217,10 @@ def verify_payment(request):
             
         return Response({"message": "Payment verified successfully"})
     else:
-        payment.status = "failed"
-        payment.save()
+        with transaction.atomic():
+            payment.status = "failed"
+            payment.save()
+            # give the held stock back to other shoppers
+            inventory.release(payment.order)
         return Response({"message": "Payment failed"}, status=400)
     
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, ProductImage, Review
+from .models import Category, Product, ProductImage, Review, RelatedProduct, AlsoBoughtProduct, ImportJob
 
 
 @admin.register(Category)
@@ -24,3 +24,22 @@ class ProductImageAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ("id", "product", "customer", "rating", "review_title", "comment", "created_at", "updated_at")
     search_fields = ("review_title",)
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ("id", "product", "related", "rank", "score", "computed_at")
+    raw_id_fields = ("product", "related")
+
+
+@admin.register(AlsoBoughtProduct)
+class AlsoBoughtProductAdmin(admin.ModelAdmin):
+    list_display = ("id", "product", "recommended", "rank", "orders_together", "computed_at")
+    raw_id_fields = ("product", "recommended")
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "status", "rows_processed", "created_count", "updated_count",
+                    "error_count", "created_at")
+    list_filter = ("status",)
@@ -0,0 +1,321 @@
+"""
+Versioned cache for catalog responses.
+
+Every key embeds a version number, so invalidation never has to find and
+delete stale entries: bumping the version makes the old keys unreachable
+and they simply age out of the backend.
+
+* The catalog generation covers list queries and changes on any product,
+  image, review or category write.
+* Each product also has its own version so a detail page is only rebuilt
+  when that product (or its images/reviews) changes.
+
+The shared backend is whichever alias CATALOG_CACHE_ALIAS points to in
+settings.CACHES (Redis or the database cache). It has to be shared by
+every process: a version bumped in local memory by another worker or a
+management command never reaches the process serving the page.
+
+Version numbers are remembered in-process for CATALOG_CACHE_VERSION_TTL
+seconds, so a request served from the local tier doesn't reach the shared
+backend at all. Bumps are seen at once by the process that made them and
+within that TTL by the others.
+
+Values are read through TieredCache, which keeps a small per-process LRU
+in front of it, lets a single worker regenerate a missing key and
+refreshes hot keys a little before they expire.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+GENERATION_KEY = "catalog:generation"
+PRODUCT_VERSION_KEY = "catalog:product:{pk}:version"
+
+
+def get_cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "catalog")]
+
+
+def get_timeout():
+    return getattr(settings, "CATALOG_CACHE_TIMEOUT", 60 * 60 * 24)
+
+
+def get_version_ttl():
+    return getattr(settings, "CATALOG_CACHE_VERSION_TTL", 2)
+
+
+_versions = {}
+_versions_mutex = threading.Lock()
+MAX_LOCAL_VERSIONS = 10_000
+
+
+def _remember_version(key, version):
+    with _versions_mutex:
+        if len(_versions) >= MAX_LOCAL_VERSIONS:
+            _versions.clear()
+        _versions[key] = (version, time.monotonic() + get_version_ttl())
+
+
+def _recall_version(key):
+    item = _versions.get(key)
+    if item is not None and item[1] > time.monotonic():
+        return item[0]
+    return None
+
+
+def _get_version(key):
+    version = _recall_version(key)
+    if version is not None:
+        return version
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # seed from the clock so a version lost to eviction never reuses
+        # a number an older entry was stored under
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    _remember_version(key, version)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+    _remember_version(key, version)
+    return version
+
+
+def get_generation():
+    return _get_version(GENERATION_KEY)
+
+
+def bump_generation():
+    return _bump_version(GENERATION_KEY)
+
+
+def get_product_version(pk):
+    return _get_version(PRODUCT_VERSION_KEY.format(pk=pk))
+
+
+def bump_product(pk):
+    """
+    Invalidate one product's detail entry and every list that may include it
+    """
+    _bump_version(PRODUCT_VERSION_KEY.format(pk=pk))
+    return bump_generation()
+
+
+def bump_products(pks):
+    """
+    bump_product() for many products, bumping the generation only once
+    """
+    for pk in pks:
+        _bump_version(PRODUCT_VERSION_KEY.format(pk=pk))
+    return bump_generation()
+
+
+def product_key(pk):
+    return f"catalog:product:{pk}:v{get_product_version(pk)}"
+
+
+def product_keys(pks):
+    """
+    product_key() for several products, reading their versions in one round trip
+    """
+    names = {pk: PRODUCT_VERSION_KEY.format(pk=pk) for pk in pks}
+    versions = {name: _recall_version(name) for name in names.values()}
+    missing = [name for name, version in versions.items() if version is None]
+    if missing:
+        for name, version in get_cache().get_many(missing).items():
+            _remember_version(name, version)
+            versions[name] = version
+    return {pk: f"catalog:product:{pk}:v{versions.get(name) or _get_version(name)}"
+            for pk, name in names.items()}
+
+
+def list_key(request, prefix="list"):
+    """
+    Key a list response on the catalog generation and the full query string
+    """
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"catalog:{prefix}:g{get_generation()}:{path}"
+
+
+class TieredCache:
+    """
+    Per-process LRU in front of the shared catalog cache.
+
+    * The local tier holds at most ``max_entries`` values for ``local_timeout``
+      seconds. Keys are versioned, so a short TTL only bounds memory use, it
+      never serves an invalidated value.
+    * On a shared miss only the worker holding ``<key>:lock`` regenerates;
+      the others wait for its result instead of running the same query, and
+      take the lock over if it is released without a value.
+    * Entries are refreshed early with probability growing towards expiry
+      ("XFetch"), weighted by how long the value took to compute, so a hot
+      key is rebuilt by one request before everyone misses at once.
+    """
+    def __init__(self, max_entries=512, local_timeout=5, lock_timeout=10, beta=1.0):
+        self.max_entries = max_entries
+        self.local_timeout = local_timeout
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self._local = OrderedDict()
+        self._mutex = threading.Lock()
+        self._stats = dict.fromkeys(
+            ["local_hits", "shared_hits", "misses", "regenerations",
+             "early_refreshes", "lock_waits", "stale_served"], 0)
+
+    def _count(self, name):
+        with self._mutex:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._mutex:
+            stats = dict(self._stats)
+            stats["local_entries"] = len(self._local)
+        return stats
+
+    def _get_local(self, key):
+        with self._mutex:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            if item[1] < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return item[0]
+
+    def _set_local(self, key, value):
+        with self._mutex:
+            self._local[key] = (value, time.monotonic() + self.local_timeout)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _should_refresh_early(self, delta, expires_at):
+        # -log(random) is exponentially distributed; the closer to expiry and
+        # the slower the value is to build, the likelier an early refresh
+        return time.time() - delta * self.beta * math.log(1 - random.random()) >= expires_at
+
+    def _store(self, key, value, delta, timeout):
+        get_cache().set(key, (value, delta, time.time() + timeout), timeout)
+        self._set_local(key, value)
+
+    def _regenerate(self, key, producer, timeout):
+        start = time.monotonic()
+        value = producer()
+        self._store(key, value, time.monotonic() - start, timeout)
+        self._count("regenerations")
+        return value
+
+    def get_or_set(self, key, producer, timeout=None):
+        """
+        Return the cached value for ``key`` or build it with ``producer()``
+        """
+        value = self._get_local(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        timeout = timeout or get_timeout()
+        shared = get_cache()
+        lock_key = f"{key}:lock"
+        entry = shared.get(key)
+        if entry is not None:
+            value, delta, expires_at = entry
+            if not self._should_refresh_early(delta, expires_at):
+                self._count("shared_hits")
+                self._set_local(key, value)
+                return value
+            if not shared.add(lock_key, 1, self.lock_timeout):
+                # someone else is already refreshing it
+                self._count("stale_served")
+                return value
+            self._count("early_refreshes")
+            try:
+                return self._regenerate(key, producer, timeout)
+            finally:
+                shared.delete(lock_key)
+
+        self._count("misses")
+        if shared.add(lock_key, 1, self.lock_timeout):
+            try:
+                return self._regenerate(key, producer, timeout)
+            finally:
+                shared.delete(lock_key)
+
+        self._count("lock_waits")
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = shared.get(key)
+            if entry is not None:
+                self._set_local(key, entry[0])
+                return entry[0]
+            if shared.add(lock_key, 1, self.lock_timeout):
+                # the holder let go without storing a value (its producer
+                # raised), build it now instead of waiting out the timeout
+                try:
+                    return self._regenerate(key, producer, timeout)
+                finally:
+                    shared.delete(lock_key)
+        # the lock holder died or is too slow, build it ourselves
+        return self._regenerate(key, producer, timeout)
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._get_local(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+                self._count("local_hits")
+        if missing:
+            for key, entry in get_cache().get_many(missing).items():
+                found[key] = entry[0]
+                self._set_local(key, entry[0])
+                self._count("shared_hits")
+        return found
+
+    def set_many(self, mapping, timeout=None):
+        timeout = timeout or get_timeout()
+        expires_at = time.time() + timeout
+        get_cache().set_many({key: (value, 0, expires_at) for key, value in mapping.items()}, timeout)
+        for key, value in mapping.items():
+            self._set_local(key, value)
+
+
+tiered_cache = TieredCache(
+    max_entries=getattr(settings, "CATALOG_CACHE_LOCAL_MAX_ENTRIES", 512),
+    local_timeout=getattr(settings, "CATALOG_CACHE_LOCAL_TIMEOUT", 5),
+    lock_timeout=getattr(settings, "CATALOG_CACHE_LOCK_TIMEOUT", 10),
+    beta=getattr(settings, "CATALOG_CACHE_EARLY_REFRESH_BETA", 1.0),
+)
+
+
+def clear_local():
+    """
+    Forget the versions and values this process holds, e.g. after clearing
+    the shared backend
+    """
+    with _versions_mutex:
+        _versions.clear()
+    with tiered_cache._mutex:
+        tiered_cache._local.clear()
+
+
+def get_or_set(key, producer):
+    return tiered_cache.get_or_set(key, producer)
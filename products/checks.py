@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.checks import Error, register
+
+
+@register()
+def check_trending_cache(app_configs, **kwargs):
+    """
+    View counters are lost when incr/decr race, reject caches where they aren't atomic
+    """
+    alias = getattr(settings, "TRENDING_CACHE_ALIAS", "trending")
+    if isinstance(caches[alias], (DatabaseCache, FileBasedCache)):
+        return [Error(
+            f"The {alias!r} cache can't count product views, its incr/decr aren't atomic.",
+            hint="Point TRENDING_CACHE_URL at Redis, Memcached or locmemcache://.",
+            id="products.E001",
+        )]
+    return []
@@ -0,0 +1,55 @@
+"""
+Conditional GET (ETag / Last-Modified) for API views.
+
+Views are wrapped with django's ``condition`` decorator, which calls these
+functions before the view body: when the client's If-None-Match or
+If-Modified-Since still matches, a 304 is returned without running the
+view's queries or serializing anything.
+
+Detail ETags come from the row's updated_at, which is also bumped when
+related rows shown in the representation change (images, reviews,
+categories, comments, likes), so checking costs one indexed primary key
+lookup. The lookup is remembered on the request so the ETag and
+Last-Modified functions share it.
+"""
+import hashlib
+from . import cache as catalog_cache
+from .models import Product
+
+
+def make_etag(*parts):
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def updated_at(request, queryset, **lookup):
+    """
+    updated_at of the row matching ``lookup``, None when there is none
+    """
+    memo = request.__dict__.setdefault("_conditional_updated_at", {})
+    key = (queryset.model._meta.label, tuple(sorted(lookup.items())))
+    if key not in memo:
+        try:
+            memo[key] = queryset.filter(**lookup).values_list("updated_at", flat=True).first()
+        except (TypeError, ValueError):
+            # malformed lookup value, let the view return its 404
+            memo[key] = None
+    return memo[key]
+
+
+def product_last_modified(request, pk=None, **kwargs):
+    return updated_at(request, Product.objects, pk=pk)
+
+
+def product_etag(request, pk=None, **kwargs):
+    modified = product_last_modified(request, pk)
+    if modified is None:
+        return None
+    # the cache version is bumped after commit, so the ETag also changes once
+    # the cached representation has been invalidated
+    return make_etag("product", pk, modified.isoformat(), catalog_cache.get_product_version(pk))
+
+
+def product_list_etag(request, *args, **kwargs):
+    # list responses are cached under the catalog generation and the query
+    # string, the key itself identifies the representation
+    return make_etag(catalog_cache.list_key(request))
@@ -0,0 +1,100 @@
+"""
+Facet counts for the product list sidebar (?facets=1).
+
+Counts per category, manufacturer, price bucket and rating band are
+grouped aggregates over the current result set, glued together with
+UNION ALL so the whole block is one query. The result set is whatever
+ProductFilter and the search filter produced, so the counts always match
+the active filters. The unfiltered block is cached in the catalog cache
+under the catalog generation.
+"""
+from django.db.models import Case, CharField, Count, F, IntegerField, Value, When
+from django.db.models.functions import Cast
+from . import cache as catalog_cache
+from .filters import ProductFilter
+from .models import Product
+
+FACETS_QUERY_PARAM = "facets"
+# upper bounds of the effective price buckets, the last bucket is open ended
+PRICE_BUCKETS = [25, 50, 100, 200, 500]
+# "n & up" bands, counted from the rounded down average rating
+RATING_BANDS = [4, 3, 2, 1]
+
+
+def requested(request):
+    return request.query_params.get(FACETS_QUERY_PARAM) in ("1", "true")
+
+
+def is_filtered(request):
+    params = set(ProductFilter.base_filters) | {"search"}
+    return any(request.query_params.get(name) for name in params)
+
+
+def _price_bucket():
+    whens, lower = [], 0
+    for upper in PRICE_BUCKETS:
+        whens.append(When(effective_price__lt=upper, then=Value(f"{lower}-{upper}")))
+        lower = upper
+    return Case(*whens, default=Value(f"{lower}+"), output_field=CharField())
+
+
+def _rating_band():
+    whens = [When(avg_rating__gte=band, then=Value(band)) for band in RATING_BANDS]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def _group(products, facet, value, label=None):
+    """
+    (facet, value, label, count) rows of ``products`` grouped by ``value``
+    """
+    return (products.order_by()
+            .values(value=Cast(value, CharField()), label=label or Value(""))
+            .annotate(facet=Value(facet), count=Count("id", distinct=True))
+            .values_list("facet", "value", "label", "count"))
+
+
+def compute_facets(queryset):
+    """
+    Facet counts of the products in ``queryset``, in a single query
+    """
+    products = Product.objects.filter(pk__in=queryset.order_by().values("pk"))
+    categories = _group(products.filter(category__isnull=False), "category",
+                        F("category__id"), F("category__name"))
+    rows = categories.union(
+        _group(products, "manufacturer", F("manufacturer")),
+        _group(products, "price", _price_bucket()),
+        _group(products, "rating", _rating_band()),
+        all=True,
+    )
+
+    facets = {"category": [], "manufacturer": [], "price": [], "rating": []}
+    ratings = {}
+    for facet, value, label, count in rows:
+        if facet == "category":
+            facets[facet].append({"id": int(value), "name": label, "count": count})
+        elif facet == "rating":
+            ratings[int(value)] = count
+        else:
+            facets[facet].append({"value": value, "count": count})
+
+    facets["category"].sort(key=lambda item: (-item["count"], item["name"]))
+    facets["manufacturer"].sort(key=lambda item: (-item["count"], item["value"]))
+    buckets = [f"{lower}-{upper}" for lower, upper in zip([0] + PRICE_BUCKETS, PRICE_BUCKETS)]
+    order = {bucket: position for position, bucket in enumerate(buckets)}
+    facets["price"].sort(key=lambda item: order.get(item["value"], len(order)))
+    # bands are cumulative ("3 & up" includes the 4s) so sum from the top
+    total = 0
+    for band in RATING_BANDS:
+        total += ratings.get(band, 0)
+        facets["rating"].append({"min_rating": band, "count": total})
+    return facets
+
+
+def get_facets(view, request):
+    """
+    Facets for the products ``view`` would list for ``request``
+    """
+    if is_filtered(request):
+        return compute_facets(view.filter_queryset(view.get_queryset()))
+    key = f"catalog:facets:g{catalog_cache.get_generation()}"
+    return catalog_cache.get_or_set(key, lambda: compute_facets(Product.objects.all()))
@@ -0,0 +1,139 @@
+"""
+Product feeds for marketplaces: CSV, JSON lines and Google Merchant style XML.
+
+Products are read with iterator(chunk_size=...) and their images and
+categories are prefetched one chunk at a time, and every row is yielded
+as soon as it is formatted. Memory use stays flat whatever the catalog
+size, so the feed can be streamed straight into a StreamingHttpResponse
+or a file. Pass ``since`` to only export products whose updated_at is at
+or after that time.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Product
+
+FEED_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "xml": "application/xml",
+}
+FIELDS = ["id", "title", "description", "link", "image_link", "additional_image_links",
+          "price", "sale_price", "availability", "brand", "product_type", "updated_at"]
+
+
+def parse_since(value):
+    """
+    Parse an ISO date or datetime; naive values are in the current time zone
+    """
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"invalid date: {value!r}")
+        since = datetime.combine(day, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def feed_queryset(since=None):
+    products = Product.objects.prefetch_related("images", "category").order_by("id")
+    if since is not None:
+        products = products.filter(updated_at__gte=since)
+    return products
+
+
+def _absolute(site_url, path):
+    if not path or path.startswith(("http://", "https://")):
+        return path or ""
+    return f"{site_url.rstrip('/')}/{path.lstrip('/')}"
+
+
+def product_row(product, site_url=""):
+    """
+    Flat dict describing one product in the feed
+    """
+    currency = getattr(settings, "PRODUCT_FEED_CURRENCY", "NGN")
+    link = getattr(settings, "PRODUCT_FEED_PRODUCT_URL", "/api/products/{id}/").format(id=product.id)
+    images = sorted(product.images.all(), key=lambda image: (not image.is_main, image.id))
+    images = [_absolute(site_url, image.images.url) for image in images if image.images]
+    return {
+        "id": product.id,
+        "title": product.name,
+        "description": product.product_description or "",
+        "link": _absolute(site_url, link),
+        "image_link": images[0] if images else "",
+        "additional_image_links": images[1:],
+        "price": f"{product.original_price:.2f} {currency}",
+        "sale_price": f"{product.effective_price:.2f} {currency}",
+        "availability": "in_stock" if product.stock > 0 else "out_of_stock",
+        "brand": product.manufacturer,
+        "product_type": ", ".join(sorted(category.name for category in product.category.all())),
+        "updated_at": product.updated_at.isoformat(),
+    }
+
+
+def _rows(since, site_url, chunk_size):
+    for product in feed_queryset(since).iterator(chunk_size=chunk_size):
+        yield product_row(product, site_url)
+
+
+def csv_feed(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        writer.writerow({**row, "additional_image_links": ",".join(row["additional_image_links"])})
+        yield flush()
+
+
+def jsonl_feed(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def xml_feed(rows):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+           '<title>Atelier Noir</title>\n')
+    for row in rows:
+        lines = [
+            f"<g:id>{row['id']}</g:id>",
+            f"<title>{escape(row['title'])}</title>",
+            f"<description>{escape(row['description'])}</description>",
+            f"<link>{escape(row['link'])}</link>",
+            f"<g:image_link>{escape(row['image_link'])}</g:image_link>",
+            *[f"<g:additional_image_link>{escape(url)}</g:additional_image_link>"
+              for url in row["additional_image_links"]],
+            f"<g:price>{row['price']}</g:price>",
+            f"<g:sale_price>{row['sale_price']}</g:sale_price>",
+            f"<g:availability>{row['availability']}</g:availability>",
+            f"<g:brand>{escape(row['brand'])}</g:brand>",
+            f"<g:product_type>{escape(row['product_type'])}</g:product_type>",
+        ]
+        yield "<item>" + "".join(lines) + "</item>\n"
+    yield "</channel>\n</rss>\n"
+
+
+WRITERS = {"csv": csv_feed, "jsonl": jsonl_feed, "xml": xml_feed}
+
+
+def generate_feed(feed_format, since=None, site_url="", chunk_size=500):
+    """
+    Yield the feed in ``feed_format`` ('csv', 'jsonl' or 'xml') piece by piece
+    """
+    return WRITERS[feed_format](_rows(since, site_url, chunk_size))
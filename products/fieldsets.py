@@ -0,0 +1,110 @@
+"""
+Sparse fieldsets: ?fields= and ?expand= for serializers and their querysets.
+
+    GET /api/products/?fields=id,name,main_image
+    GET /api/products/?expand=images
+
+``?fields=`` picks the fields to return. Serializers may declare
+``Meta.default_fields``, a smaller set returned when ``?fields=`` isn't
+given; ``?expand=`` adds fields on top of either set.
+
+SparseFieldsetViewMixin uses the same selection to load only the columns
+(``only()``) and relations (``prefetch_related()``) the response needs.
+``Meta.field_requirements`` lists what a field needs when that isn't just
+the model field of the same name, e.g. a SerializerMethodField.
+
+Representations shared through a cache must not depend on the query
+string: serialize them with ``{"full_representation": True}`` in the
+context and narrow each response with apply_fieldset().
+"""
+from rest_framework import serializers
+
+
+def _param(request, name):
+    value = request.query_params.get(name, "") if request is not None else ""
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin applying ?fields= / ?expand= to the top-level serializer
+    """
+    @classmethod
+    def selected_field_names(cls, request):
+        """
+        Field names the response will contain, or None for all of them
+        """
+        requested = _param(request, "fields")
+        expand = _param(request, "expand")
+        default = getattr(cls.Meta, "default_fields", None)
+        if requested:
+            return requested | expand
+        if default is not None:
+            return set(default) | expand
+        return None
+
+    @classmethod
+    def queryset_requirements(cls, selected):
+        """
+        Return (columns, prefetches) needed to serialize ``selected`` fields.
+        ``columns`` is None when every column is needed.
+        """
+        requirements = getattr(cls.Meta, "field_requirements", {})
+        model = cls.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        names = [name for name in cls.Meta.fields if selected is None or name in selected]
+        columns, prefetches = {model._meta.pk.name}, set()
+        for name in names:
+            if name in requirements:
+                columns.update(requirements[name].get("only", []))
+                prefetches.update(requirements[name].get("prefetch", []))
+            elif name in concrete:
+                columns.add(name)
+            else:
+                prefetches.add(name)
+        return (columns if selected is not None else None), prefetches
+
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_top_level() or self.context.get("full_representation"):
+            return fields
+        selected = self.selected_field_names(self.context.get("request"))
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+def apply_fieldset(serializer_class, request, items):
+    """
+    Narrow full representations (dicts) to the fields ``request`` selects
+    """
+    selected = serializer_class.selected_field_names(request)
+    if selected is None:
+        return items
+    return [{name: value for name, value in item.items() if name in selected} for item in items]
+
+
+class SparseFieldsetViewMixin:
+    """
+    View mixin narrowing get_queryset() to what the selected fields need.
+    ``always_loaded_fields`` are kept regardless (e.g. ordering/cursor fields).
+    """
+    always_loaded_fields = ()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.request.method != "GET" or not issubclass(serializer_class, SparseFieldsetMixin):
+            return queryset
+        selected = serializer_class.selected_field_names(self.request)
+        columns, prefetches = serializer_class.queryset_requirements(selected)
+        queryset = queryset.prefetch_related(None).prefetch_related(*sorted(prefetches))
+        if columns is not None:
+            queryset = queryset.only(*columns, *self.always_loaded_fields)
+        return queryset
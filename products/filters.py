@@ -1,9 +1,27 @@
 import django_filters
+from rest_framework import filters
 from .models import Product
+from . import search
 
 class ProductFilter(django_filters.FilterSet):
     category = django_filters.NumberFilter(field_name="category__id")
+    min_price = django_filters.NumberFilter(field_name="effective_price", lookup_expr="gte")
+    max_price = django_filters.NumberFilter(field_name="effective_price", lookup_expr="lte")
 
     class Meta:
         model = Product
-        fields = ['category']
+        fields = ['category', 'min_price', 'max_price']
+
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    ?search= backed by the full-text index in products.search.
+    Results are ordered by relevance unless ?ordering= is given.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = " ".join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        ordered = request.query_params.get(filters.OrderingFilter.ordering_param)
+        return search.filter_queryset(queryset, query, ranked=not ordered)
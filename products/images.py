@@ -0,0 +1,150 @@
+"""
+Resized and re-encoded copies ("variants") of product images.
+
+Every upload gets one copy per size in SIZES, no wider than the original,
+in JPEG and WebP, plus AVIF when Pillow was built with it. Files are
+saved through the image field's storage, named after the original (see
+image_upload_path; the content addressed storage renames them after their
+digest), and the stored names are kept in ProductImage.variants:
+
+    {"source": "blobs/3f/a2/3fa2...e9.jpg",
+     "thumb": {"width": 200, "height": 267, "jpeg": "...", "webp": "...", "avif": "..."}, ...}
+
+JPEG and WebP are quick to encode and are generated right after the
+upload is committed. AVIF is slow, so it is handed to a small thread pool
+(PRODUCT_IMAGE_WORKERS, 0 runs it inline). Variants are written with
+queryset updates, so they don't re-trigger the ProductImage signals.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from PIL import Image, ImageOps, features
+from . import cache as catalog_cache
+from .models import Product, ProductImage, image_upload_path
+from .stats import refresh_main_image
+
+logger = logging.getLogger(__name__)
+
+# target widths, smallest first
+SIZES = {"thumb": 200, "small": 480, "medium": 960, "large": 1600}
+FAST_FORMATS = ("jpeg", "webp")
+SLOW_FORMATS = ("avif",)
+QUALITY = {"jpeg": 82, "webp": 80, "avif": 60}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "avif": "avif"}
+
+_executor = None
+
+
+def supported(formats):
+    return [name for name in formats if name == "jpeg" or features.check(name)]
+
+
+def _variant_name(image, size, file_format):
+    stem = os.path.splitext(os.path.basename(image.images.name))[0]
+    return image_upload_path(image, f"variants/{stem}-{size}.{EXTENSIONS[file_format]}")
+
+
+def _encode(picture, file_format):
+    if file_format == "jpeg" and picture.mode != "RGB":
+        # JPEG has no alpha channel, flatten onto white
+        background = Image.new("RGB", picture.size, "white")
+        rgba = picture.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        picture = background
+    buffer = io.BytesIO()
+    picture.save(buffer, format=file_format.upper(), quality=QUALITY[file_format])
+    return buffer.getvalue()
+
+
+def _resized(original, width):
+    if original.width <= width:
+        return original
+    height = max(1, round(original.height * width / original.width))
+    return original.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def generate_variants(image_id, formats=FAST_FORMATS):
+    """
+    Write the missing ``formats`` of every size for one ProductImage
+    """
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.images:
+        return
+    source = image.images.name
+    storage = image.images.storage
+    variants = image.variants
+    if variants.get("source") != source:
+        # the file was replaced, drop the copies of the old one
+        delete_variants(storage, variants)
+        variants = {"source": source}
+    try:
+        with image.images.open("rb") as file, Image.open(file) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ("RGB", "RGBA"):
+                original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+            for position, (size, width) in enumerate(SIZES.items()):
+                # the smallest size is always made, larger ones only when downscaling
+                if position and original.width < width:
+                    continue
+                picture = _resized(original, width)
+                entry = variants.setdefault(size, {"width": picture.width, "height": picture.height})
+                for file_format in supported(formats):
+                    if file_format in entry:
+                        continue
+                    name = _variant_name(image, size, file_format)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    entry[file_format] = storage.save(name, ContentFile(_encode(picture, file_format)))
+    except (OSError, ValueError) as error:
+        logger.warning("Could not generate variants of product image %s: %s", image_id, error)
+        return
+
+    # only store them if the image wasn't replaced in the meantime
+    ProductImage.objects.filter(pk=image_id, images=source).update(variants=variants)
+    if image.is_main:
+        refresh_main_image(image.product_id)
+    else:
+        Product.objects.filter(pk=image.product_id).touch()
+    catalog_cache.bump_product(image.product_id)
+
+
+def delete_variants(storage, variants):
+    for size, entry in variants.items():
+        if size == "source":
+            continue
+        for key, name in entry.items():
+            if key not in ("width", "height"):
+                storage.delete(name)
+
+
+def _run_in_background(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception("Background image job %s%r failed", function.__name__, args)
+    finally:
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def submit(function, *args):
+    global _executor
+    workers = getattr(settings, "PRODUCT_IMAGE_WORKERS", 2)
+    if not workers:
+        return function(*args)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="product-images")
+    _executor.submit(_run_in_background, function, *args)
+
+
+def process_upload(image_id):
+    """
+    Generate the quick variants now and queue the slow encodes
+    """
+    generate_variants(image_id, FAST_FORMATS)
+    if supported(SLOW_FORMATS):
+        submit(generate_variants, image_id, SLOW_FORMATS)
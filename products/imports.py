@@ -0,0 +1,282 @@
+"""
+Bulk product import from CSV or JSON lines.
+
+CSV columns (JSONL keys) are those of ProductImportRowSerializer; in CSV
+``categories`` is a "|" separated list of names and empty cells are left
+out. Rows with an ``id`` update that product, the others create one.
+
+Rows are read as a stream and handled ``chunk_size`` at a time, each chunk
+in its own transaction:
+
+* every row is validated, invalid rows are counted and skipped;
+* categories come from one name -> id map, missing ones are created in bulk;
+* products are written with bulk_create/bulk_update and their category
+  links with one bulk insert into the through table;
+* the job's rows_processed is saved in the same transaction, so after a
+  failure the import resumes right after the last committed chunk.
+
+Bulk writes don't send model signals, so each chunk reindexes its
+products for search and invalidates the catalog cache itself, and the
+suggestion index is rebuilt once the import finishes.
+
+A job is resumed only after claim() locked it and found it neither
+completed nor running (jobs whose last chunk is older than
+IMPORT_STALE_SECONDS count as crashed). Files larger than
+IMPORT_INLINE_MAX_BYTES are copied to a temporary file and imported by a
+small thread pool (IMPORT_WORKERS, 0 imports in the caller) so the
+request returns right away.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from . import cache as catalog_cache
+from . import search
+from . import suggest
+from .models import Category, ImportJob, Product
+from .serializers import ProductImportRowSerializer
+
+FILE_FORMATS = ("csv", "jsonl")
+CHUNK_SIZE = 1000
+# only the first errors are kept on the job, the rest are only counted
+MAX_STORED_ERRORS = 100
+CATEGORY_SEPARATOR = "|"
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class ImportConflict(Exception):
+    """
+    The job can't be resumed: it is completed or another import runs it
+    """
+
+
+def guess_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in FILE_FORMATS else None
+
+
+def _csv_row(row):
+    row = {key: value for key, value in row.items() if key and value not in ("", None)}
+    if "categories" in row:
+        row["categories"] = [name.strip() for name in row["categories"].split(CATEGORY_SEPARATOR)
+                             if name.strip()]
+    return row
+
+
+def read_rows(stream, file_format):
+    """
+    Yield the rows of a binary stream as dicts, None for unreadable lines
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if file_format == "csv":
+            for row in csv.DictReader(text):
+                yield _csv_row(row)
+            return
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    finally:
+        # don't let the wrapper close the caller's stream
+        text.detach()
+
+
+def _record_error(job, row_number, errors):
+    job.error_count += 1
+    if len(job.errors) < MAX_STORED_ERRORS:
+        job.errors.append({"row": row_number, "errors": errors})
+
+
+def _validate(job, chunk, first_row):
+    valid = []
+    for row_number, raw in enumerate(chunk, start=first_row):
+        if raw is None:
+            _record_error(job, row_number, {"non_field_errors": ["Not a JSON object."]})
+            continue
+        serializer = ProductImportRowSerializer(data=raw, partial=bool(raw.get("id")))
+        if serializer.is_valid():
+            valid.append((row_number, serializer.validated_data))
+        else:
+            _record_error(job, row_number, serializer.errors)
+    return valid
+
+
+def _resolve_categories(names, categories):
+    """
+    Add ids for ``names`` to the lowercased name -> id map, creating missing categories
+    """
+    missing = {name.lower(): name for name in names if name.lower() not in categories}
+    if not missing:
+        return
+    Category.objects.bulk_create([Category(name=name) for name in missing.values()], ignore_conflicts=True)
+    for pk, name in Category.objects.filter(name__in=missing.values()).values_list("pk", "name"):
+        categories[name.lower()] = pk
+
+
+def import_chunk(job, chunk, first_row, categories):
+    """
+    Write one chunk of raw rows; returns the ids of the created and updated products
+    """
+    valid = _validate(job, chunk, first_row)
+    _resolve_categories({name for _, data in valid for name in data.get("categories", [])}, categories)
+    existing = Product.objects.in_bulk({data["id"] for _, data in valid if data.get("id")})
+
+    to_create, to_update, links = [], {}, {}
+    for row_number, data in valid:
+        data = dict(data)
+        pk = data.pop("id", None)
+        names = data.pop("categories", None)
+        category_ids = None if names is None else {categories[name.lower()] for name in names}
+        if not pk:
+            to_create.append((Product(**data), category_ids or set()))
+            continue
+        product = existing.get(pk)
+        if product is None:
+            _record_error(job, row_number, {"id": [f"No product with id {pk}."]})
+            continue
+        for field, value in data.items():
+            setattr(product, field, value)
+        to_update[pk] = product
+        if category_ids is not None:
+            links[pk] = category_ids
+
+    created = Product.objects.bulk_create([product for product, _ in to_create])
+    for product, category_ids in zip(created, (ids for _, ids in to_create)):
+        links[product.pk] = category_ids
+
+    if to_update:
+        now = timezone.now()
+        fields = {"updated_at"}
+        for _, data in valid:
+            if data.get("id") in to_update:
+                fields.update(name for name in data if name not in ("id", "categories"))
+        for product in to_update.values():
+            product.updated_at = now
+        Product.objects.bulk_update(list(to_update.values()), sorted(fields))
+
+    through = Product.category.through
+    # updated products get exactly the categories of their row
+    through.objects.filter(product_id__in=[pk for pk in links if pk in to_update]).delete()
+    through.objects.bulk_create(
+        [through(product_id=pk, category_id=category_id)
+         for pk, category_ids in links.items() for category_id in category_ids],
+        ignore_conflicts=True,
+    )
+    job.created_count += len(created)
+    job.updated_count += len(to_update)
+    return [product.pk for product in created], list(to_update)
+
+
+def _invalidate(updated_ids):
+    # new products have no cached detail yet, only the lists change
+    for pk in updated_ids:
+        catalog_cache.bump_product(pk)
+    catalog_cache.bump_generation()
+
+
+def run_import(job, stream, chunk_size=CHUNK_SIZE):
+    """
+    Import rows from ``stream`` (binary) into ``job``, resuming after
+    job.rows_processed
+    """
+    rows = islice(read_rows(stream, job.file_format), job.rows_processed, None)
+    categories = {name.lower(): pk for pk, name in Category.objects.values_list("pk", "name")}
+    job.status = "running"
+    job.message = ""
+    job.save(update_fields=["status", "message", "updated_at"])
+
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                created_ids, updated_ids = import_chunk(job, chunk, job.rows_processed + 1, categories)
+                search.index_products(created_ids + updated_ids)
+                job.rows_processed += len(chunk)
+                job.save()
+                transaction.on_commit(partial(_invalidate, updated_ids))
+    except Exception as error:
+        # categories created by the failed chunk were rolled back with it
+        job.refresh_from_db()
+        job.status = "failed"
+        job.message = f"{type(error).__name__}: {error}"
+        job.save(update_fields=["status", "message", "updated_at"])
+        raise
+    finally:
+        suggest.bump_version()
+
+    job.status = "completed"
+    job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def start_import(stream, source, file_format, user=None, chunk_size=CHUNK_SIZE):
+    job = ImportJob.objects.create(source=source, file_format=file_format, created_by=user)
+    return run_import(job, stream, chunk_size)
+
+
+def claim(pk):
+    """
+    Lock import job ``pk`` and mark it running so only one request resumes
+    it; raises ImportJob.DoesNotExist or ImportConflict
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, "IMPORT_STALE_SECONDS", 10 * 60))
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=pk)
+        if job.status == "completed":
+            raise ImportConflict("this import is already completed")
+        if job.status == "running" and job.updated_at > stale:
+            raise ImportConflict("this import is still running")
+        job.status = "running"
+        job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def runs_in_background(size):
+    return bool(getattr(settings, "IMPORT_WORKERS", 1)) and \
+        size > getattr(settings, "IMPORT_INLINE_MAX_BYTES", 5 * 1024 * 1024)
+
+
+def _import_file(job_id, path, chunk_size):
+    try:
+        with open(path, "rb") as stream:
+            run_import(ImportJob.objects.get(pk=job_id), stream, chunk_size)
+    except Exception:
+        # the failure and the resume point are recorded on the job
+        logger.exception("Import job %s failed", job_id)
+    finally:
+        os.remove(path)
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def submit(job, stream, chunk_size=CHUNK_SIZE):
+    """
+    Copy ``stream`` to a temporary file and import it on a worker thread
+    """
+    global _executor
+    with tempfile.NamedTemporaryFile(prefix=f"import-{job.pk}-", delete=False) as copy:
+        shutil.copyfileobj(stream, copy)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, "IMPORT_WORKERS", 1),
+                                       thread_name_prefix="product-imports")
+    _executor.submit(_import_file, job.pk, copy.name, chunk_size)
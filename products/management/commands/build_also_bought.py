@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from products.recommendations import refresh_also_bought
+
+
+class Command(BaseCommand):
+    help = "Rebuild the 'customers also bought' table from paid order lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--per-product", type=int, default=8,
+                            help="Number of recommendations stored per product")
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="Order lines fetched from the database per round trip")
+        parser.add_argument("--max-pairs", type=int, default=2_000_000,
+                            help="Upper bound on co-occurrence cells held in memory")
+
+    def handle(self, *args, **options):
+        count, error = refresh_also_bought(per_product=options["per_product"],
+                                    chunk_size=options["chunk_size"],
+                                    max_pairs=options["max_pairs"])
+        self.stdout.write(self.style.SUCCESS(f"Also-bought recommendations rebuilt for {count} products"))
+        if error:
+            self.stdout.write(self.style.WARNING(
+                f"Pairs were pruned to fit --max-pairs, counts may be up to {error} too low"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from products.related import is_stale, refresh_related
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the precomputed related products table. "
+            "Meant to be run from cron; it does nothing while the table is younger "
+            "than RELATED_PRODUCTS_REFRESH_SECONDS unless --force is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true",
+                            help="Rebuild even if the table is still fresh")
+        parser.add_argument("--per-product", type=int, default=None,
+                            help="Number of related products stored per product")
+
+    def handle(self, *args, **options):
+        if not options["force"] and not is_stale():
+            self.stdout.write("Related products are still fresh, skipping")
+            return
+        count = refresh_related(per_product=options["per_product"])
+        self.stdout.write(self.style.SUCCESS(f"Related products rebuilt for {count} products"))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from Blog.models import BlogPost
+from products import cache as catalog_cache
+from products.models import Product, ProductImage
+from products.stats import refresh_main_image
+
+
+class Command(BaseCommand):
+    help = ("Move product and blog images stored before content addressed storage into "
+            "deduplicated blobs and delete the original files")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Number of rows loaded per query")
+
+    def handle(self, *args, **options):
+        moved = 0
+        product_ids = set()
+        for model, field_name in [(ProductImage, "images"), (BlogPost, "image")]:
+            storage = model._meta.get_field(field_name).storage
+            rows = model.objects.exclude(**{field_name: ""}).exclude(**{field_name: None}).order_by("pk")
+            for row in rows.iterator(chunk_size=options["batch_size"]):
+                old_name = getattr(row, field_name).name
+                if storage.is_blob(old_name) or not storage.exists(old_name):
+                    continue
+                with storage.open(old_name, "rb") as file:
+                    new_name = storage.save(old_name, file)
+                changes = {field_name: new_name}
+                if model is ProductImage and row.variants.get("source") == old_name:
+                    changes["variants"] = {**row.variants, "source": new_name}
+                if model is BlogPost:
+                    # the post's image url changed, conditional GETs must see it
+                    changes["updated_at"] = timezone.now()
+                # queryset update, so the file signals don't release anything
+                model.objects.filter(pk=row.pk).update(**changes)
+                storage.delete(old_name)
+                if model is ProductImage:
+                    # the product's main image url and the cached representations
+                    # still point at the deleted file
+                    if row.is_main:
+                        refresh_main_image(row.product_id)
+                    else:
+                        Product.objects.filter(pk=row.product_id).touch()
+                    product_ids.add(row.product_id)
+                moved += 1
+        if product_ids:
+            catalog_cache.bump_products(product_ids)
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files into content addressed storage"))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from products import feeds
+
+
+class Command(BaseCommand):
+    help = "Write the product feed (csv, jsonl or xml) to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("feed_format", choices=sorted(feeds.FEED_FORMATS))
+        parser.add_argument("--output", "-o", help="File to write, stdout when omitted")
+        parser.add_argument("--since", help="Only export products updated at or after this ISO date/datetime")
+        parser.add_argument("--site-url", default=getattr(settings, "PRODUCT_FEED_SITE_URL", ""),
+                            help="Prefix for product links and image urls")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Number of products loaded per query")
+
+    def handle(self, *args, **options):
+        try:
+            since = feeds.parse_since(options["since"]) if options["since"] else None
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        chunks = feeds.generate_feed(options["feed_format"], since, options["site_url"], options["chunk_size"])
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Feed written to {options['output']}"))
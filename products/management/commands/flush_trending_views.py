@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.trending import flush_views
+
+
+class Command(BaseCommand):
+    help = "Add the product views counted in the cache to the trending scores"
+
+    def handle(self, *args, **options):
+        count = flush_views()
+        self.stdout.write(self.style.SUCCESS(f"Views flushed for {count} products"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from products import images
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Generate the resized JPEG/WebP/AVIF copies of product images that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true",
+                            help="Regenerate the variants of every image")
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Number of images loaded per query")
+
+    def handle(self, *args, **options):
+        formats = images.FAST_FORMATS + images.SLOW_FORMATS
+        done = 0
+        queryset = ProductImage.objects.only("id", "images", "variants").order_by("id")
+        for image in queryset.iterator(chunk_size=options["batch_size"]):
+            if not image.images:
+                continue
+            if options["force"]:
+                ProductImage.objects.filter(pk=image.pk).update(variants={})
+                images.delete_variants(image.images.storage, image.variants)
+            elif image.variants.get("source") == image.images.name:
+                continue
+            images.generate_variants(image.pk, formats)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} images"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from products import imports
+from products.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV or JSON lines file in chunked, resumable transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import")
+        parser.add_argument("--format", dest="file_format", choices=imports.FILE_FORMATS,
+                            help="Input format, guessed from the file extension by default")
+        parser.add_argument("--chunk-size", type=int, default=imports.CHUNK_SIZE,
+                            help="Number of rows written per transaction")
+        parser.add_argument("--resume", type=int, metavar="JOB_ID",
+                            help="Continue a failed import of the same file after its last committed row")
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            try:
+                job = imports.claim(options["resume"])
+            except ImportJob.DoesNotExist:
+                raise CommandError(f"No import job with id {options['resume']}")
+            except imports.ImportConflict as error:
+                raise CommandError(f"Import job {options['resume']}: {error}")
+        else:
+            file_format = options["file_format"] or imports.guess_format(options["path"])
+            if file_format is None:
+                raise CommandError("Can't tell the file format from its name, pass --format")
+            job = ImportJob.objects.create(source=options["path"], file_format=file_format)
+
+        try:
+            with open(options["path"], "rb") as stream:
+                imports.run_import(job, stream, options["chunk_size"])
+        except Exception as error:
+            raise CommandError(f"Import job {job.pk} failed after row {job.rows_processed}: {error}. "
+                               f"Fix the cause and rerun with --resume {job.pk}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import job {job.pk}: {job.created_count} created, {job.updated_count} updated, "
+            f"{job.error_count} invalid rows"))
+        for error in job.errors:
+            self.stdout.write(f"  row {error['row']}: {error['errors']}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.stats import rebuild_product_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating, review, sales and main image columns on Product"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of products written per batch")
+
+    def handle(self, *args, **options):
+        rebuild_product_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Product stats rebuilt"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.trending import rebuild_scores
+
+
+class Command(BaseCommand):
+    help = "Recompute trending scores from order and review history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Number of rows read and written per batch")
+
+    def handle(self, *args, **options):
+        rebuild_scores(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Trending scores rebuilt"))
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:47
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_stats(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    Review = apps.get_model('products', 'Review')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    sales = OrderItem.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        avg_rating=Coalesce(Subquery(reviews.annotate(avg=Avg('rating')).values('avg')), Value(0.0)),
+        review_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')),
+                              Value(0), output_field=IntegerField()),
+        total_sold=Coalesce(Subquery(sales.annotate(total=Sum('quantity')).values('total')),
+                            Value(0), output_field=IntegerField()),
+    )
+    seen = set()
+    for image in ProductImage.objects.filter(is_main=True).order_by('product_id', 'id').iterator():
+        if image.product_id in seen or not image.images:
+            continue
+        seen.add(image.product_id)
+        Product.objects.filter(pk=image.product_id).update(main_image_url=image.images.url)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_productimage_review'),
+        ('orders', '0011_order_total_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='main_image_url',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_sold',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_product_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from products.search import install_schema, uninstall_schema
+
+
+def create_search_index(apps, schema_editor):
+    install_schema(schema_editor)
+
+    Product = apps.get_model('products', 'Product')
+    ProductSearchDocument = apps.get_model('products', 'ProductSearchDocument')
+    documents = [
+        ProductSearchDocument(
+            product_id=product.pk,
+            name=product.name,
+            description=product.product_description or '',
+            manufacturer=product.manufacturer or '',
+            categories=' '.join(c.name for c in product.category.all()),
+        )
+        for product in Product.objects.prefetch_related('category')
+    ]
+    ProductSearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_schema(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, default='')),
+                ('manufacturer', models.CharField(blank=True, default='', max_length=50)),
+                ('categories', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
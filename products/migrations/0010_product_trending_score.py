@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_alsoboughtproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0, help_text='Log of the time-decayed activity score, see products.trending'),
+        ),
+    ]
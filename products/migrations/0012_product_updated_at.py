@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 16:01
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # the best lower bound we have for rows that predate the column
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(updated_at=F('added_on'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
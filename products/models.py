@@ -1,6 +1,11 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Round
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import User
+from .storage import get_media_storage
 
 # Create your models here.
 
@@ -20,6 +25,25 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """
+    Queryset helpers for loading products the way the API serializes them.
+    """
+    def with_related(self):
+        """
+        Prefetch images and categories so serializing a page of products
+        costs a fixed number of queries instead of a few per product.
+        """
+        return self.prefetch_related("images", "category")
+
+    def touch(self):
+        """
+        Bump updated_at without saving (and without sending signals), for
+        changes to related rows that show up in the product's representation
+        """
+        return self.update(updated_at=timezone.now())
+
+
 class Product(models.Model):
     """
     Represents a product available in the store.
@@ -31,10 +55,16 @@ class Product(models.Model):
         discount_percentage: Optional discount as a percentage.
         stock: Available quantity.
         category: The category this product belongs to.
+        avg_rating, review_count, total_sold, main_image_url,
+            main_image_variants: Denormalized stats kept up to date by
+            signals (see products.stats).
+        effective_price: The price after discount, computed and stored by
+            the database so it can be indexed, filtered and sorted on.
     """
     name = models.CharField(max_length=100)
     category = models.ManyToManyField(Category, help_text="Category will be returned as a list of category IDs")
     added_on = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     product_description = models.TextField(null=True, blank=True)
     manufacturer = models.CharField(max_length=50)
     warranty = models.IntegerField(null=True, blank=True,
@@ -44,9 +74,27 @@ class Product(models.Model):
     original_price = models.DecimalField(decimal_places=2, max_digits=7)
     discount = models.DecimalField(decimal_places=0, max_digits=5, default=0, help_text="Discount percentage (e.g. 10 = 10%)")
     stock = models.PositiveIntegerField(default=1)
+    effective_price = models.GeneratedField(
+        # multiplied by 0.01 rather than divided by 100: SQLite would do integer division
+        expression=Round(F("original_price") * (Value(100) - F("discount")) * Value(Decimal("0.01")), 2),
+        output_field=models.DecimalField(decimal_places=2, max_digits=9),
+        db_persist=True,
+        db_index=True,
+    )
+    avg_rating = models.FloatField(default=0, db_index=True)
+    review_count = models.PositiveIntegerField(default=0)
+    total_sold = models.PositiveIntegerField(default=0, db_index=True)
+    main_image_url = models.CharField(max_length=255, blank=True, default="")
+    main_image_variants = models.JSONField(default=dict, blank=True,
+                                           help_text="Urls of the main image's resized copies")
+    trending_score = models.FloatField(default=0, db_index=True,
+                                       help_text="Log of the time-decayed activity score, see products.trending")
+
+    objects = ProductQuerySet.as_manager()
 
     @property
     def discounted_price(self):
+        # same value as effective_price, but usable before the row is saved
         return self.original_price * (1 - (self.discount / 100))
 
     def __str__(self):
@@ -58,10 +106,25 @@ class ProductImage(models.Model):
     Model to facilate adding images to products
     """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
-    images = models.ImageField(upload_to=image_upload_path)
+    images = models.ImageField(upload_to=image_upload_path, storage=get_media_storage)
     is_main = models.BooleanField(default=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
+    variants = models.JSONField(default=dict, blank=True,
+                                help_text="Storage names of the resized copies, see products.images")
+
+    def variant_urls(self):
+        """
+        {size: {"width": .., "height": .., format: url}} for the generated variants
+        """
+        if not self.images or self.variants.get("source") != self.images.name:
+            return {}
+        storage = self.images.storage
+        return {
+            size: {key: value if key in ("width", "height") else storage.url(value)
+                   for key, value in entry.items()}
+            for size, entry in self.variants.items() if size != "source"
+        }
 
     def __str__(self):
         return f"{self.product.name}-image-{self.id} - {('Main' if self.is_main else 'Image')}"
@@ -85,3 +148,110 @@ class Review(models.Model):
     def __str__(self):
         return f"Review for {self.product.name} - {self.id}"
     
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Flattened, searchable text of a product.
+    Kept in sync by signals and indexed by FTS5 (SQLite) or a GIN
+    tsvector index (PostgreSQL); see products.search.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   related_name="search_document")
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True, default="")
+    manufacturer = models.CharField(max_length=50, blank=True, default="")
+    categories = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.name}"
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "related products" for a product, best first.
+    Built from shared categories, manufacturer and price proximity by the
+    build_related_products command; see products.related.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="related_entries")
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "rank"], name="unique_rank_per_related_product")
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class AlsoBoughtProduct(models.Model):
+    """
+    "Customers also bought" entries for a product, best first.
+    Built from order line co-occurrence by the build_also_bought command;
+    see products.recommendations.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="also_bought_entries")
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    orders_together = models.PositiveIntegerField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "rank"], name="unique_rank_per_also_bought_product")
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} (#{self.rank})"
+
+
+IMPORT_STATUS_CHOICES = (
+    ("running", "Running"),
+    ("completed", "Completed"),
+    ("failed", "Failed"),
+)
+
+class ImportJob(models.Model):
+    """
+    A bulk product import, see products.imports.
+    rows_processed is saved in the same transaction as each chunk, so a
+    failed import can be resumed from the last committed row.
+    """
+    source = models.CharField(max_length=255)
+    file_format = models.CharField(max_length=10)
+    status = models.CharField(max_length=20, choices=IMPORT_STATUS_CHOICES, default="running")
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="The first invalid rows and why")
+    message = models.TextField(blank=True, default="")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name="import_jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import {self.id} of {self.source} ({self.status})"
+
+
+class StoredBlob(models.Model):
+    """
+    One distinct uploaded file kept by the content addressed media storage
+    (products.storage). ``refcount`` is the number of file fields pointing
+    at it; the file is deleted when it drops to zero.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
@@ -1,5 +1,219 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Planner row estimate on PostgreSQL; exact count everywhere else
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination.
+    ?count=estimate uses the planner's row estimate instead of COUNT(*),
+    ?count=none skips counting and only reports whether a next page exists.
+    """
     page_size_query_param = "limit"
-    max_page_size = 50
\ No newline at end of file
+    max_page_size = 50
+    count_query_param = "count"
+    count_modes = ("exact", "estimate", "none")
+    default_count_mode = "exact"
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode)
+        return mode if mode in self.count_modes else self.default_count_mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = self.get_count_mode(request)
+        if self.count_mode == "none":
+            return self.paginate_without_count(queryset, request)
+        self.django_paginator_class = (EstimatedCountPaginator if self.count_mode == "estimate"
+                                       else DjangoPaginator)
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_without_count(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number="", message="Invalid page."))
+        offset = (self.page_number - 1) * page_size
+        # one extra row tells us whether there is a next page
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.count_mode != "none":
+            return super().get_paginated_response(data)
+        url = self.request.build_absolute_uri()
+        next_url = replace_query_param(url, self.page_query_param, self.page_number + 1) if self.has_next else None
+        previous_url = None
+        if self.page_number == 2:
+            previous_url = remove_query_param(url, self.page_query_param)
+        elif self.page_number > 2:
+            previous_url = replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return Response({
+            "count": None,
+            "next": next_url,
+            "previous": previous_url,
+            "results": data,
+        })
+
+
+class KeysetPagination(CustomPagination):
+    """
+    Page number pagination that switches to keyset (cursor) pagination
+    when ?cursor= is present (empty for the first page).
+
+    The cursor holds the ordering values of the last row returned, so the
+    next page is a WHERE (added_on, id) < (...) range scan instead of an
+    OFFSET, and deep pages cost the same as the first. The id is always
+    added as a tie breaker. Counting is skipped unless ?count= asks for it.
+    Orderings on expressions or related fields fall back to page numbers.
+    With keyset_by_default the cursor is used unless ?page= is given.
+    """
+    cursor_query_param = "cursor"
+    keyset_by_default = False
+
+    def uses_keyset(self, request):
+        if self.cursor_query_param in request.query_params:
+            return True
+        return self.keyset_by_default and self.page_query_param not in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if not self.uses_keyset(request):
+            return super().paginate_queryset(queryset, request, view)
+        ordering = self.get_keyset_ordering(queryset)
+        if ordering is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.keyset = ordering
+        self.count_mode = request.query_params.get(self.count_query_param, "none")
+        self.count = None
+        if self.count_mode == "exact":
+            self.count = queryset.count()
+        elif self.count_mode == "estimate":
+            self.count = estimate_count(queryset)
+
+        page_size = self.get_page_size(request)
+        values, backwards = self.decode_cursor(request, queryset.model)
+        if backwards:
+            queryset = queryset.order_by(*[self.flip(field) for field in ordering])
+        else:
+            queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values, backwards))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+        self.next_row = rows[-1] if rows and (has_more or backwards) else None
+        self.previous_row = rows[0] if rows and (values is not None and (not backwards or has_more)) else None
+        return rows
+
+    def get_keyset_ordering(self, queryset):
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+        fields["pk"] = queryset.model._meta.pk
+        for item in ordering:
+            if not isinstance(item, str) or item.lstrip("-") not in fields:
+                return None
+        names = [item.lstrip("-") for item in ordering]
+        if "pk" not in names and "id" not in names:
+            descending = bool(ordering) and ordering[0].startswith("-")
+            ordering.append("-pk" if descending else "pk")
+        return ordering
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def after(ordering, values, backwards):
+        """
+        Lexicographic "comes after" condition:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != backwards
+            condition |= equal & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, row, backwards):
+        values = []
+        for field in self.keyset:
+            value = getattr(row, field.lstrip("-"))
+            values.append(value.isoformat() if hasattr(value, "isoformat") else
+                          value if isinstance(value, (int, float, str)) or value is None else str(value))
+        token = json.dumps({"v": values, "b": backwards}, separators=(",", ":"))
+        return urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            fields = [model._meta.pk if field.lstrip("-") == "pk" else model._meta.get_field(field.lstrip("-"))
+                      for field in self.keyset]
+            # generated columns convert values through their output field
+            values = [getattr(field, "output_field", field).to_python(value)
+                      for field, value in zip(fields, data["v"])]
+            if len(values) != len(self.keyset):
+                raise ValueError
+            return values, bool(data.get("b"))
+        except Exception:
+            raise NotFound("Invalid cursor.")
+
+    def cursor_url(self, row, backwards):
+        if row is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, backwards))
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return Response({
+            "count": self.count,
+            "next": self.cursor_url(self.next_row, False),
+            "previous": self.cursor_url(self.previous_row, True),
+            "results": data,
+        })
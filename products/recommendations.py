@@ -0,0 +1,117 @@
+"""
+"Customers also bought" batch recommender.
+
+Order lines of sold orders are streamed in order_id order, so only one
+basket is held at a time. Every pair of products in a basket increments
+one cell of a sparse product x product co-occurrence matrix, stored as a
+Counter of (low_id, high_id) keys since the matrix is symmetric.
+
+Memory is bounded by ``max_pairs``: when the matrix grows past it, only
+the ``max_pairs // 2`` most frequent cells are kept (lossy counting). A
+dropped pair starts again from zero if it shows up later, so each prune
+can make a count at most the highest dropped count too low; their sum is
+returned as the error bound of the run. Rare pairs are the ones least
+likely to reach anyone's top K, so frequent pairs are ranked the same as
+with exact counts whenever their gaps exceed that bound. The top K
+neighbours per product are written to AlsoBoughtProduct, which the API
+reads with one indexed lookup.
+"""
+import heapq
+from collections import Counter, defaultdict
+from itertools import combinations
+from operator import itemgetter
+from django.db import transaction
+from django.utils import timezone
+from .models import AlsoBoughtProduct
+
+MAX_BASKET = 50
+
+
+def _prune(pairs, keep):
+    """
+    Keep the ``keep`` most frequent cells; returns the highest count dropped
+    """
+    if len(pairs) <= keep:
+        return 0
+    kept = dict(heapq.nlargest(keep, pairs.items(), key=itemgetter(1)))
+    dropped = max(count for key, count in pairs.items() if key not in kept)
+    pairs.clear()
+    pairs.update(kept)
+    return dropped
+
+
+def count_co_occurrences(chunk_size=5000, max_pairs=2_000_000):
+    """
+    Return the co-occurrence counts and how far below the true counts they may be
+    """
+    from orders.models import OrderItem, SOLD_STATUSES
+
+    pairs = Counter()
+    error = 0
+    lines = (OrderItem.objects.filter(order__status__in=SOLD_STATUSES)
+             .order_by("order_id")
+             .values_list("order_id", "product_id", "quantity", "price_at_purchase"))
+
+    def add_basket(basket):
+        # an order can't hold the same product twice, but cap huge baskets
+        # so one wholesale order can't blow up the matrix; the lines worth
+        # the most are the ones kept
+        if len(basket) > MAX_BASKET:
+            basket = heapq.nlargest(MAX_BASKET, basket, key=basket.get)
+        for pair in combinations(sorted(basket), 2):
+            pairs[pair] += 1
+
+    current_order, basket = None, {}
+    for order_id, product_id, quantity, price in lines.iterator(chunk_size=chunk_size):
+        if order_id != current_order:
+            add_basket(basket)
+            current_order, basket = order_id, {}
+            if len(pairs) > max_pairs:
+                error += _prune(pairs, max_pairs // 2)
+        basket[product_id] = quantity * price
+    add_basket(basket)
+    return pairs, error
+
+
+def top_neighbours(pairs, per_product=8):
+    """
+    Return {product_id: [(other_id, count), ...]} best first
+    """
+    heaps = defaultdict(list)
+    for (a, b), count in pairs.items():
+        for product, other in ((a, b), (b, a)):
+            heap = heaps[product]
+            entry = (count, -other)
+            if len(heap) < per_product:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+    return {
+        product: [(-other, count) for count, other in sorted(heap, reverse=True)]
+        for product, heap in heaps.items()
+    }
+
+
+def refresh_also_bought(per_product=8, chunk_size=5000, max_pairs=2_000_000, batch_size=500):
+    """
+    Rebuild AlsoBoughtProduct from order history; returns the number of
+    products and the error bound of the counts
+    """
+    pairs, error = count_co_occurrences(chunk_size, max_pairs)
+    neighbours = top_neighbours(pairs, per_product)
+    computed_at = timezone.now()
+    product_ids = sorted(neighbours)
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        rows = [
+            AlsoBoughtProduct(product_id=pk, recommended_id=other, rank=rank,
+                              orders_together=count, computed_at=computed_at)
+            for pk in chunk
+            for rank, (other, count) in enumerate(neighbours[pk])
+        ]
+        with transaction.atomic():
+            AlsoBoughtProduct.objects.filter(product_id__in=chunk).delete()
+            AlsoBoughtProduct.objects.bulk_create(rows)
+    # products that no longer have any co-purchases
+    AlsoBoughtProduct.objects.filter(computed_at__lt=computed_at).delete()
+    return len(product_ids), error
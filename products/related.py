@@ -0,0 +1,108 @@
+"""
+Batch job behind the RelatedProduct table.
+
+Two products are related when they share categories or a manufacturer;
+closer prices rank higher. Candidates are only taken from a window of the
+nearest-priced products in each group, which keeps the job roughly linear
+in the catalog size even when a category holds most of the products.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Product, RelatedProduct
+
+CATEGORY_WEIGHT = 2.0
+MANUFACTURER_WEIGHT = 1.0
+PRICE_WEIGHT = 1.0
+
+
+def get_refresh_interval():
+    return timedelta(seconds=getattr(settings, "RELATED_PRODUCTS_REFRESH_SECONDS", 6 * 60 * 60))
+
+
+def is_stale():
+    """
+    True when the table is empty or older than RELATED_PRODUCTS_REFRESH_SECONDS
+    """
+    latest = RelatedProduct.objects.order_by("-computed_at").values_list("computed_at", flat=True).first()
+    return latest is None or timezone.now() - latest >= get_refresh_interval()
+
+
+def _neighbours(group, prices, window):
+    """
+    Yield (product, candidate) pairs for the ``window`` nearest-priced
+    members on either side of each product in ``group``
+    """
+    members = sorted(group, key=lambda pk: prices[pk])
+    for i, pk in enumerate(members):
+        for other in members[max(0, i - window):i + window + 1]:
+            if other != pk:
+                yield pk, other
+
+
+def compute_related(per_product=8, window=50):
+    """
+    Return {product_id: [(related_id, score), ...]} best first
+    """
+    prices, manufacturers = {}, defaultdict(set)
+    for pk, manufacturer, original_price, discount in Product.objects.values_list(
+            "pk", "manufacturer", "original_price", "discount").iterator(chunk_size=5000):
+        prices[pk] = float(original_price * (1 - discount / 100))
+        manufacturers[(manufacturer or "").lower()].add(pk)
+
+    categories = defaultdict(set)
+    product_categories = Product.category.through.objects.values_list("product_id", "category_id")
+    for product_id, category_id in product_categories.iterator(chunk_size=5000):
+        categories[category_id].add(product_id)
+
+    shared_categories = defaultdict(lambda: defaultdict(int))
+    for group in categories.values():
+        for pk, other in _neighbours(group, prices, window):
+            shared_categories[pk][other] += 1
+
+    same_manufacturer = defaultdict(set)
+    for name, group in manufacturers.items():
+        if not name:
+            continue
+        for pk, other in _neighbours(group, prices, window):
+            same_manufacturer[pk].add(other)
+
+    related = {}
+    for pk in prices:
+        candidates = set(shared_categories[pk]) | same_manufacturer[pk]
+        scored = []
+        for other in candidates:
+            high = max(prices[pk], prices[other]) or 1
+            proximity = 1 - abs(prices[pk] - prices[other]) / high
+            score = (CATEGORY_WEIGHT * shared_categories[pk].get(other, 0)
+                     + MANUFACTURER_WEIGHT * (other in same_manufacturer[pk])
+                     + PRICE_WEIGHT * proximity)
+            scored.append((other, score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        related[pk] = scored[:per_product]
+    return related
+
+
+def refresh_related(per_product=None, batch_size=500):
+    """
+    Recompute the RelatedProduct table, replacing rows a batch of products at a time
+    so readers never see a product without its related entries for long
+    """
+    per_product = per_product or getattr(settings, "RELATED_PRODUCTS_PER_PRODUCT", 8)
+    related = compute_related(per_product=per_product)
+    computed_at = timezone.now()
+    product_ids = sorted(related)
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        rows = [
+            RelatedProduct(product_id=pk, related_id=other, rank=rank, score=score,
+                           computed_at=computed_at)
+            for pk in chunk
+            for rank, (other, score) in enumerate(related[pk])
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(rows)
+    return len(product_ids)
@@ -0,0 +1,227 @@
+"""
+Full-text product search.
+
+Products are flattened into ProductSearchDocument rows (name, description,
+manufacturer and category names). The database indexes them natively:
+
+* SQLite: an external-content FTS5 table kept in sync by triggers,
+  ranked with bm25().
+* PostgreSQL: a weighted tsvector expression with a GIN index, ranked
+  with ts_rank().
+
+Any other database (or an SQLite build without FTS5) falls back to
+icontains lookups on the document table.
+"""
+import re
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, FloatField, Func, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from .models import Product, ProductSearchDocument
+
+FTS_TABLE = "products_search_fts"
+DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+
+# the same expression must be used by the GIN index and by the query
+PG_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(categories, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(manufacturer, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, manufacturer, categories,
+        content='{DOCUMENT_TABLE}', content_rowid='product_id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description, manufacturer, categories)
+        VALUES (new.product_id, new.name, new.description, new.manufacturer, new.categories);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, manufacturer, categories)
+        VALUES ('delete', old.product_id, old.name, old.description, old.manufacturer, old.categories);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, manufacturer, categories)
+        VALUES ('delete', old.product_id, old.name, old.description, old.manufacturer, old.categories);
+        INSERT INTO {FTS_TABLE}(rowid, name, description, manufacturer, categories)
+        VALUES (new.product_id, new.name, new.description, new.manufacturer, new.categories);
+    END""",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS products_search_vector_gin ON {DOCUMENT_TABLE} USING GIN (({PG_VECTOR}))",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS products_search_vector_gin",
+]
+
+
+def install_schema(schema_editor):
+    statements = {"sqlite": SQLITE_SCHEMA, "postgresql": POSTGRES_SCHEMA}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def uninstall_schema(schema_editor):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def _document_fields(product, category_names):
+    return {
+        "name": product.name,
+        "description": product.product_description or "",
+        "manufacturer": product.manufacturer or "",
+        "categories": " ".join(category_names),
+    }
+
+
+def index_products(product_ids):
+    """
+    Create or refresh the search documents for the given products
+    """
+    product_ids = list(product_ids)
+    products = Product.objects.filter(pk__in=product_ids).prefetch_related("category")
+    existing = set(ProductSearchDocument.objects.filter(product_id__in=product_ids)
+                   .values_list("product_id", flat=True))
+    for product in products:
+        fields = _document_fields(product, [c.name for c in product.category.all()])
+        if product.pk in existing:
+            ProductSearchDocument.objects.filter(product_id=product.pk).update(**fields)
+        else:
+            ProductSearchDocument.objects.create(product_id=product.pk, **fields)
+
+
+def index_product(product_id):
+    index_products([product_id])
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Recreate every search document from the product table
+    """
+    ProductSearchDocument.objects.all().delete()
+    batch = []
+    products = Product.objects.prefetch_related("category").order_by("pk")
+    for product in products.iterator(chunk_size=batch_size):
+        fields = _document_fields(product, [c.name for c in product.category.all()])
+        batch.append(ProductSearchDocument(product_id=product.pk, **fields))
+        if len(batch) >= batch_size:
+            ProductSearchDocument.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ProductSearchDocument.objects.bulk_create(batch)
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+class IndexRank(Func):
+    """
+    Relevance of the current product row, computed by a correlated query
+    against the search index; ``sql`` refers to the product id as {pk}
+    """
+    output_field = FloatField()
+
+    def __init__(self, sql, params):
+        super().__init__(F("pk"))
+        self.rank_sql = sql
+        self.rank_params = params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        pk_sql, pk_params = compiler.compile(self.source_expressions[0])
+        return f"({self.rank_sql.format(pk=pk_sql)})", [*self.rank_params, *pk_params]
+
+
+def _search_sqlite(queryset, terms):
+    # quote every term so user input can't inject FTS5 syntax, and let the
+    # last one match as a prefix for partially typed words
+    match = " ".join(f'"{term}"' for term in terms) + "*"
+    matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    # bm25 is lower for better matches
+    rank = IndexRank(f"SELECT -bm25({FTS_TABLE}, 10.0, 1.0, 3.0, 5.0) FROM {FTS_TABLE} "
+                     f"WHERE {FTS_TABLE} MATCH %s AND rowid = {{pk}}", [match])
+    return queryset.filter(pk__in=matches), rank
+
+
+def _search_postgres(queryset, terms):
+    tsquery = " & ".join(f"{term}:*" for term in terms)
+    matches = RawSQL(f"SELECT product_id FROM {DOCUMENT_TABLE} "
+                     f"WHERE ({PG_VECTOR}) @@ to_tsquery('english', %s)", [tsquery])
+    rank = IndexRank(f"SELECT ts_rank({PG_VECTOR}, to_tsquery('english', %s)) FROM {DOCUMENT_TABLE} "
+                     f"WHERE product_id = {{pk}}", [tsquery])
+    return queryset.filter(pk__in=matches), rank
+
+
+def _search_fallback(queryset, terms):
+    for term in terms:
+        queryset = queryset.filter(
+            Q(search_document__name__icontains=term) | Q(search_document__description__icontains=term)
+            | Q(search_document__manufacturer__icontains=term)
+            | Q(search_document__categories__icontains=term)
+        )
+    # rank name matches above matches elsewhere in the document
+    name_match = Q()
+    for term in terms:
+        name_match &= Q(search_document__name__icontains=term)
+    return queryset, Case(When(name_match, then=1), default=0, output_field=IntegerField())
+
+
+_fts_ready = set()
+
+
+def _index_backend():
+    """
+    The native search of the current database, None when it can't be used
+    """
+    if connection.vendor == "postgresql":
+        return _search_postgres
+    if connection.vendor != "sqlite":
+        return None
+    if connection.alias not in _fts_ready:
+        try:
+            # savepoint so a failure doesn't poison an outer transaction
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SELECT rowid FROM {FTS_TABLE} LIMIT 0")
+        except DatabaseError:
+            # FTS5 not compiled in, or the index hasn't been created yet
+            return None
+        _fts_ready.add(connection.alias)
+    return _search_sqlite
+
+
+def filter_queryset(queryset, query, ranked=True):
+    """
+    Restrict ``queryset`` of products to those matching ``query``; with
+    ``ranked`` they are ordered best match first. The index is queried as
+    a subquery, so counts, filters and other orderings see every match.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset.none()
+    backend = _index_backend() or _search_fallback
+    queryset, rank = backend(queryset, terms)
+    if not ranked:
+        return queryset
+    return queryset.annotate(search_rank=rank).order_by("-search_rank", "pk")
+
+
+def search(query, limit=None):
+    """
+    Ids of the products matching ``query``, best match first
+    """
+    product_ids = filter_queryset(Product.objects.all(), query).values_list("pk", flat=True)
+    return list(product_ids[:limit] if limit else product_ids)
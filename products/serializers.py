@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Product, Category, ProductImage, Review
+from .models import Product, Category, ProductImage, Review, ImportJob
 from users.serializers import UserSerializer
+from .fieldsets import SparseFieldsetMixin
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -15,17 +16,24 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ProductImageSerializer(serializers.ModelSerializer):
     """
-    serialize the ProductImage model
+    serialize the ProductImage model, variants holds the urls of the
+    resized JPEG/WebP/AVIF copies (see products.images)
     """
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ["id", "is_main", "images", "uploaded_at"]
+        fields = ["id", "is_main", "images", "variants", "uploaded_at"]
+
+    def get_variants(self, obj):
+        return obj.variant_urls()
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     class converts complex Product object into simple json
     that the frontend can consume
+    Supports ?fields= and ?expand= (see products.fieldsets)
     """
     images = ProductImageSerializer(many=True, read_only=True)
     main_image = serializers.SerializerMethodField()
@@ -34,14 +42,34 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ["id", "name", "original_price", "discount", "discounted_price", 
-                  "manufacturer", "expiry_date", "category", "images", "main_image"]
+                  "manufacturer", "expiry_date", "category", "images", "main_image",
+                  "main_image_variants", "avg_rating", "review_count"]
+        read_only_fields = ["main_image_variants", "avg_rating", "review_count"]
+        field_requirements = {
+            "discounted_price": {"only": ["effective_price"]},
+            "main_image": {"only": ["main_image_url"]},
+        }
         
     def get_discounted_price(self, obj):
-        return obj.original_price * (1 - (obj.discount/100))
+        return obj.effective_price
     
     def get_main_image(self, obj):
-        main = obj.images.filter(is_main=True).first()
+        if obj.main_image_url or "images" not in getattr(obj, "_prefetched_objects_cache", {}):
+            return obj.main_image_url or None
+        # iterate over images.all() so a prefetched set is reused instead of
+        # issuing a new query per product
+        main = next((image for image in obj.images.all() if image.is_main), None)
         return main.images.url if main and main.images else None
+
+
+class ProductListSerializer(ProductSerializer):
+    """
+    compact product representation used by default for catalog lists,
+    other fields can still be requested with ?fields= or ?expand=
+    """
+    class Meta(ProductSerializer.Meta):
+        default_fields = ["id", "name", "original_price", "discount", "discounted_price", "main_image",
+                          "main_image_variants"]
     
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -52,4 +80,29 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ["id", "review_title", "comment", "rating", "created_at", "product", "customer"]
 
-    
\ No newline at end of file
+    
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """
+    validates one row of a bulk product import (see products.imports).
+    Rows with an id update that product and only change the columns given,
+    rows without one create a product.
+    """
+    id = serializers.IntegerField(required=False, allow_null=True)
+    name = serializers.CharField(max_length=100)
+    manufacturer = serializers.CharField(max_length=50)
+    original_price = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=0)
+    discount = serializers.DecimalField(max_digits=5, decimal_places=0, min_value=0, max_value=100, default=0)
+    stock = serializers.IntegerField(min_value=0, default=1)
+    product_description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    warranty = serializers.IntegerField(required=False, allow_null=True)
+    expiry_date = serializers.DateField(required=False, allow_null=True)
+    categories = serializers.ListField(child=serializers.CharField(max_length=50), default=list)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ["id", "source", "file_format", "status", "rows_processed", "created_count",
+                  "updated_count", "error_count", "errors", "message", "created_at", "updated_at"]
+        read_only_fields = fields
@@ -0,0 +1,133 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from . import cache as catalog_cache
+from .models import Category, Product, ProductImage, Review
+from .stats import refresh_review_stats, refresh_main_image
+from . import images
+from . import search
+from . import storage
+from . import suggest
+from . import trending
+
+@receiver([post_save, post_delete], sender=Review)
+def update_review_stats(sender, instance, **kwargs):
+    refresh_review_stats(instance.product_id)
+
+
+@receiver(post_save, sender=Review)
+def update_trending_on_review(sender, instance, created, **kwargs):
+    if created:
+        trending.record_review(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def update_main_image(sender, instance, **kwargs):
+    refresh_main_image(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_image_variants(sender, instance, **kwargs):
+    if instance.images and instance.variants.get("source") != instance.images.name:
+        transaction.on_commit(lambda: images.process_upload(instance.pk))
+
+
+@receiver(pre_delete, sender=ProductImage)
+def remember_image_variants(sender, instance, **kwargs):
+    # variants are written with queryset updates, the instance may not have them
+    instance._stored_variants = (sender.objects.filter(pk=instance.pk)
+                                 .values_list("variants", flat=True).first() or {})
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_variants(sender, instance, **kwargs):
+    variants = getattr(instance, "_stored_variants", instance.variants)
+    if variants:
+        storage = instance.images.storage
+        transaction.on_commit(lambda: images.delete_variants(storage, variants))
+
+
+@receiver(pre_save, sender=ProductImage)
+def release_replaced_image(sender, instance, **kwargs):
+    storage.release_replaced_file(sender, instance, "images", kwargs.get("update_fields"))
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image(sender, instance, **kwargs):
+    storage.release_file(instance, "images")
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    # wait for the commit so a concurrent read can't re-cache the old row
+    # under the new version; the pk is read now, deleting clears it
+    transaction.on_commit(partial(catalog_cache.bump_product, instance.pk))
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def invalidate_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    # reverse=True means the change was made from the Category side
+    product_ids = list(pk_set or []) if reverse else [instance.pk]
+    transaction.on_commit(partial(catalog_cache.bump_products, product_ids))
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def touch_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    # category ids are part of the representation, so conditional GETs must see the change
+    if action.startswith("post_"):
+        Product.objects.filter(pk__in=(pk_set or []) if reverse else [instance.pk]).touch()
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_product_children(sender, instance, **kwargs):
+    transaction.on_commit(lambda: catalog_cache.bump_product(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    transaction.on_commit(catalog_cache.bump_generation)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_product(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def index_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith("post_"):
+        search.index_products((pk_set or []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.product_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    # the through rows are gone by post_delete, so collect the ids first
+    instance._indexed_product_ids = list(instance.product_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_category_products(sender, instance, **kwargs):
+    search.index_products(getattr(instance, "_indexed_product_ids", []))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def update_product_suggestions(sender, instance, **kwargs):
+    # read now, deleting clears the instance's pk after the signal
+    name = None if kwargs.get("signal") is post_delete else instance.name
+    transaction.on_commit(partial(suggest.product_changed, instance.pk, name, instance.total_sold))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def update_category_suggestions(sender, instance, **kwargs):
+    name = None if kwargs.get("signal") is post_delete else instance.name
+    transaction.on_commit(partial(suggest.category_changed, instance.pk, name))
@@ -0,0 +1,102 @@
+from functools import partial
+from django.db import transaction
+from django.db.models import Avg, Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import cache as catalog_cache
+from . import suggest
+from .models import Product, ProductImage, Review
+
+
+def refresh_review_stats(product_id):
+    """
+    Recompute avg_rating and review_count for a single product.
+    Only that product's reviews are aggregated (indexed on product_id).
+    updated_at is bumped too since the reviews changed.
+    """
+    stats = Review.objects.filter(product_id=product_id).aggregate(
+        avg=Avg("rating"), count=Count("id")
+    )
+    Product.objects.filter(pk=product_id).update(
+        avg_rating=stats["avg"] or 0, review_count=stats["count"], updated_at=timezone.now()
+    )
+
+
+def refresh_sales_stats(product_id):
+    """
+    Recompute total_sold for a single product from the lines of its sold orders.
+    total_sold isn't serialized but lists can be ordered by it, so the
+    catalog generation and the best-seller boards are bumped once the
+    change is committed, and the change is logged for the suggestion index.
+    """
+    from orders import leaderboard
+    from orders.models import OrderItem, SOLD_STATUSES
+
+    sold = OrderItem.objects.filter(product_id=product_id, order__status__in=SOLD_STATUSES)
+    total = sold.aggregate(
+        total=Sum("quantity")
+    )["total"] or 0
+    if Product.objects.filter(pk=product_id).exclude(total_sold=total).update(total_sold=total):
+        transaction.on_commit(catalog_cache.bump_generation)
+        transaction.on_commit(leaderboard.bump_version)
+        # suggestions are ranked by total_sold
+        transaction.on_commit(partial(suggest.sales_changed, product_id))
+
+
+def refresh_main_image(product_id):
+    """
+    Store the urls of the product's main image and its variants so
+    serializers don't have to look them up, and bump updated_at since the
+    images changed
+    """
+    main = ProductImage.objects.filter(product_id=product_id, is_main=True).order_by("id").first()
+    url = main.images.url if main and main.images else ""
+    variants = main.variant_urls() if main else {}
+    Product.objects.filter(pk=product_id).update(main_image_url=url, main_image_variants=variants,
+                                                 updated_at=timezone.now())
+
+
+def rebuild_product_stats(batch_size=1000):
+    """
+    Rebuild every denormalized stat from scratch.
+    Counters are rebuilt with one UPDATE each; main image urls are resolved
+    through the storage backend so they are written in batches.
+    """
+    from orders import leaderboard
+    from orders.models import OrderItem, SOLD_STATUSES
+
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    sales = (OrderItem.objects.filter(product=OuterRef("pk"), order__status__in=SOLD_STATUSES)
+             .order_by().values("product"))
+
+    Product.objects.update(
+        avg_rating=Coalesce(Subquery(reviews.annotate(avg=Avg("rating")).values("avg")), Value(0.0)),
+        review_count=Coalesce(Subquery(reviews.annotate(count=Count("id")).values("count")),
+                              Value(0), output_field=IntegerField()),
+        total_sold=Coalesce(Subquery(sales.annotate(total=Sum("quantity")).values("total")),
+                            Value(0), output_field=IntegerField()),
+        main_image_url="",
+        main_image_variants={},
+    )
+
+    batch = []
+    seen = set()
+    main_images = ProductImage.objects.filter(is_main=True).order_by("product_id", "id")
+    for image in main_images.iterator(chunk_size=batch_size):
+        if image.product_id in seen or not image.images:
+            continue
+        seen.add(image.product_id)
+        batch.append(Product(pk=image.product_id, main_image_url=image.images.url,
+                             main_image_variants=image.variant_urls()))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_update(batch, ["main_image_url", "main_image_variants"])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ["main_image_url", "main_image_variants"])
+
+    # every column of every product may have changed
+    transaction.on_commit(lambda: catalog_cache.bump_products(
+        Product.objects.values_list("pk", flat=True).iterator(chunk_size=batch_size)))
+    # and total_sold ranks the suggestions and the all-time best sellers
+    transaction.on_commit(suggest.bump_version)
+    transaction.on_commit(leaderboard.bump_version)
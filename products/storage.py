@@ -0,0 +1,140 @@
+"""
+Content addressed media storage.
+
+Uploads are hashed (SHA-256) while they are streamed to a temporary file
+and stored once under their digest:
+
+    blobs/3f/a2/3fa2...e9.jpg
+
+Saving a file that is already stored only adds a reference to its
+StoredBlob row, so the same photo uploaded for several products or blog
+posts takes the disk space of one. Deleting a file drops a reference and
+the blob is removed with its last one. A blob's content never changes
+under its name, so the web server can serve MEDIA_URL/blobs/ with
+"Cache-Control: public, max-age=31536000, immutable".
+
+File fields opt in with storage=get_media_storage. Django doesn't delete
+files with their rows, so the owning apps release them from signals with
+release_file / release_replaced_file. Files saved before the switch keep
+their old names and are deleted normally; the dedupe_media command moves
+them into blobs.
+"""
+import hashlib
+import os
+import tempfile
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = "blobs"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # names are derived from the content in _save, equal names are the same file
+        return name
+
+    def blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def is_blob(self, name):
+        return name.startswith(f"{BLOB_PREFIX}/")
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        size = 0
+        directory = os.path.join(self.location, BLOB_PREFIX)
+        os.makedirs(directory, exist_ok=True)
+        # stream into a temporary file on the same filesystem so the final
+        # move is an atomic rename
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temporary:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for chunk in content.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+                temporary.write(chunk)
+        blob = self.blob_name(digest.hexdigest(), name)
+        path = self.path(blob)
+        try:
+            if os.path.exists(path):
+                os.remove(temporary.name)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temporary.name, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+        except OSError:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)
+            raise
+        self.add_reference(blob, size)
+        return blob
+
+    def add_reference(self, name, size):
+        from .models import StoredBlob
+
+        if StoredBlob.objects.filter(name=name).update(refcount=F("refcount") + 1):
+            return
+        try:
+            with transaction.atomic():
+                StoredBlob.objects.create(name=name, size=size, refcount=1)
+        except IntegrityError:
+            # created concurrently by another upload of the same content
+            StoredBlob.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+    def delete(self, name):
+        if not name:
+            return
+        if not self.is_blob(name):
+            return super().delete(name)
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F("refcount") - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            # only remove the file once nothing can roll the row back
+            transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        from .models import StoredBlob
+
+        # the same content may have been uploaded again since
+        if not StoredBlob.objects.filter(name=name).exists():
+            super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    return media_storage
+
+
+def release_file(instance, field_name):
+    """
+    Drop the reference held by ``instance``'s file (for post_delete)
+    """
+    file = getattr(instance, field_name)
+    if file and file.name:
+        file.storage.delete(file.name)
+
+
+def release_replaced_file(sender, instance, field_name, update_fields=None):
+    """
+    Drop the reference to the file ``instance`` is about to replace (for pre_save)
+    """
+    if instance.pk is None or (update_fields is not None and field_name not in update_fields):
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    file = getattr(instance, field_name)
+    if old_name and old_name != (file.name if file else None):
+        storage = sender._meta.get_field(field_name).storage
+        transaction.on_commit(lambda: storage.delete(old_name))
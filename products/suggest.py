@@ -0,0 +1,288 @@
+"""
+In-memory prefix index for search box suggestions.
+
+Every product and category name is stored in a sorted list once per word
+("black silk dress" is also stored as "silk dress" and "dress"). The best
+MAX_LIMIT products (by total_sold) and categories of a prefix are worked
+out once from its range of the list and kept per prefix, so a lookup is a
+dict access and never touches the database. Patching an entry inserts it
+into the kept prefixes it belongs to, and only drops a prefix (to be
+worked out again) when the entry was in its top.
+
+Each process keeps its own copy. Every write bumps a shared version key
+and logs what changed under that version. Lookups read that key at most
+every SUGGEST_VERSION_CHECK_SECONDS, and a request that finds its copy
+behind doesn't wait: it answers from the current copy and a background
+thread catches up by reloading only the logged products and categories,
+or rebuilds the whole copy when the log has a gap (expired entries, bulk
+imports calling bump_version() without a change). Only the first lookup
+of a process waits, for the copy to be built.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+from . import cache as catalog_cache
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "catalog:suggest:version"
+CHANGE_KEY = "catalog:suggest:change:{version}"
+CHANGE_TIMEOUT = 60 * 60 * 24
+# more changes than this are caught up with a rebuild
+MAX_CATCH_UP = 1000
+# results kept per prefix and kind, the most a lookup can ask for
+MAX_LIMIT = 20
+MAX_PREFIXES = 50_000
+
+KINDS = {"product": "products", "category": "categories"}
+
+
+def normalize(text):
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def _keys(label):
+    words = normalize(label).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+def _prefixes(keys):
+    return {key[:end] for key in keys for end in range(1, len(key) + 1)}
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._entries = []
+        self._keys = {}
+        self._labels = {}
+        self._top = {}
+        self._lock = threading.RLock()
+        self.version = None
+
+    def _rank(self, item):
+        label, score = self._labels[item]
+        return -score, label, item[1]
+
+    def _add(self, kind, pk, label, score):
+        item = (kind, pk)
+        self._labels[item] = (label, score)
+        keys = _keys(label)
+        self._keys[item] = keys
+        for key in keys:
+            bisect.insort(self._entries, (key, kind, pk))
+        for prefix in _prefixes(keys):
+            top = self._top.get(prefix)
+            if top is None or item in top[kind]:
+                continue
+            ranked = top[kind]
+            ranked.insert(bisect.bisect(ranked, self._rank(item), key=self._rank), item)
+            del ranked[MAX_LIMIT:]
+
+    def _remove(self, kind, pk):
+        item = (kind, pk)
+        keys = self._keys.pop(item, ())
+        for prefix in _prefixes(keys):
+            top = self._top.get(prefix)
+            if top is not None and item in top[kind]:
+                # whatever came next isn't kept, work the prefix out again
+                del self._top[prefix]
+        self._labels.pop(item, None)
+        for key in keys:
+            position = bisect.bisect_left(self._entries, (key, kind, pk))
+            if position < len(self._entries) and self._entries[position] == (key, kind, pk):
+                del self._entries[position]
+
+    def _set(self, kind, pk, label, score):
+        self._remove(kind, pk)
+        if label is not None:
+            self._add(kind, pk, label, score)
+
+    def build(self, version):
+        entries, keys, labels = [], {}, {}
+        products = Product.objects.values_list("pk", "name", "total_sold").iterator(chunk_size=2000)
+        categories = Category.objects.values_list("pk", "name").iterator(chunk_size=2000)
+        rows = [("product", pk, name, sold) for pk, name, sold in products]
+        rows += [("category", pk, name, 0) for pk, name in categories]
+        for kind, pk, label, score in rows:
+            labels[(kind, pk)] = (label, score)
+            keys[(kind, pk)] = _keys(label)
+            entries.extend((key, kind, pk) for key in keys[(kind, pk)])
+        entries.sort()
+        with self._lock:
+            self._entries, self._keys, self._labels, self._top = entries, keys, labels, {}
+            self.version = version
+
+    def update(self, kind, pk, label=None, score=0, version=None):
+        """
+        Patch one entry in place. ``label=None`` removes it.
+        """
+        with self._lock:
+            if self.version is None:
+                # never built in this process, the next sync builds it
+                return
+            self._set(kind, pk, label, score)
+            # only claim the new version if no other process wrote in between
+            if version is not None and version == self.version + 1:
+                self.version = version
+
+    def catch_up(self, rows, version):
+        """
+        Patch the (kind, pk, label, score) ``rows`` and claim ``version``
+        """
+        with self._lock:
+            for kind, pk, label, score in rows:
+                self._set(kind, pk, label, score)
+            self.version = version
+
+    def _top_of(self, prefix):
+        top = self._top.get(prefix)
+        if top is None:
+            position = bisect.bisect_left(self._entries, (prefix,))
+            matches = {kind: set() for kind in KINDS}
+            for key, kind, pk in self._entries[position:]:
+                if not key.startswith(prefix):
+                    break
+                matches[kind].add((kind, pk))
+            top = {kind: heapq.nsmallest(MAX_LIMIT, items, key=self._rank) for kind, items in matches.items()}
+            if len(self._top) >= MAX_PREFIXES:
+                # drop the oldest prefix
+                del self._top[next(iter(self._top))]
+            self._top[prefix] = top
+        return top
+
+    def lookup(self, prefix, limit):
+        prefix = normalize(prefix)
+        results = {bucket: [] for bucket in KINDS.values()}
+        if not prefix:
+            return results
+        with self._lock:
+            top = self._top_of(prefix)
+            for kind, bucket in KINDS.items():
+                results[bucket] = [{"id": pk, "name": self._labels[(kind, pk)][0]}
+                                   for kind, pk in top[kind][:limit]]
+        return results
+
+
+index = SuggestIndex()
+_sync_lock = threading.Lock()
+_checked_at = None
+
+
+def _shared():
+    return catalog_cache.get_cache()
+
+
+def current_version():
+    version = _shared().get(VERSION_KEY)
+    if version is None:
+        _shared().add(VERSION_KEY, 0, None)
+        version = _shared().get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        return _shared().incr(VERSION_KEY)
+    except ValueError:
+        _shared().set(VERSION_KEY, 0, None)
+        return None
+
+
+def _log_change(kind, pk):
+    version = bump_version()
+    if version is not None:
+        _shared().set(CHANGE_KEY.format(version=version), (kind, pk), CHANGE_TIMEOUT)
+    return version
+
+
+def _changed_rows(changes):
+    ids = {kind: {pk for change_kind, pk in changes if change_kind == kind} for kind in KINDS}
+    found = {("product", pk): (name, sold) for pk, name, sold in
+             Product.objects.filter(pk__in=ids["product"]).values_list("pk", "name", "total_sold")}
+    found.update({("category", pk): (name, 0) for pk, name in
+                  Category.objects.filter(pk__in=ids["category"]).values_list("pk", "name")})
+    # changed rows that are gone were deleted
+    return [(kind, pk, *found.get((kind, pk), (None, 0))) for kind, pk in set(changes)]
+
+
+def sync(wait=False):
+    """
+    Bring this process's index up to the shared version, patching the
+    logged changes or rebuilding it. Returns at once if another thread is
+    syncing, unless ``wait``.
+    """
+    if not _sync_lock.acquire(blocking=wait):
+        return
+    try:
+        version = current_version()
+        behind = index.version
+        if behind == version:
+            return
+        if behind is not None and 0 < version - behind <= MAX_CATCH_UP:
+            keys = [CHANGE_KEY.format(version=number) for number in range(behind + 1, version + 1)]
+            changes = _shared().get_many(keys)
+            if len(changes) == len(keys):
+                index.catch_up(_changed_rows(list(changes.values())), version)
+                return
+        index.build(version)
+    finally:
+        _sync_lock.release()
+
+
+def _sync_in_background():
+    def run():
+        try:
+            sync()
+        except Exception:
+            logger.exception("Updating the suggestion index failed")
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, name="product-suggest", daemon=True).start()
+
+
+def _behind():
+    """
+    Whether the shared version moved on, read at most every
+    SUGGEST_VERSION_CHECK_SECONDS
+    """
+    global _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < getattr(settings, "SUGGEST_VERSION_CHECK_SECONDS", 5):
+        return False
+    _checked_at = now
+    return index.version != current_version()
+
+
+def suggest(prefix, limit=8):
+    if index.version is None:
+        # nothing to answer from yet, build it in this request
+        sync(wait=True)
+    elif _behind() and not _sync_lock.locked():
+        _sync_in_background()
+    return index.lookup(prefix, min(limit, MAX_LIMIT))
+
+
+def product_changed(pk, name=None, total_sold=0):
+    """
+    Patch a saved product, or a deleted one when ``name`` is None
+    """
+    index.update("product", pk, name, total_sold, version=_log_change("product", pk))
+
+
+def category_changed(pk, name=None):
+    index.update("category", pk, name, version=_log_change("category", pk))
+
+
+def sales_changed(product_id):
+    """
+    Log a total_sold change made by a queryset update; processes pick it
+    up with their next sync
+    """
+    _log_change("product", product_id)
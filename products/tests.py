@@ -1,3 +1,881 @@
-from django.test import TestCase
+import csv
+import json
+import math
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import User
+from . import cache as catalog_cache
+from .checks import check_trending_cache
+from . import feeds, imports, recommendations, search, suggest, trending
+from . import related as related_module
+from .models import (AlsoBoughtProduct, Category, ImportJob, Product, ProductImage, RelatedProduct, Review,
+                     StoredBlob)
+from .stats import refresh_main_image
 
 # Create your tests here.
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "catalog": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog"},
+    "trending": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "trending"},
+}
+
+
+def clear_caches():
+    for alias in LOCMEM_CACHES:
+        caches[alias].clear()
+    catalog_cache.clear_local()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListQueryCountTests(TestCase):
+    """
+    Listing products must not cost extra queries per product
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        category = Category.objects.create(name="Dresses")
+        for i in range(12):
+            product = Product.objects.create(name=f"Dress {i}", manufacturer="Noir",
+                                             original_price=100 + i, discount=10)
+            product.category.add(category)
+            ProductImage.objects.create(product=product, images=f"products/{product.id}/main.jpg", is_main=True)
+            ProductImage.objects.create(product=product, images=f"products/{product.id}/side.jpg")
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_products(self, limit, **params):
+        return self.client.get(reverse("product-list"), {"limit": limit, **params})
+
+    def test_query_count_is_independent_of_page_size(self):
+        # count, page of products
+        with self.assertNumQueries(2):
+            small = self.list_products(2)
+        with self.assertNumQueries(2):
+            large = self.list_products(12)
+
+        self.assertEqual(len(small.data["results"]), 2)
+        self.assertEqual(len(large.data["results"]), 12)
+
+    def test_expanded_relations_are_prefetched(self):
+        # count, page of products, images prefetch, categories prefetch
+        with self.assertNumQueries(4):
+            response = self.list_products(12, expand="images,category")
+        self.assertEqual(len(response.data["results"][0]["images"]), 2)
+
+    def test_sparse_fieldset(self):
+        response = self.list_products(2, fields="id,name")
+        self.assertEqual(set(response.data["results"][0]), {"id", "name"})
+
+    def test_main_image_is_picked_from_prefetched_images(self):
+        response = self.list_products(12)
+        for item in response.data["results"]:
+            self.assertTrue(item["main_image"].endswith("main.jpg"))
+
+    def test_filter_and_order_by_effective_price(self):
+        # prices 100..111 with 10% off -> 90.00..99.90
+        response = self.list_products(12, min_price="91", max_price="95", ordering="-effective_price")
+        prices = [item["discounted_price"] for item in response.data["results"]]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        self.assertEqual(len(prices), 4)
+
+    def test_facets_follow_active_filters(self):
+        with self.assertNumQueries(3):  # count, page of products, facets
+            response = self.list_products(2, facets="1", max_price="95")
+        facets = response.data["facets"]
+        self.assertEqual(facets["category"], [{"id": Category.objects.get().id, "name": "Dresses", "count": 6}])
+        self.assertEqual(facets["price"], [{"value": "50-100", "count": 6}])
+
+    def test_batch_preserves_order_and_reports_missing(self):
+        first, second = Product.objects.order_by("id").values_list("id", flat=True)[:2]
+        url = reverse("product-batch")
+        response = self.client.get(url, {"ids": f"{second},0,{first}"})
+        self.assertEqual([item["id"] for item in response.data["results"]], [second, first])
+        self.assertEqual(response.data["missing"], [0])
+        # served from the cache the second time
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {"ids": [first, second]}, format="json")
+        self.assertEqual([item["id"] for item in response.data["results"]], [first, second])
+
+    def test_batch_fieldset_does_not_leak_into_the_cache(self):
+        first, second = Product.objects.order_by("id").values_list("id", flat=True)[:2]
+        response = self.client.get(reverse("product-batch"), {"ids": f"{first},{second}", "fields": "name"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([set(item) for item in response.data["results"]], [{"name"}, {"name"}])
+
+        detail = self.client.get(reverse("product-detail", args=[first]))
+        self.assertIn("original_price", detail.data)
+        self.assertEqual(detail.data["id"], first)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    """
+    Cursors walk every ordering both ways without skipping or repeating rows
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        start = timezone.now() - timedelta(days=30)
+        for i in range(11):
+            # repeated prices, ratings and dates so pages break inside ties
+            product = Product.objects.create(name=f"Skirt {i}", manufacturer="Noir",
+                                             original_price=Decimal("49.99") + i % 4, discount=15,
+                                             avg_rating=[4.5, 3.25, 4.5][i % 3])
+            Product.objects.filter(pk=product.pk).update(added_on=start + timedelta(days=i // 2))
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [item["id"] for item in response.data["results"]]
+            ids = ids + page if link == "next" else page + ids
+            url = response.data[link]
+        return ids
+
+    def assert_pages(self, ordering):
+        expected = list(Product.objects.order_by(*ordering.split(","), "-pk" if ordering.startswith("-") else "pk")
+                        .values_list("pk", flat=True))
+        first = f"{reverse('product-list')}?ordering={ordering}&limit=3&cursor="
+        self.assertIsNone(self.client.get(first).data["previous"])
+        self.assertEqual(self.walk(first, "next"), expected)
+
+        last = self.client.get(first)
+        while last.data["next"]:
+            last = self.client.get(last.data["next"])
+        self.assertEqual(self.walk(last.data["previous"], "previous")
+                         + [item["id"] for item in last.data["results"]], expected)
+
+    def test_newest_first(self):
+        self.assert_pages("-added_on")
+
+    def test_decimal_ordering(self):
+        self.assert_pages("effective_price")
+
+    def test_float_ordering(self):
+        self.assert_pages("-avg_rating")
+
+    def test_invalid_cursor_is_a_404(self):
+        for cursor in ("not-a-cursor", "eyJ2IjpbMV19"):
+            response = self.client.get(reverse("product-list"), {"cursor": cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductStatsTests(TestCase):
+    """
+    Denormalized product stats follow the rows they summarize
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+
+    def setUp(self):
+        clear_caches()
+        self.product = Product.objects.create(name="Cardigan", manufacturer="Noir", original_price=120, stock=20)
+
+    def stats(self):
+        return Product.objects.values("avg_rating", "review_count", "total_sold", "main_image_url") \
+            .get(pk=self.product.pk)
+
+    def test_reviews_update_rating_and_count(self):
+        other = User.objects.create_user(username="other", email="other@example.com", password="secret-pass-123")
+        Review.objects.create(product=self.product, customer=self.user, rating=5, comment="Soft")
+        review = Review.objects.create(product=self.product, customer=other, rating=2, comment="Itchy")
+        self.assertEqual((self.stats()["avg_rating"], self.stats()["review_count"]), (3.5, 2))
+        review.rating = 4
+        review.save()
+        self.assertEqual(self.stats()["avg_rating"], 4.5)
+        review.delete()
+        self.assertEqual((self.stats()["avg_rating"], self.stats()["review_count"]), (5.0, 1))
+
+    def test_main_image_follows_the_flag(self):
+        side = ProductImage.objects.create(product=self.product, images="products/side.jpg")
+        self.assertEqual(self.stats()["main_image_url"], "")
+        main = ProductImage.objects.create(product=self.product, images="products/main.jpg", is_main=True)
+        self.assertTrue(self.stats()["main_image_url"].endswith("products/main.jpg"))
+        main.is_main = False
+        main.save()
+        side.is_main = True
+        side.save()
+        self.assertTrue(self.stats()["main_image_url"].endswith("products/side.jpg"))
+        side.delete()
+        self.assertEqual(self.stats()["main_image_url"], "")
+
+    def test_only_lines_of_sold_orders_count(self):
+        from orders.checkout import place_order
+        from orders.models import OrderItem
+
+        unpaid = place_order(self.user, {self.product.pk: 4})
+        self.assertEqual(self.stats()["total_sold"], 0)
+        paid = place_order(self.user, {self.product.pk: 2})
+        paid.status = "paid"
+        paid.save()
+        self.assertEqual(self.stats()["total_sold"], 2)
+
+        line = OrderItem.objects.get(order=paid)
+        line.quantity = 3
+        line.save()
+        self.assertEqual(self.stats()["total_sold"], 3)
+        OrderItem.objects.filter(order=unpaid).delete()
+        line.delete()
+        self.assertEqual(self.stats()["total_sold"], 0)
+
+    def test_rebuild_restores_every_stat(self):
+        Review.objects.create(product=self.product, customer=self.user, rating=4, comment="Warm")
+        ProductImage.objects.create(product=self.product, images="products/main.jpg", is_main=True)
+        expected = self.stats()
+        Product.objects.filter(pk=self.product.pk).update(avg_rating=1, review_count=9, total_sold=7,
+                                                          main_image_url="stale.jpg")
+        version = catalog_cache.get_product_version(self.product.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_product_stats", stdout=StringIO())
+        self.assertEqual(self.stats(), expected)
+        self.assertNotEqual(catalog_cache.get_product_version(self.product.pk), version)
+
+
+@override_settings(PRODUCT_FEED_SITE_URL="https://shop.example.com", PRODUCT_FEED_CURRENCY="NGN")
+class ProductFeedTests(TestCase):
+    """
+    Feeds stream every product in each format, chunk by chunk
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", email="admin@example.com",
+                                             password="secret-pass-123", is_staff=True)
+        coats = Category.objects.create(name="Coats")
+        sale = Category.objects.create(name="Sale")
+        cls.coat = Product.objects.create(name="Pea Coat & Belt", manufacturer="Noir", original_price=200,
+                                          discount=25, stock=3)
+        cls.coat.category.add(coats, sale)
+        ProductImage.objects.create(product=cls.coat, images="products/side.jpg")
+        ProductImage.objects.create(product=cls.coat, images="products/front.jpg", is_main=True)
+        cls.hat = Product.objects.create(name="Hat", manufacturer="Maison", original_price=30, stock=0)
+        Product.objects.filter(pk=cls.hat.pk).update(updated_at=timezone.now() - timedelta(days=10))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def feed(self, feed_format, **params):
+        response = self.client.get(reverse("product-feed", args=[feed_format]), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.feed("csv"))))
+        self.assertEqual([row["id"] for row in rows], [str(self.coat.pk), str(self.hat.pk)])
+        coat = rows[0]
+        self.assertEqual(coat["image_link"], "https://shop.example.com/media/products/front.jpg")
+        self.assertEqual(coat["additional_image_links"], "https://shop.example.com/media/products/side.jpg")
+        self.assertEqual((coat["price"], coat["sale_price"]), ("200.00 NGN", "150.00 NGN"))
+        self.assertEqual(coat["product_type"], "Coats, Sale")
+        self.assertEqual(rows[1]["availability"], "out_of_stock")
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.feed("jsonl").splitlines()]
+        self.assertEqual(rows[0]["link"], f"https://shop.example.com/api/products/{self.coat.pk}/")
+        self.assertEqual(rows[0]["additional_image_links"], ["https://shop.example.com/media/products/side.jpg"])
+        self.assertEqual(rows[1]["image_link"], "")
+
+    def test_xml(self):
+        channel = ElementTree.fromstring(self.feed("xml")).find("channel")
+        items = channel.findall("item")
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0].find("title").text, "Pea Coat & Belt")
+        self.assertEqual(items[0].find("{http://base.google.com/ns/1.0}availability").text, "in_stock")
+
+    def test_since_only_exports_recent_changes(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        rows = [json.loads(line) for line in self.feed("jsonl", since=since).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.coat.pk])
+        response = self.client.get(reverse("product-feed", args=["jsonl"]), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse("product-feed", args=["pdf"])).status_code, 404)
+
+    def test_products_are_loaded_in_chunks(self):
+        for i in range(3):
+            Product.objects.create(name=f"Glove {i}", manufacturer="Noir", original_price=20)
+        chunks = feeds.generate_feed("jsonl", chunk_size=2)
+        # the products query, then images and categories for each chunk of two
+        with self.assertNumQueries(1 + 2 * 3):
+            self.assertEqual(len(list(chunks)), 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RelatedProductsTests(TestCase):
+    """
+    Related products are scored by shared categories, maker and price
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.dresses = Category.objects.create(name="Dresses")
+        cls.evening = Category.objects.create(name="Evening")
+        make = partial(Product.objects.create, manufacturer="Noir", original_price=100)
+        cls.gown = make(name="Gown")
+        cls.twin = make(name="Twin Gown")
+        cls.cheap = make(name="Cheap Dress", manufacturer="Maison", original_price=50)
+        cls.belt = make(name="Belt")
+        cls.lamp = make(name="Lamp", manufacturer="Lumen")
+        cls.gown.category.add(cls.dresses, cls.evening)
+        cls.twin.category.add(cls.dresses, cls.evening)
+        cls.cheap.category.add(cls.dresses)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_scores_rank_categories_then_maker_then_price(self):
+        related = dict(related_module.compute_related()[self.gown.pk])
+        self.assertEqual(list(related), [self.twin.pk, self.cheap.pk, self.belt.pk])
+        # two categories, same maker, same price
+        self.assertAlmostEqual(related[self.twin.pk], 2 * 2.0 + 1.0 + 1.0)
+        # one category, half the price
+        self.assertAlmostEqual(related[self.cheap.pk], 2.0 + 0.5)
+        self.assertEqual(related_module.compute_related()[self.lamp.pk], [])
+
+    def test_candidates_come_from_the_price_window(self):
+        related = related_module.compute_related(window=1)
+        self.assertNotIn(self.cheap.pk, dict(related[self.twin.pk]))
+
+    def test_rebuild_is_skipped_while_fresh(self):
+        self.assertTrue(related_module.is_stale())
+        call_command("build_related_products", stdout=StringIO())
+        self.assertFalse(related_module.is_stale())
+
+        output = StringIO()
+        call_command("build_related_products", stdout=output)
+        self.assertIn("still fresh", output.getvalue())
+        computed_at = RelatedProduct.objects.values_list("computed_at", flat=True).first()
+        call_command("build_related_products", "--force", stdout=StringIO())
+        self.assertGreater(RelatedProduct.objects.values_list("computed_at", flat=True).first(), computed_at)
+        with self.settings(RELATED_PRODUCTS_REFRESH_SECONDS=0):
+            self.assertTrue(related_module.is_stale())
+
+    def test_endpoint_serves_the_table_or_falls_back(self):
+        Product.objects.filter(pk=self.cheap.pk).update(total_sold=10)
+        url = reverse("product-related", args=[self.gown.pk])
+        fallback = [item["id"] for item in self.client.get(url).data]
+        self.assertEqual(fallback, [self.cheap.pk, self.twin.pk])
+
+        related_module.refresh_related()
+        self.assertEqual([item["id"] for item in self.client.get(url).data],
+                         [self.twin.pk, self.cheap.pk, self.belt.pk])
+        self.assertEqual(self.client.get(reverse("product-related", args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("product-related", args=["abc"])).status_code, 404)
+
+
+class ProductImportTests(TestCase):
+    CSV = (b"name,manufacturer,original_price,discount,categories\n"
+           b"Linen Shirt,Noir,50,10,Shirts|Summer\n"
+           b"Wool Coat,Noir,not-a-price,0,Coats\n"
+           b"Silk Scarf,Maison,25,,summer\n")
+
+    def test_import_creates_products_and_categories(self):
+        job = imports.start_import(BytesIO(self.CSV), "collection.csv", "csv", chunk_size=2)
+
+        self.assertEqual((job.status, job.rows_processed, job.created_count, job.error_count),
+                         ("completed", 3, 2, 1))
+        self.assertEqual(job.errors[0]["row"], 2)
+        scarf = Product.objects.get(name="Silk Scarf")
+        self.assertEqual([category.name for category in scarf.category.all()], ["Summer"])
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_resume_skips_committed_rows(self):
+        job = ImportJob.objects.create(source="collection.csv", file_format="csv",
+                                       status="failed", rows_processed=2)
+        imports.run_import(job, BytesIO(self.CSV))
+        self.assertEqual(list(Product.objects.values_list("name", flat=True)), ["Silk Scarf"])
+
+    def test_running_jobs_are_claimed_once(self):
+        job = ImportJob.objects.create(source="collection.csv", file_format="csv", status="failed")
+        self.assertEqual(imports.claim(job.pk).status, "running")
+        with self.assertRaises(imports.ImportConflict):
+            imports.claim(job.pk)
+        # a crashed import stops saving chunks and can be taken over
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(imports.claim(job.pk).pk, job.pk)
+
+    def test_resuming_a_running_job_conflicts(self):
+        admin = User.objects.create_user(username="admin", email="admin@example.com",
+                                         password="secret-pass-123", is_staff=True)
+        job = ImportJob.objects.create(source="collection.csv", file_format="csv")
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post(reverse("product-import-list"),
+                               {"file": SimpleUploadedFile("collection.csv", self.CSV), "job": job.pk})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Product.objects.exists())
+
+    @override_settings(IMPORT_INLINE_MAX_BYTES=10)
+    def test_large_files_are_imported_in_the_background(self):
+        admin = User.objects.create_user(username="admin", email="admin@example.com",
+                                         password="secret-pass-123", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        with mock.patch.object(imports, "_executor") as executor:
+            response = client.post(reverse("product-import-list"),
+                                   {"file": SimpleUploadedFile("collection.csv", self.CSV)})
+        self.assertEqual(response.status_code, 202)
+        _, job_id, path, _ = executor.submit.call_args.args
+        self.assertEqual(job_id, response.data["id"])
+        with open(path, "rb") as copy:
+            self.assertEqual(copy.read(), self.CSV)
+        os.remove(path)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_ROOT=tempfile.mkdtemp(), PRODUCT_IMAGE_WORKERS=0)
+class ImageVariantTests(TestCase):
+    def test_upload_generates_smaller_variants(self):
+        product = Product.objects.create(name="Coat", manufacturer="Noir", original_price=300)
+        buffer = BytesIO()
+        Image.new("RGB", (1000, 1500), "navy").save(buffer, "JPEG")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=product, is_main=True,
+                images=SimpleUploadedFile("coat.jpg", buffer.getvalue(), "image/jpeg"))
+
+        image.refresh_from_db()
+        self.assertEqual(set(image.variants), {"source", "thumb", "small", "medium"})
+        self.assertEqual((image.variants["thumb"]["width"], image.variants["thumb"]["height"]), (200, 300))
+        self.assertTrue(image.variants["thumb"]["webp"].endswith(".webp"))
+        product.refresh_from_db()
+        self.assertEqual(product.main_image_variants, image.variant_urls())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    def test_identical_uploads_share_one_blob(self):
+        product = Product.objects.create(name="Coat", manufacturer="Noir", original_price=300)
+        first = ProductImage.objects.create(product=product, images=SimpleUploadedFile("a.jpg", b"same bytes"))
+        second = ProductImage.objects.create(product=product, images=SimpleUploadedFile("b.jpg", b"same bytes"))
+
+        self.assertEqual(first.images.name, second.images.name)
+        self.assertEqual(StoredBlob.objects.get().refcount, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(second.images.storage.exists(second.images.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(second.images.storage.exists(second.images.name))
+
+    def test_dedupe_media_repoints_main_images(self):
+        product = Product.objects.create(name="Coat", manufacturer="Noir", original_price=300)
+        image = ProductImage.objects.create(product=product, is_main=True,
+                                            images=SimpleUploadedFile("a.jpg", b"old bytes"))
+        storage = image.images.storage
+        # a file saved before content addressed storage
+        legacy = f"products/{product.id}/legacy.jpg"
+        os.makedirs(os.path.dirname(storage.path(legacy)), exist_ok=True)
+        with open(storage.path(legacy), "wb") as file:
+            file.write(b"legacy bytes")
+        ProductImage.objects.filter(pk=image.pk).update(images=legacy)
+        refresh_main_image(product.pk)
+
+        call_command("dedupe_media", stdout=StringIO())
+        image.refresh_from_db()
+        product.refresh_from_db()
+        self.assertTrue(storage.is_blob(image.images.name))
+        self.assertEqual(product.main_image_url, image.images.url)
+        self.assertFalse(storage.exists(legacy))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                             password="secret-pass-123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name="Hat", manufacturer="Noir", original_price=40)
+        self.url = reverse("product-detail", args=[self.product.pk])
+
+    def test_unchanged_product_is_a_304_after_one_lookup(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_deleted_in_a_transaction_leaves_the_cache(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.product.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_new_review_changes_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, customer=self.user, rating=5, comment="Lovely")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["review_count"], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    """
+    Search filters through the index and ranks name matches first
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.coats = Category.objects.create(name="Coats")
+        cls.trench = Product.objects.create(name="Trench Coat", manufacturer="Noir", original_price=300)
+        cls.trench.category.add(cls.coats)
+        cls.scarf = Product.objects.create(name="Scarf", manufacturer="Noir", original_price=40,
+                                           product_description="Matches any coat")
+        cls.boots = Product.objects.create(name="Boots", manufacturer="Noir", original_price=200)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search_ids(self, **params):
+        response = self.client.get(reverse("product-list"), {"search": "coat", **params})
+        return [item["id"] for item in response.data["results"]]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(search.search("coat"), [self.trench.pk, self.scarf.pk])
+        self.assertEqual(self.search_ids(), [self.trench.pk, self.scarf.pk])
+
+    def test_ordering_and_count_cover_every_match(self):
+        response = self.client.get(reverse("product-list"), {"search": "coat", "ordering": "original_price"})
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual([item["id"] for item in response.data["results"]], [self.scarf.pk, self.trench.pk])
+
+    def test_fallback_without_a_native_index(self):
+        with mock.patch.object(search, "_index_backend", return_value=None):
+            self.assertEqual(search.search("coat"), [self.trench.pk, self.scarf.pk])
+            self.assertEqual(search.search("noir boots"), [self.boots.pk])
+
+    def test_changes_are_reindexed(self):
+        self.boots.name = "Rain Coat"
+        self.boots.save()
+        self.assertIn(self.boots.pk, search.search("rain"))
+        self.boots.category.add(self.coats)
+        self.coats.name = "Outerwear"
+        self.coats.save()
+        self.assertEqual(set(search.search("outerwear")), {self.trench.pk, self.boots.pk})
+
+
+class AlsoBoughtTests(TestCase):
+    """
+    Co-purchases are counted within a memory bound and ranked per product
+    """
+    def test_prune_keeps_exactly_the_most_frequent_cells(self):
+        pairs = Counter({(1, 2): 9, (1, 3): 4, (2, 3): 4, (3, 4): 4, (4, 5): 1})
+        self.assertEqual(recommendations._prune(pairs, 3), 4)
+        self.assertEqual(len(pairs), 3)
+        self.assertEqual(pairs[(1, 2)], 9)
+        self.assertEqual(recommendations._prune(pairs, 3), 0)
+
+    def test_pruned_counts_stay_within_the_error_bound(self):
+        from orders.checkout import place_order
+        from orders.models import Order
+
+        user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                        password="secret-pass-123")
+        products = [Product.objects.create(name=f"Item {i}", manufacturer="Noir",
+                                           original_price=10, stock=100) for i in range(6)]
+        baskets = [[0, 1]] * 5 + [[0, 2]] * 3 + [[3, 4], [4, 5], [3, 5], [0, 1, 2]]
+        for basket in baskets:
+            order = place_order(user, {products[i].pk: 1 for i in basket})
+            Order.objects.filter(pk=order.pk).update(status="paid")
+
+        exact, error = recommendations.count_co_occurrences()
+        self.assertEqual(error, 0)
+        pruned, error = recommendations.count_co_occurrences(max_pairs=4)
+        self.assertLessEqual(len(pruned), 4)
+        self.assertGreater(error, 0)
+        for pair, count in pruned.items():
+            self.assertLessEqual(exact[pair] - count, error)
+
+        count, _ = recommendations.refresh_also_bought(per_product=1)
+        self.assertEqual(count, 6)
+        first = AlsoBoughtProduct.objects.get(product=products[0])
+        self.assertEqual((first.recommended_id, first.orders_together), (products[1].pk, 6))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_huge_baskets_keep_their_biggest_lines(self):
+        from orders.checkout import place_order
+        from orders.models import Order
+
+        user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                        password="secret-pass-123")
+        products = [Product.objects.create(name=f"Item {i}", manufacturer="Noir",
+                                           original_price=10, stock=100) for i in range(4)]
+        # the highest ids are the biggest lines
+        order = place_order(user, {products[0].pk: 1, products[1].pk: 1, products[2].pk: 5, products[3].pk: 3})
+        Order.objects.filter(pk=order.pk).update(status="paid")
+        with mock.patch.object(recommendations, "MAX_BASKET", 2):
+            pairs, _ = recommendations.count_co_occurrences()
+        self.assertEqual(dict(pairs), {(products[2].pk, products[3].pk): 1})
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get(reverse("product-also-bought", args=[products[0].pk])).data, [])
+        for pk in (0, "abc"):
+            self.assertEqual(client.get(reverse("product-also-bought", args=[pk])).status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TRENDING_HALF_LIFE_HOURS=24, TRENDING_VIEW_FLUSH_THRESHOLD=3,
+                   TRENDING_VIEW_FLUSH_SECONDS=3600)
+class TrendingTests(TestCase):
+    """
+    Scores decay without rewrites and views are applied in batches
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                            password="secret-pass-123")
+        cls.products = [Product.objects.create(name=f"Bag {i}", manufacturer="Noir", original_price=80)
+                        for i in range(3)]
+
+    def setUp(self):
+        clear_caches()
+        trending._last_flush = time.monotonic()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def score(self, product, at=None):
+        return trending.current_score(Product.objects.get(pk=product.pk).trending_score, at)
+
+    def test_scores_add_up_and_halve_every_half_life(self):
+        now = timezone.now()
+        self.assertAlmostEqual(trending.log_add(1.0, 2.0), math.log(math.exp(1.0) + math.exp(2.0)))
+        product = self.products[0]
+        trending.bump(product.pk, 3.0, now)
+        trending.bump(product.pk, 1.0, now)
+        self.assertAlmostEqual(self.score(product, now), 4.0)
+        self.assertAlmostEqual(self.score(product, now + timedelta(hours=24)), 2.0)
+
+    def test_old_activity_falls_behind_without_rewrites(self):
+        now = timezone.now()
+        old, recent = self.products[:2]
+        trending.bump(old.pk, 3.0, now - timedelta(hours=48))
+        trending.bump(recent.pk, 1.0, now)
+        self.assertAlmostEqual(self.score(old, now), 0.75)
+        ranked = list(Product.objects.order_by("-trending_score").values_list("pk", flat=True)[:2])
+        self.assertEqual(ranked, [recent.pk, old.pk])
+
+    def test_views_are_buffered_until_the_threshold(self):
+        first, second, third = self.products
+        with mock.patch.object(trending, "_flush_in_background") as flush:
+            for product in (first, first, second):
+                self.client.get(reverse("product-detail", args=[product.pk]))
+            flush.assert_not_called()
+            with self.assertNumQueries(2):
+                # its validator and the product, the UPDATEs are left to the background thread
+                self.client.get(reverse("product-detail", args=[third.pk]), {"fields": "id"})
+            flush.assert_called_once()
+        self.assertEqual(Product.objects.get(pk=first.pk).trending_score, 0)
+
+        self.assertEqual(trending.flush_views(), 3)
+        self.assertAlmostEqual(self.score(first), 2.0, places=3)
+        self.assertAlmostEqual(self.score(third), 1.0, places=3)
+        self.assertEqual(trending.flush_views(), 0)
+
+    def test_evicted_counters_are_not_errors(self):
+        cache = trending.get_cache()
+        product = self.products[0]
+        trending.record_view(product.pk)
+        with mock.patch.object(cache, "incr", side_effect=ValueError):
+            trending.record_view(product.pk)
+        with mock.patch.object(cache, "decr", side_effect=ValueError):
+            self.assertEqual(trending.flush_views(), 1)
+        self.assertAlmostEqual(self.score(product), 1.0, places=3)
+
+    def test_non_atomic_caches_are_rejected(self):
+        self.assertEqual(check_trending_cache(None), [])
+        with override_settings(CACHES={**LOCMEM_CACHES, "trending": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "cache_table"}}):
+            self.assertEqual([error.id for error in check_trending_cache(None)], ["products.E001"])
+
+    def test_views_of_missing_products_are_not_recorded(self):
+        self.assertEqual(self.client.get(reverse("product-detail", args=["abc"]), {"fields": "id"}).status_code,
+                         404)
+        self.assertEqual(self.client.get(reverse("product-detail", args=[0])).status_code, 404)
+        self.assertEqual(trending.flush_views(), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SuggestTests(TestCase):
+    """
+    Suggestions rank best sellers first and stay current without rebuilds
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.silk = Category.objects.create(name="Silk")
+        # far more matches than are kept for a prefix, the best seller sorting last
+        for i in range(30):
+            Product.objects.create(name=f"Silk Blouse {i:02}", manufacturer="Noir", original_price=90,
+                                   total_sold=i)
+        cls.best = Product.objects.create(name="Washed Silk Shirt", manufacturer="Noir", original_price=90,
+                                          total_sold=500)
+
+    def setUp(self):
+        clear_caches()
+        suggest.index.build(suggest.current_version())
+        suggest._checked_at = None
+
+    def names(self, prefix, limit=3):
+        return [item["name"] for item in suggest.suggest(prefix, limit)["products"]]
+
+    def test_best_sellers_come_first(self):
+        self.assertEqual(self.names("sil"), ["Washed Silk Shirt", "Silk Blouse 29", "Silk Blouse 28"])
+        self.assertEqual(suggest.suggest("sil")["categories"], [{"id": self.silk.pk, "name": "Silk"}])
+
+    def test_lookups_never_query_or_rebuild_in_the_request(self):
+        suggest.bump_version()
+        with mock.patch.object(suggest, "_sync_in_background") as sync, self.assertNumQueries(0):
+            self.assertEqual(self.names("sil", 1), ["Washed Silk Shirt"])
+        sync.assert_called_once()
+
+    def test_the_shared_version_is_read_once_per_interval(self):
+        with mock.patch.object(suggest, "current_version", return_value=suggest.index.version) as version:
+            for prefix in ("s", "si", "sil", "silk"):
+                self.names(prefix)
+        version.assert_called_once()
+
+    def test_a_new_process_builds_before_answering(self):
+        with mock.patch.object(suggest, "index", suggest.SuggestIndex()):
+            self.assertEqual(self.names("sil", 1), ["Washed Silk Shirt"])
+
+    def test_local_writes_patch_the_kept_prefixes(self):
+        self.names("sil")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Silk Gown", manufacturer="Noir", original_price=400, total_sold=1000)
+            self.best.delete()
+        self.assertEqual(self.names("sil"), ["Silk Gown", "Silk Blouse 29", "Silk Blouse 28"])
+        self.assertEqual(suggest.index.version, suggest.current_version())
+
+    def test_other_processes_changes_are_caught_up(self):
+        self.names("sil")
+        blouse = Product.objects.get(name="Silk Blouse 00")
+        # as another process would: a queryset update and a logged change
+        Product.objects.filter(pk=blouse.pk).update(total_sold=900)
+        suggest.sales_changed(blouse.pk)
+        with mock.patch.object(suggest.index, "build") as build:
+            suggest.sync()
+        build.assert_not_called()
+        self.assertEqual(self.names("sil", 2), ["Silk Blouse 00", "Washed Silk Shirt"])
+
+        # a change that isn't logged means a rebuild
+        suggest.bump_version()
+        suggest.sync()
+        self.assertEqual(suggest.index.version, suggest.current_version())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TieredCacheTests(TestCase):
+    """
+    One worker regenerates a key, the others wait for it or take over
+    """
+    def setUp(self):
+        clear_caches()
+        self.tiered = catalog_cache.TieredCache(max_entries=2, lock_timeout=1)
+        self.shared = catalog_cache.get_cache()
+        self.producer = mock.Mock(return_value="built")
+
+    def test_waiters_get_the_lock_holders_value(self):
+        self.shared.add("key:lock", 1)
+
+        def holder_finishes(seconds):
+            self.shared.set("key", ("from holder", 0, time.time() + 60))
+
+        with mock.patch.object(catalog_cache.time, "sleep", side_effect=holder_finishes):
+            self.assertEqual(self.tiered.get_or_set("key", self.producer), "from holder")
+        self.producer.assert_not_called()
+        self.assertEqual(self.tiered.stats()["lock_waits"], 1)
+
+    def test_waiters_take_over_when_the_holder_fails(self):
+        self.shared.add("key:lock", 1)
+
+        def holder_raises(seconds):
+            self.shared.delete("key:lock")
+
+        with mock.patch.object(catalog_cache.time, "sleep", side_effect=holder_raises) as sleep:
+            self.assertEqual(self.tiered.get_or_set("key", self.producer), "built")
+        self.assertEqual(sleep.call_count, 1)
+        self.producer.assert_called_once()
+        self.assertIsNone(self.shared.get("key:lock"))
+
+    def test_waiters_give_up_after_the_lock_timeout(self):
+        self.shared.add("key:lock", 1)
+        self.tiered.lock_timeout = 0.1
+        self.assertEqual(self.tiered.get_or_set("key", self.producer), "built")
+        self.producer.assert_called_once()
+
+    def test_entries_close_to_expiry_are_refreshed_early(self):
+        self.shared.set("fresh", ("old", 0.5, time.time() + 3600))
+        self.shared.set("expiring", ("old", 0.5, time.time() + 0.1))
+        with mock.patch.object(catalog_cache.random, "random", return_value=0.9):
+            self.assertEqual(self.tiered.get_or_set("fresh", self.producer), "old")
+            self.assertEqual(self.tiered.get_or_set("expiring", self.producer), "built")
+        self.assertEqual(self.tiered.stats()["early_refreshes"], 1)
+
+    def test_local_tier_evicts_the_least_recently_used(self):
+        self.tiered.set_many({"a": 1, "b": 2})
+        self.tiered.get_many(["a"])
+        self.tiered.set_many({"c": 3})
+        self.assertEqual(list(self.tiered._local), ["a", "c"])
+        self.assertEqual(self.tiered.stats()["local_entries"], 2)
+
+
+class CatalogCacheBackendTests(TestCase):
+    """
+    With the configured database backend, warm requests don't query it
+    """
+    def setUp(self):
+        caches["catalog"].clear()
+        catalog_cache.clear_local()
+        self.user = User.objects.create_user(username="shopper", email="shopper@example.com",
+                                             password="secret-pass-123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Product.objects.create(name="Hat", manufacturer="Noir", original_price=40)
+
+    def test_versions_are_remembered_in_process(self):
+        self.assertEqual(caches["catalog"].__class__.__name__, "DatabaseCache")
+        self.client.get(reverse("product-list"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-list"))
+        self.assertEqual(len(response.data["results"]), 1)
@@ -0,0 +1,228 @@
+"""
+Time-decayed trending score.
+
+Every event (a paid order line, a review, a product view) adds a weight
+that halves every TRENDING_HALF_LIFE_HOURS. Rather than decaying every
+product's score as time passes, each weight is scaled *up* by how late it
+happened ("forward decay"):
+
+    score = sum(weight * exp(decay * (event_time - TRENDING_EPOCH)))
+
+Dividing every score by exp(decay * (now - epoch)) gives the decayed
+value and doesn't change the ordering, so ORDER BY score is always the
+current trending order and old scores never need rewriting. The column
+stores the natural log of the sum so it can't overflow; adding an event
+is one UPDATE doing log-add-exp in SQL.
+
+Views are too frequent for an UPDATE each, hot products would queue on
+their row lock. record_view() only increments a counter in the
+TRENDING_CACHE_ALIAS cache; the first view since the last flush also
+lists the product in a numbered slot. flush_views() applies the counted
+views of every listed product, one UPDATE per product. It runs on a
+background thread once TRENDING_VIEW_FLUSH_THRESHOLD products are
+pending or TRENDING_VIEW_FLUSH_SECONDS have passed, never in the
+request, or from the flush_trending_views command. Views are weighted
+at flush time, a minute or so late.
+
+The counters rely on atomic incr/decr, so the cache must be Redis,
+Memcached or local memory (each process then counts and flushes its own
+views); the database and file caches are rejected by a system check.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+from . import cache as catalog_cache
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+ORDER_WEIGHT = 5.0
+REVIEW_WEIGHT = 3.0
+VIEW_WEIGHT = 1.0
+
+VIEW_KEY = "trending:views:{pk}"
+SLOT_KEY = "trending:views:slot:{slot}"
+LAST_SLOT_KEY = "trending:views:last-slot"
+FLUSHED_SLOT_KEY = "trending:views:flushed-slot"
+FLUSH_LOCK_KEY = "trending:views:flush-lock"
+FLUSH_LOCK_TIMEOUT = 60
+
+
+def _decay():
+    half_life = getattr(settings, "TRENDING_HALF_LIFE_HOURS", 72) * 3600
+    return math.log(2) / half_life
+
+
+def _epoch():
+    return getattr(settings, "TRENDING_EPOCH", datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+
+
+def log_weight(weight, at=None):
+    at = at or timezone.now()
+    return math.log(weight) + _decay() * (at - _epoch()).total_seconds()
+
+
+def current_score(stored, at=None):
+    """
+    Convert a stored trending_score to the decayed score at ``at`` (default now)
+    """
+    at = at or timezone.now()
+    return math.exp(stored - _decay() * (at - _epoch()).total_seconds())
+
+
+def log_add(a, b):
+    high = max(a, b)
+    return high + math.log1p(math.exp(-abs(a - b)))
+
+
+def bump(product_id, weight, at=None):
+    """
+    Add an event of ``weight`` to a product's score in a single atomic UPDATE
+    """
+    value = Value(log_weight(weight, at), output_field=FloatField())
+    score = F("trending_score")
+    Product.objects.filter(pk=product_id).update(
+        trending_score=Greatest(score, value) + Ln(1 + Exp(-Abs(score - value)))
+    )
+
+
+def get_cache():
+    return caches[getattr(settings, "TRENDING_CACHE_ALIAS", "trending")]
+
+
+def _incr(cache, key, delta=1):
+    cache.add(key, 0, None)
+    return cache.incr(key, delta)
+
+
+def _list_pending(cache, product_id):
+    slot = _incr(cache, LAST_SLOT_KEY)
+    cache.set(SLOT_KEY.format(slot=slot), product_id, None)
+    return slot - (cache.get(FLUSHED_SLOT_KEY) or 0)
+
+
+_flush_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _flush_due(pending):
+    if pending >= getattr(settings, "TRENDING_VIEW_FLUSH_THRESHOLD", 100):
+        return True
+    return time.monotonic() - _last_flush >= getattr(settings, "TRENDING_VIEW_FLUSH_SECONDS", 60)
+
+
+def _flush_in_background():
+    global _last_flush
+    if _flush_lock.locked():
+        return
+    _last_flush = time.monotonic()
+
+    def run():
+        try:
+            with _flush_lock:
+                flush_views()
+        except Exception:
+            logger.exception("Flushing product views failed")
+        finally:
+            # worker threads get their own connections, don't leak them
+            connections.close_all()
+
+    threading.Thread(target=run, name="trending-views", daemon=True).start()
+
+
+def record_view(product_id):
+    """
+    Count a view of an existing product, applied to its score by flush_views()
+    """
+    product_id = int(product_id)
+    cache = get_cache()
+    try:
+        if _incr(cache, VIEW_KEY.format(pk=product_id)) == 1:
+            # first view since the last flush, list the product
+            pending = _list_pending(cache, product_id)
+        else:
+            pending = 0
+    except ValueError:
+        # the counter was evicted between add() and incr(), drop this view
+        return
+    if _flush_due(pending):
+        _flush_in_background()
+
+
+def flush_views():
+    """
+    Add the views counted since the last flush to the scores; returns the
+    number of products updated
+    """
+    cache = get_cache()
+    if not cache.add(FLUSH_LOCK_KEY, 1, FLUSH_LOCK_TIMEOUT):
+        # another flush is running and will pick these views up
+        return 0
+    try:
+        first = (cache.get(FLUSHED_SLOT_KEY) or 0) + 1
+        last = cache.get(LAST_SLOT_KEY) or 0
+        slot_keys = [SLOT_KEY.format(slot=slot) for slot in range(first, last + 1)]
+        product_ids = set(cache.get_many(slot_keys).values())
+        view_keys = {VIEW_KEY.format(pk=pk): pk for pk in product_ids}
+        counts = {view_keys[key]: count for key, count in cache.get_many(view_keys).items() if count}
+        with transaction.atomic():
+            for pk, count in counts.items():
+                bump(pk, VIEW_WEIGHT * count)
+        cache.set(FLUSHED_SLOT_KEY, last, None)
+        cache.delete_many(slot_keys)
+        for pk, count in counts.items():
+            try:
+                remaining = cache.decr(VIEW_KEY.format(pk=pk), count)
+            except ValueError:
+                # evicted since it was read, its next view starts over
+                continue
+            if remaining > 0:
+                # views counted while flushing stay for the next flush
+                _list_pending(cache, pk)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return len(counts)
+
+
+def record_review(product_id, at=None):
+    bump(product_id, REVIEW_WEIGHT, at)
+
+
+def record_sale(product_id, quantity, at=None):
+    bump(product_id, ORDER_WEIGHT * quantity, at)
+
+
+def rebuild_scores(batch_size=1000):
+    """
+    Recompute every score from order and review history (views are not stored)
+    """
+    from orders.models import OrderItem, SOLD_STATUSES
+    from .models import Review
+
+    scores = {}
+
+    def add(product_id, weight, at):
+        value = log_weight(weight, at)
+        scores[product_id] = log_add(scores[product_id], value) if product_id in scores else value
+
+    sold = OrderItem.objects.filter(order__status__in=SOLD_STATUSES, order__paid_at__isnull=False)
+    for product_id, quantity, paid_at in sold.values_list(
+            "product_id", "quantity", "order__paid_at").iterator(chunk_size=batch_size):
+        add(product_id, ORDER_WEIGHT * quantity, paid_at)
+    for product_id, created_at in Review.objects.values_list(
+            "product_id", "created_at").iterator(chunk_size=batch_size):
+        add(product_id, REVIEW_WEIGHT, created_at)
+
+    Product.objects.update(trending_score=0)
+    batch = [Product(pk=pk, trending_score=score) for pk, score in scores.items()]
+    Product.objects.bulk_update(batch, ["trending_score"], batch_size=batch_size)
+    # cached lists may be ordered by the rebuilt scores
+    transaction.on_commit(catalog_cache.bump_generation)
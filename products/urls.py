@@ -1,6 +1,7 @@
 from django.urls import path, include
 from .views import (ProductViewSet, CategoryViewSet, ProductImageViewSet,
-ReviewViewSet, BestSellersView, NewProductsView, TrendingProductsView)
+ReviewViewSet, BestSellersView, NewProductsView, TrendingProductsView,
+CatalogCacheStatsView, ProductFeedView, ImportJobViewSet)
 from rest_framework import routers
 from rest_framework_nested import routers as nested_routers
 
@@ -9,6 +10,7 @@ nested_router = nested_routers.DefaultRouter()
 
 nested_router.register(r'products', ProductViewSet, basename="product")
 router.register(r'categories', CategoryViewSet, basename="category")
+router.register(r'product-imports', ImportJobViewSet, basename="product-import")
 
 product_items_router = nested_routers.NestedDefaultRouter(nested_router, r'products', lookup='product')
 product_items_router.register(r'images', ProductImageViewSet, basename='product-images')
@@ -19,6 +21,8 @@ urlpatterns = [
     path('products/best-sellers/', BestSellersView.as_view(), name="best-sellers"),
     path('products/new/', NewProductsView.as_view(), name="new-products"),
     path('products/trending/', TrendingProductsView.as_view(), name="trending-products"),
+    path('products/cache-stats/', CatalogCacheStatsView.as_view(), name="catalog-cache-stats"),
+    path('products/feed/<str:feed_format>/', ProductFeedView.as_view(), name="product-feed"),
 ]
 
 urlpatterns += nested_router.urls
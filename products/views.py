@@ -1,85 +1,220 @@
-from django.shortcuts import render
-from django.db.models import Sum, Count, Avg
-from django.utils.timezone import now, timedelta
-from .models import Product, Category, ProductImage, Review
-from .serializers import ProductSerializer, CategorySerializer, ProductImageSerializer, ReviewSerializer
+import logging
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import (Product, Category, ProductImage, Review, RelatedProduct, AlsoBoughtProduct,
+                     ImportJob)
+from .serializers import (ProductSerializer, ProductListSerializer, CategorySerializer,
+                          ProductImageSerializer, ReviewSerializer, ImportJobSerializer)
+from .fieldsets import SparseFieldsetViewMixin, apply_fieldset
 from rest_framework import permissions, viewsets, views, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.decorators import permission_classes
-from .filters import ProductFilter
+from .filters import ProductFilter, ProductSearchFilter
+from .pagination import KeysetPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from . import cache as catalog_cache
+from . import conditional
+from . import facets
+from . import feeds
+from . import imports
+from . import suggest
+from . import trending
+from orders import leaderboard
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
-class ProductViewSet(viewsets.ModelViewSet):
+@method_decorator(condition(etag_func=conditional.product_list_etag), name='list')
+@method_decorator(condition(etag_func=conditional.product_etag,
+                            last_modified_func=conditional.product_last_modified), name='retrieve')
+class ProductViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     view for the Product Model
+    Lists use a compact representation; pass ?fields=a,b or ?expand=images
+    to choose the fields returned (see products.fieldsets).
+    ?facets=1 adds filter sidebar counts to the list (see products.facets)
     """
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Product.objects.all().order_by('-added_on').annotate(
-        avg_rating=Avg('reviews__rating')
-    )
-    ordering_fields = ['avg_rating', 'price', 'added_on']
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    queryset = Product.objects.with_related().order_by('-added_on')
+    ordering_fields = ['avg_rating', 'review_count', 'total_sold', 'effective_price', 'added_on']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['name', 'description']
+    pagination_class = KeysetPagination
+    # ordering and cursor values are read from every listed row
+    always_loaded_fields = ['added_on', 'avg_rating', 'review_count', 'total_sold', 'effective_price']
+    batch_max_ids = 100
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductListSerializer
+        return super().get_serializer_class()
+
+    @action(detail=False, methods=['get'],
+            authentication_classes=[JWTStatelessUserAuthentication])
+    def suggest(self, request):
+        """
+        Typeahead suggestions: GET /api/products/suggest/?q=sil&limit=8
+        Served from an in-memory prefix index; the token is verified without
+        loading the user so the lookup doesn't touch the database.
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', 8)), 20)
+        except ValueError:
+            limit = 8
+        return Response(suggest.suggest(request.query_params.get('q', ''), limit))
+
+    @action(detail=False, methods=['get', 'post'])
+    def batch(self, request):
+        """
+        Several products in the requested order:
+        GET /api/products/batch/?ids=3,1,2 or POST {"ids": [3, 1, 2]}
+        Shares the per-product cache entries of retrieve, so only products
+        missing from the cache are loaded (in one query). Unknown ids are
+        listed under "missing".
+        """
+        if request.method == 'POST':
+            ids = request.data.get('ids', [])
+        else:
+            ids = request.query_params.get('ids', '')
+        if isinstance(ids, str):
+            ids = [item for item in ids.split(',') if item.strip()]
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids))
+        except (TypeError, ValueError):
+            return Response({"error": "ids must be a list of product ids"}, status=400)
+        if len(ids) > self.batch_max_ids:
+            return Response({"error": f"at most {self.batch_max_ids} ids per request"}, status=400)
+
+        keys = catalog_cache.product_keys(ids)
+        found = catalog_cache.tiered_cache.get_many(keys.values())
+        uncached = [pk for pk in ids if keys[pk] not in found]
+        if uncached:
+            products = Product.objects.with_related().in_bulk(uncached)
+            # cached entries are shared with retrieve, ?fields= is applied afterwards
+            serializer = ProductSerializer(products.values(), many=True,
+                                           context={'request': request, 'full_representation': True})
+            fresh = {keys[item['id']]: item for item in serializer.data}
+            catalog_cache.tiered_cache.set_many(fresh)
+            found.update(fresh)
+        results = [found[keys[pk]] for pk in ids if keys[pk] in found]
+        return Response({
+            "results": apply_fieldset(ProductSerializer, request, results),
+            "missing": [pk for pk in ids if keys[pk] not in found],
+        })
 
     @action(detail=True, methods=['get'])
     def related(self, request, pk=None):
         product = self.get_object()
-        related = Product.objects.filter(
-            category=product.category
-        ).exclude(id=product.id).order_by('?')[:4]
+        entries = (RelatedProduct.objects.filter(product_id=product.pk)
+                   .select_related('related')
+                   .prefetch_related('related__images', 'related__category')[:4])
+        related = [entry.related for entry in entries]
+        if not related:
+            # not computed yet (new product or job hasn't run), fall back to
+            # the best sellers sharing a category
+            related = (Product.objects.with_related()
+                       .filter(category__in=product.category.all())
+                       .exclude(id=product.id).distinct()
+                       .order_by('-total_sold')[:4])
         serializer = ProductSerializer(related, many=True, context={'request': request})
         return Response(serializer.data)
     
-    @method_decorator(cache_page(60 * 60 * 24))
+    @action(detail=True, methods=['get'], url_path='also-bought')
+    def also_bought(self, request, pk=None):
+        """
+        Products most often bought together with this one,
+        precomputed by the build_also_bought command
+        """
+        product = self.get_object()
+        entries = (AlsoBoughtProduct.objects.filter(product_id=product.pk)
+                   .select_related('recommended')
+                   .prefetch_related('recommended__images', 'recommended__category')[:8])
+        products = [entry.recommended for entry in entries]
+        serializer = ProductSerializer(products, many=True, context={'request': request})
+        return Response(serializer.data)
+
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        data = catalog_cache.get_or_set(
+            catalog_cache.list_key(request),
+            lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data
+        )
+        if facets.requested(request):
+            data = {**data, "facets": facets.get_facets(self, request)}
+        return Response(data)
 
-    @method_decorator(cache_page(60 * 60 * 24))
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        if request.query_params.get('fields'):
+            # the cache holds the full representation shared with batch
+            response = super().retrieve(request, *args, **kwargs)
+        else:
+            response = Response(catalog_cache.get_or_set(
+                catalog_cache.product_key(kwargs[self.lookup_field]),
+                lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data
+            ))
+        # only reached once the product was found
+        trending.record_view(kwargs[self.lookup_field])
+        return response
 
 
 @permission_classes([permissions.IsAuthenticated])
 class BestSellersView(views.APIView):
+    """
+    Top 10 best sellers of sold (paid, shipped, delivered) orders.
+    Query params:
+    1. window: all (default), 7d or 30d
+    2. category: restrict the board to one category id
+    """
     def get(self, request):
-        products = Product.objects.annotate(
-            total_sold=Sum('order_items__quantity')
-        ).order_by('-total_sold')[:10]
-        serializer = ProductSerializer(products, many=True, context={'request': request})
+        window = request.query_params.get('window', 'all')
+        if window not in leaderboard.WINDOWS:
+            return Response({"error": f"window must be one of {', '.join(leaderboard.WINDOWS)}"}, status=400)
+        category = request.query_params.get('category')
+        if category and not category.isdigit():
+            return Response({"error": "category must be a category id"}, status=400)
+
+        product_ids = leaderboard.top_product_ids(window, category)
+        products = Product.objects.with_related().in_bulk(product_ids)
+        ranked = [products[pk] for pk in product_ids if pk in products]
+        serializer = ProductSerializer(ranked, many=True, context={'request': request})
         return Response(serializer.data)
     
 
 @permission_classes([permissions.IsAuthenticated])
 class NewProductsView(views.APIView):
     def get(self, request):
-        products = Product.objects.order_by('-added_on')[:10]
+        products = Product.objects.with_related().order_by('-added_on')[:10]
         serializer = ProductSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
 
 
 @permission_classes([permissions.IsAuthenticated])
 class TrendingProductsView(views.APIView):
+    """
+    Top 10 products by time-decayed activity (sales, reviews and views),
+    see products.trending
+    """
     def get(self, request):
-        last_30_days = now() - timedelta(days=30)
-        products = (
-            Product.objects.filter(added_on__gte=last_30_days)
-            .annotate(
-                total_sold=Sum('order_items__quantity'),
-                review_count=Count('reviews')
-            )
-            # Order by sales first, then by review count
-            .order_by('-total_sold', '-review_count')[:10]
-        )
+        products = Product.objects.with_related().order_by('-trending_score', '-id')[:10]
         serializer = ProductSerializer(products, many=True, context={'request': request})
         return Response(serializer.data)
 
 
+class CatalogCacheStatsView(views.APIView):
+    """
+    Hit/miss/regeneration counters of the catalog cache for this worker process
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(catalog_cache.tiered_cache.stats())
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     """
     view for the Category Model
@@ -102,6 +237,10 @@ class ProductImageViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     queryset = ProductImage.objects.all()
 
+    def perform_create(self, serializer):
+        # the product comes from the url, image_upload_path needs it before saving
+        serializer.save(product_id=self.kwargs['product_pk'])
+
 
 class ReviewViewSet(viewsets.ModelViewSet):
     """
@@ -124,8 +263,76 @@ class ReviewViewSet(viewsets.ModelViewSet):
     
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     queryset = Review.objects.all()
 
     def perform_create(self, serializer):
         serializer.save(customer=self.request.user)
 
+
+
+class ProductFeedView(views.APIView):
+    """
+    Full product feed for marketplaces, streamed as it is generated:
+    GET /api/products/feed/csv/ (or jsonl, xml)
+    ?since=2025-01-31 or an ISO datetime only exports products changed since then
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, feed_format):
+        if feed_format not in feeds.FEED_FORMATS:
+            return Response({"error": f"format must be one of {', '.join(feeds.FEED_FORMATS)}"}, status=404)
+        since = request.query_params.get('since')
+        try:
+            since = feeds.parse_since(since) if since else None
+        except ValueError:
+            return Response({"error": "since must be an ISO date or datetime"}, status=400)
+
+        site_url = getattr(settings, 'PRODUCT_FEED_SITE_URL', '') or request.build_absolute_uri('/')
+        response = StreamingHttpResponse(
+            feeds.generate_feed(feed_format, since, site_url),
+            content_type=feeds.FEED_FORMATS[feed_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{feed_format}"'
+        return response
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Bulk product imports (see products.imports), admin only.
+    POST a CSV or JSONL `file` to import it; to resume a failed import
+    POST the same file again with `job=<id>`. Large files are imported in
+    the background (202), GET the job to follow its progress.
+    """
+    queryset = ImportJob.objects.order_by('-created_at')
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def create(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "file is required"}, status=400)
+        if request.data.get('job'):
+            try:
+                job = imports.claim(request.data['job'])
+            except (ImportJob.DoesNotExist, ValueError):
+                return Response({"error": "import job not found"}, status=404)
+            except imports.ImportConflict as error:
+                return Response({"error": str(error)}, status=409)
+        else:
+            file_format = request.data.get('file_format') or imports.guess_format(upload.name)
+            if file_format not in imports.FILE_FORMATS:
+                return Response({"error": f"file_format must be one of {', '.join(imports.FILE_FORMATS)}"},
+                                status=400)
+            job = ImportJob.objects.create(source=upload.name, file_format=file_format,
+                                           created_by=request.user)
+        if imports.runs_in_background(upload.size):
+            imports.submit(job, upload.file)
+            return Response(self.get_serializer(job).data, status=202)
+        try:
+            imports.run_import(job, upload.file)
+        except Exception:
+            # the failure and the resume point are recorded on the job
+            logger.exception("Import job %s failed", job.pk)
+            return Response(self.get_serializer(job).data, status=500)
+        return Response(self.get_serializer(job).data, status=201)